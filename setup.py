@@ -33,6 +33,5 @@ setuptools.setup(
                       "dill",
                       "xfab",
                       "netcdf4",
-                      "h5py",
-                      "pandas"]
+                      "h5py"]
 )
@@ -0,0 +1,56 @@
+"""Timing benchmark of Polycrystal.diffract for a large two phase sample.
+
+A Delaunay tetrahedralisation of random points is used as mesh such that the benchmark does not depend on
+pygalmesh. Run as a script, the wall time of a single diffract call is printed.
+"""
+import time
+import numpy as np
+from scipy.spatial import Delaunay
+from scipy.spatial.transform import Rotation
+from xrd_simulator import templates
+from xrd_simulator.mesh import TetraMesh
+from xrd_simulator.phase import Phase
+from xrd_simulator.polycrystal import Polycrystal
+
+number_of_points = 18000
+sample_radius = 200.
+
+parameters = {
+    "detector_distance": 191023.9164,
+    "detector_center_pixel_z": 256.2345,
+    "detector_center_pixel_y": 255.1129,
+    "pixel_side_length_z": 181.4234,
+    "pixel_side_length_y": 180.2343,
+    "number_of_detector_pixels_z": 512,
+    "number_of_detector_pixels_y": 512,
+    "wavelength": 0.285227,
+    "beam_side_length_z": 512 * 200.,
+    "beam_side_length_y": 512 * 200.,
+    "rotation_step": np.radians(1.0),
+    "rotation_axis": np.array([0., 0., 1.0])
+}
+
+beam, detector, motion = templates.s3dxrd(parameters)
+
+np.random.seed(10)
+coord = (np.random.rand(number_of_points, 3) - 0.5) * 2 * sample_radius
+mesh = TetraMesh.generate_mesh_from_vertices(coord, Delaunay(coord).simplices)
+
+phases = [Phase([4.926, 4.926, 5.4189, 90., 90., 120.], 'P3221'),
+          Phase([3.64570000, 3.64570000, 3.64570000, 90.0, 90.0, 90.0], 'Fm-3m')]
+element_phase_map = np.random.randint(0, len(phases), size=(mesh.number_of_elements,))
+orientation = Rotation.random(mesh.number_of_elements, random_state=10).as_matrix()
+
+polycrystal = Polycrystal(mesh,
+                          orientation,
+                          strain=np.zeros((3, 3)),
+                          phases=phases,
+                          element_phase_map=element_phase_map)
+
+t1 = time.perf_counter()
+polycrystal.diffract(beam, detector, motion, max_bragg_angle=np.radians(6.0), BB_intersection=True)
+t2 = time.perf_counter()
+
+print('Number of elements: ', mesh.number_of_elements)
+print('Number of scattering units: ', len(detector.frames[0]))
+print('Diffraction wall time (s): ', t2 - t1)
@@ -3,6 +3,7 @@ import numpy as np
 from xrd_simulator.beam import Beam
 from scipy.spatial import ConvexHull
 from xrd_simulator.motion import RigidBodyMotion
+from xrd_simulator.mesh import _SphereTree
 
 class TestBeam(unittest.TestCase):
 
@@ -76,6 +77,28 @@ class TestBeam(unittest.TestCase):
         ch = self.beam.intersect(vertices)
         self.assertTrue(ch is None)
 
+    def test__intersect_tetrahedra(self):
+        np.random.seed(3)
+        tetrahedra = np.random.rand(50, 1, 3) * 10 - 5 + np.random.normal(0, 2, (50, 4, 3))
+        volumes, vertices, vertex_offsets = self.beam._intersect_tetrahedra(tetrahedra)
+        for i, tetrahedron in enumerate(tetrahedra):
+            region = self.beam.intersect(tetrahedron)
+            if region is None:
+                self.assertEqual(volumes[i], 0)
+            else:
+                self.assertAlmostEqual(region.volume, volumes[i], places=3)
+                self.assertTrue(np.allclose(
+                    np.mean(region.points[region.vertices], axis=0),
+                    np.mean(vertices[vertex_offsets[i]:vertex_offsets[i + 1]], axis=0),
+                    atol=1e-4))
+
+        contained = np.array([[[0, 0.1, 0.1], [1, 0.1, 0.1], [0, 0.9, 0.1], [0, 0.1, 0.9]]])
+        volumes, vertices, vertex_offsets = self.beam._intersect_tetrahedra(contained)
+        self.assertAlmostEqual(volumes[0], ConvexHull(contained[0]).volume)
+        self.assertTrue(np.allclose(vertices, contained[0]))
+        volumes, vertices, vertex_offsets = self.beam._intersect_tetrahedra(contained, volumes=np.array([7.0]))
+        self.assertEqual(volumes[0], 7.0)
+
     def test__find_feasible_point(self):
         # Corner case when the presolver will find edge interior points that are not clearly inside the 
         # intersection hull.
@@ -125,8 +148,9 @@ class TestBeam(unittest.TestCase):
         sphere_centres = np.array([[400.0, 0.0, 0.0], [200.0, 0.0, 0.0]])
         sphere_radius = np.array([[2.0], [0.5]])
 
-        intervals = self.beam._get_proximity_intervals(
+        sphere_index, start_times, end_times = self.beam._get_proximity_intervals(
             sphere_centres, sphere_radius, motion)
+        intervals = [np.array([start_times, end_times]).T[sphere_index == i] for i in range(2)]
 
         self.assertEqual(len(intervals[0]), 2,
                          msg="Wrong number of proximity intervals")
@@ -156,7 +180,9 @@ class TestBeam(unittest.TestCase):
         # Now with rotation and translation
         motion.translation = np.array([-87.24, 34.6, 123.34])
 
-        intervals = self.beam._get_proximity_intervals(sphere_centres, sphere_radius, motion)
+        sphere_index, start_times, end_times = self.beam._get_proximity_intervals(
+            sphere_centres, sphere_radius, motion)
+        intervals = [np.array([start_times, end_times]).T[sphere_index == i] for i in range(2)]
 
         self.assertEqual(len(intervals[0]), 1,
                          msg="Wrong number of proximity intervals")
@@ -179,6 +205,32 @@ class TestBeam(unittest.TestCase):
                     fraction_before_beam_leaves_sphere) < tol,
                 msg="Proximity interval wrong")
 
+        # Spheres far from the beam have no intervals.
+        sphere_index, _, _ = self.beam._get_proximity_intervals(
+            np.array([[400.0, 0.0, 0.0], [0.0, 0.0, 500.0]]), np.array([2.0, 0.5]), motion)
+        self.assertTrue(np.array_equal(sphere_index, [0]))
+
+    def test__get_analytic_proximity_intervals(self):
+        sphere_centres = (np.random.rand(200, 3) - 0.5) * 4
+        sphere_radius = np.random.rand(200,) * 0.3
+        motion = RigidBodyMotion(np.array([0.6, 0., 0.8]), 2.5, np.zeros((3,)), origin=np.array([0.1, 0.2, 0.]))
+
+        times = np.linspace(0, 1, 2001)
+        sphere_index, start_times, end_times = self.beam._get_proximity_intervals(
+            sphere_centres, sphere_radius, motion)
+        self.assertGreater(len(sphere_index), 0)
+        self.assertTrue(np.all(start_times <= end_times))
+        for i in range(0, 200, 7):
+            centres = np.array([motion(sphere_centres[i], t) for t in times])
+            distances = centres.dot(self.beam.halfspaces[:, 0:3].T) + self.beam.halfspaces[:, 3]
+            candidate = ~np.any(distances > sphere_radius[i], axis=1)
+            within = np.zeros(times.shape, dtype=bool)
+            for start, end in zip(start_times[sphere_index == i], end_times[sphere_index == i]):
+                within |= (times >= start - 1e-9) & (times <= end + 1e-9)
+            # Sampled times may fall on either side of the exact interval bounds.
+            mismatch = np.where(candidate != within)[0]
+            for j in mismatch:
+                self.assertLess(np.min(np.abs(np.concatenate((start_times, end_times)) - times[j])), 1e-3)
 
     def test_set_beam_vertices(self):
         new_vertices = np.array([[-5., 0., 0.],
@@ -204,6 +256,31 @@ class TestBeam(unittest.TestCase):
         self.assertTrue( np.allclose(mask[9], False) )
 
 
+    def test__get_candidate_elements(self):
+        rotation_angle = 10 * np.pi / 180.
+        rotation_axis = np.array([0, 0, 1])
+        motion = RigidBodyMotion(rotation_axis, rotation_angle, np.array([0, 0, 0]))
+        sample_centres = (np.random.rand(500, 3) - 0.5) * 20
+        sphere_radius = np.random.rand(500,) * 0.2 + 0.05
+
+        # The sample frame is moved to the lab frame by a rotation about x and a translation.
+        c, s = np.cos(0.3), np.sin(0.3)
+        rotation = np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+        translation = np.array([0.5, -0.2, 0.1])
+        lab_centres = sample_centres.dot(rotation.T) + translation
+
+        sample_times = self.beam._get_proximity_sample_times(sphere_radius, motion)
+        mask = self.beam._get_candidate_elements(
+            _SphereTree(sample_centres, sphere_radius), motion, sample_times, rotation, translation)
+        expected = np.zeros((500,), dtype=bool)
+        for time in sample_times:
+            centres = motion(lab_centres, time)
+            distances = centres.dot(self.beam.halfspaces[:, 0:3].T) + self.beam.halfspaces[:, 3]
+            expected |= ~np.any(distances > sphere_radius[:, np.newaxis], axis=1)
+        self.assertGreater(np.sum(expected), 0)
+        self.assertLess(np.sum(expected), 500)
+        self.assertTrue(np.array_equal(mask, expected))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,8 +2,9 @@ import unittest
 import numpy as np
 from xrd_simulator.detector import Detector
 from xrd_simulator.phase import Phase
-from xrd_simulator.scattering_unit import ScatteringUnit
+from xrd_simulator.scattering_unit import ScatteringUnit, ScatteringUnitTable
 from scipy.spatial import ConvexHull
+from scipy.signal import convolve2d
 import os
 
 
@@ -153,6 +154,109 @@ class TestDetector(unittest.TestCase):
                         msg="detector rendering did not use structure_factor factor")
 
 
+    def test_render_centroids(self):
+        number_of_units = 500
+        wavelength = 1.0
+        incident_wave_vector = 2 * np.pi * np.array([1, 0, 0]) / wavelength
+        scattered_wave_vector = np.random.normal(size=(number_of_units, 3)) + np.array([3, 0, 0])
+        scattered_wave_vector *= 2 * np.pi / (wavelength * np.linalg.norm(scattered_wave_vector, axis=1, keepdims=True))
+        scattered_wave_vector[0] = incident_wave_vector  # infinite Lorentz factor
+        zd = (np.random.rand(number_of_units) * 1.2 - 0.1) * self.detector_size
+        yd = (np.random.rand(number_of_units) * 1.2 - 0.1) * self.detector_size
+        zd[:50], yd[:50] = zd[:5].repeat(10), yd[:5].repeat(10)  # several scattering units per pixel
+        table = ScatteringUnitTable(
+            np.arange(number_of_units),
+            np.zeros((number_of_units,)),
+            np.zeros((number_of_units,)),
+            np.zeros((number_of_units,)),
+            scattered_wave_vector,
+            zd,
+            yd,
+            np.random.rand(number_of_units),
+            np.zeros((number_of_units, 3)),
+            np.arange(number_of_units + 1),
+            incident_wave_vector,
+            wavelength,
+            np.array([0, 1, 0]),
+            np.array([0, 0, 1]),
+            [Phase([3.6457, 3.6457, 3.6457, 90.0, 90.0, 90.0], 'Fm-3m')],
+        )
+
+        # The batched renderer agrees with rendering the scattering units one at a time.
+        for lorentz in (False, True):
+            expected = np.zeros(self.detector.pixel_coordinates.shape[:2])
+            for scattering_unit in table:
+                self.detector._centroid_render(scattering_unit, expected, lorentz, True, False)
+            frame = np.zeros(self.detector.pixel_coordinates.shape[:2])
+            self.detector._render_centroids(table, frame, lorentz, True, False)
+            self.assertTrue(np.array_equal(np.isinf(frame), np.isinf(expected)))
+            self.assertTrue(np.allclose(frame[~np.isinf(frame)], expected[~np.isinf(expected)]))
+            self.assertEqual(np.sum(np.isinf(frame)), int(lorentz))
+
+    def test_render_centroids_with_scintillator(self):
+        number_of_units = 300
+        wavelength = 1.0
+        incident_wave_vector = 2 * np.pi * np.array([1, 0, 0]) / wavelength
+        scattered_wave_vector = np.random.normal(size=(number_of_units, 3)) + np.array([3, 0, 0])
+        scattered_wave_vector *= 2 * np.pi / (wavelength * np.linalg.norm(scattered_wave_vector, axis=1, keepdims=True))
+        scattered_wave_vector[0] = incident_wave_vector  # infinite Lorentz factor
+        zd = (np.random.rand(number_of_units) * 1.2 - 0.1) * self.detector_size
+        yd = (np.random.rand(number_of_units) * 1.2 - 0.1) * self.detector_size
+        zd[1:5], yd[1:5] = [0.2, 0.5, self.detector_size - 0.5, self.detector_size], [0.3, 0.7, 0.7, 0.1]  # near the edges
+        table = ScatteringUnitTable(
+            np.arange(number_of_units),
+            np.zeros((number_of_units,)),
+            np.zeros((number_of_units,)),
+            np.zeros((number_of_units,)),
+            scattered_wave_vector,
+            zd,
+            yd,
+            np.random.rand(number_of_units),
+            np.zeros((number_of_units, 3)),
+            np.arange(number_of_units + 1),
+            incident_wave_vector,
+            wavelength,
+            np.array([0, 1, 0]),
+            np.array([0, 0, 1]),
+            [Phase([3.6457, 3.6457, 3.6457, 90.0, 90.0, 90.0], 'Fm-3m')],
+        )
+        inside = self.detector.contains(zd, yd)
+
+        # With fine sub pixel bins the batched renderer agrees with rendering the scattering units one at a time.
+        self.detector.point_spread_subpixel_bins = 256
+        for lorentz in (False, True):
+            expected = np.zeros(self.detector.pixel_coordinates.shape[:2])
+            for scattering_unit in table:
+                self.detector._centroid_render_with_scintillator(scattering_unit, expected, lorentz, True, False)
+            frame = np.zeros(self.detector.pixel_coordinates.shape[:2])
+            self.detector._render_centroids_with_scintillator(table, frame, lorentz, True, False)
+            self.assertTrue(np.array_equal(np.isinf(frame), np.isinf(expected)))
+            finite = ~np.isinf(frame)
+            self.assertTrue(np.allclose(frame[finite], expected[finite], rtol=1e-2, atol=1e-2 * np.max(expected[finite])))
+            self.assertEqual(np.any(np.isinf(frame)), lorentz)
+            if not lorentz:
+                intensity_factors = self.detector._get_intensity_factors(table, lorentz, True, False)
+                self.assertAlmostEqual(np.sum(frame), np.sum((table.volume * intensity_factors)[inside]))
+
+        # Kernel shapes with even sides use the same window as the per unit renderer, bypassing the setter check.
+        kernel_shape = self.detector.point_spread_kernel_shape
+        self.detector._point_spread_kernel_shape = (4, 6)
+        expected = np.zeros(self.detector.pixel_coordinates.shape[:2])
+        for scattering_unit in table:
+            self.detector._centroid_render_with_scintillator(scattering_unit, expected, False, True, False)
+        frame = np.zeros(self.detector.pixel_coordinates.shape[:2])
+        self.detector._render_centroids_with_scintillator(table, frame, False, True, False)
+        self.assertTrue(np.allclose(frame, expected, rtol=1e-2, atol=1e-2 * np.max(expected)))
+        self.detector._point_spread_kernel_shape = kernel_shape
+
+        # The kernel bank follows changes to the point spread function.
+        self.detector.point_spread_subpixel_bins = 4
+        bank = self.detector._get_point_spread_kernel_bank()
+        a, b = self.detector.point_spread_kernel_shape
+        self.assertEqual(bank.shape, (4, 4, 2 * (a // 2) + 3, 2 * (b // 2) + 3))
+        self.detector.point_spread_function = lambda z, y: np.exp(-(z * z + y * y))
+        self.assertFalse(np.allclose(self.detector._get_point_spread_kernel_bank(), bank))
+
     def test_centroid_render_with_scintillator(self):
         v = self.detector.ydhat + self.detector.zdhat
         v = v / np.linalg.norm(v)
@@ -350,6 +454,49 @@ class TestDetector(unittest.TestCase):
         self.detector.point_spread_kernel_shape = (5,5)
 
 
+    def test_render_projections(self):
+        number_of_units = 40
+        wavelength = 1.0
+        incident_wave_vector = 2 * np.pi * np.array([1, 0, 0]) / wavelength
+        phase = Phase([3.6457, 3.6457, 3.6457, 90.0, 90.0, 90.0], 'Fm-3m')
+        scattering_units = []
+        for i in range(number_of_units):
+            scattered_wave_vector = np.array([3, 0, 0]) + np.random.normal(size=(3,)) * 0.2
+            scattered_wave_vector *= 2 * np.pi / (wavelength * np.linalg.norm(scattered_wave_vector))
+            size = 1.0 if i == 1 else 200 + 400 * np.random.rand()  # a small unit missing all pixel centroids
+            centre = np.array([0, 1, 1]) * (np.random.rand(3) * 1.2 - 0.1) * self.detector_size
+            if i == 2:
+                centre = np.array([0, 0, 0.5]) * self.detector_size  # across the detector edge
+            hull = ConvexHull(centre + (np.random.rand(12, 3) - 0.5) * size)
+            zd, yd = self.detector.get_intersection(scattered_wave_vector, hull.points.mean(axis=0)[np.newaxis, :])[0]
+            scattering_units.append(ScatteringUnit(hull,
+                                                   scattered_wave_vector=scattered_wave_vector,
+                                                   incident_wave_vector=incident_wave_vector,
+                                                   wavelength=wavelength,
+                                                   incident_polarization_vector=np.array([0, 1, 0]),
+                                                   rotation_axis=np.array([0, 0, 1]),
+                                                   time=0,
+                                                   phase=phase,
+                                                   hkl_indx=0,
+                                                   element_index=i,
+                                                   zd=zd,
+                                                   yd=yd))
+        scattering_units[0].scattered_wave_vector = incident_wave_vector  # infinite Lorentz factor
+        scattering_units[0]._convex_hull = ConvexHull(scattering_units[3].convex_hull.points + 50.)
+
+        # The batched renderer agrees with rendering the scattering units one at a time.
+        for lorentz in (False, True):
+            expected = np.zeros(self.detector.pixel_coordinates.shape[:2])
+            for scattering_unit in scattering_units:
+                self.detector._projection_render(scattering_unit, expected, lorentz, True, False)
+            frame = np.zeros(self.detector.pixel_coordinates.shape[:2])
+            self.detector._render_projections(scattering_units, frame, lorentz, True, False)
+            self.assertTrue(np.array_equal(np.isinf(frame), np.isinf(expected)))
+            self.assertEqual(np.any(np.isinf(frame)), lorentz)
+            finite = ~np.isinf(frame)
+            self.assertTrue(np.allclose(frame[finite], expected[finite]))
+            self.assertGreater(np.sum(frame[finite]), 0)
+
     def test_projection_render(self):
 
         # Convex hull of a sphere placed at the centre of the detector
@@ -421,6 +568,7 @@ class TestDetector(unittest.TestCase):
             verbose=False)
 
         self.assertTrue(np.allclose(diffraction_pattern,diffraction_pattern_parallel),msg='parallel rendering is broken')
+        self.assertGreater(len(self.detector.busy_times), 0)
 
 
         projected_summed_intensity = np.sum(diffraction_pattern)
@@ -534,6 +682,38 @@ class TestDetector(unittest.TestCase):
             expected_angle,
             msg="detector off centered wrapping cone has opening angle")
 
+    def test_apply_point_spread_function(self):
+        frame = np.zeros(self.detector.pixel_coordinates.shape[:2])
+        index = np.random.randint(0, frame.size, size=(60,))
+        frame.flat[index] = np.random.rand(len(index))
+        frame[0, 1], frame[-1, -1], frame[100, 100] = 1.0, 2.0, np.inf  # units at the frame edges
+        self.detector.point_spread_kernel_shape = (5, 7)
+        separable_kernel = self.detector._get_point_spread_function_kernel()
+        skewed_kernel = separable_kernel + np.random.rand(5, 7) * 0.1
+        skewed_kernel /= np.sum(skewed_kernel)
+
+        # All convolution methods, with and without tiling, preserve the inf pixels and agree with direct convolution.
+        for kernel, methods in ((separable_kernel, ("auto", "direct", "separable", "fft")),
+                                (skewed_kernel, ("auto", "direct", "fft"))):
+            finite_frame = np.where(np.isinf(frame), 0, frame)
+            expected = convolve2d(finite_frame, kernel, mode="same")
+            expected[np.isinf(frame)] = np.inf
+            for method in methods:
+                for tile_size in (None, 16, 1000):
+                    self.detector.point_spread_convolution_method = method
+                    self.detector.point_spread_tile_size = tile_size
+                    convolved = self.detector._apply_point_spread_function(frame.copy(), kernel)
+                    self.assertTrue(np.array_equal(np.isinf(convolved), np.isinf(expected)))
+                    finite = ~np.isinf(expected)
+                    self.assertTrue(np.allclose(convolved[finite], expected[finite], atol=1e-12))
+
+        self.detector.point_spread_convolution_method = "separable"
+        with self.assertRaises(ValueError):
+            self.detector._apply_point_spread_function(frame.copy(), skewed_kernel)
+        self.detector.point_spread_convolution_method = "spline"
+        with self.assertRaises(ValueError):
+            self.detector._apply_point_spread_function(frame.copy(), separable_kernel)
+
     def test_point_spread_kernel_shape(self):
         bad_kernel_shape = (6, 3)
         try:
@@ -584,6 +764,21 @@ class TestDetector(unittest.TestCase):
                                 msg='Data corrupted on save and load')
         os.remove(path+'.det')
 
+    def test_load_legacy_state(self):
+        # Detectors pickled by earlier versions lack the point spread kernel bank and its sub pixel resolution, and the
+        # point spread convolution options.
+        state = dict(self.detector.__dict__)
+        del state["point_spread_subpixel_bins"], state["_point_spread_kernel_bank"]
+        del state["point_spread_convolution_method"], state["point_spread_tile_size"]
+        detector = Detector.__new__(Detector)
+        detector.__setstate__(state)
+        self.assertEqual(detector._get_point_spread_kernel_bank().shape[:2], (16, 16))
+
+        frame = np.zeros(detector.pixel_coordinates.shape[:2])
+        frame[10, 10] = 1.0
+        kernel = detector._get_point_spread_function_kernel()
+        self.assertAlmostEqual(np.sum(detector._apply_point_spread_function(frame, kernel)), 1.0)
+
 
 
     def test_eta0_render(self):
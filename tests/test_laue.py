@@ -90,6 +90,87 @@ class TestLaue(unittest.TestCase):
                 self.assertAlmostEqual(equation.item(), 0, msg="Parametric solution wrong")
 
 
+    def test_find_rotation_angles(self):
+        U, B, cell, strain = self.get_pseudorandom_crystal()
+        wavelength = cell[0] / 18.
+        k = np.array([1.0, 0, 0]) * 2 * np.pi / wavelength
+        rotation_axis = np.array([0, 0, 1.0])
+        miller_indices = np.array([[h, k_, l_] for h in range(-2, 3) for k_ in range(-2, 3) for l_ in range(-2, 3)
+                                   if (h, k_, l_) != (0, 0, 0)], dtype=float)
+        G_0 = laue.get_G(U[np.newaxis], B[np.newaxis], miller_indices)
+
+        rx, ry, rz = rotation_axis
+        K = np.array([[0, -rz, ry],
+                      [rz, 0, -rx],
+                      [-ry, rx, 0]])
+        rho_0_factor = -k.dot(K.dot(K))
+        rho_1_factor = k.dot(K)
+        rho_2_factor = k.dot(np.eye(3, 3) + K.dot(K))
+
+        omega_range = (-np.pi / 3., 5 * np.pi / 3.)
+        reflection_index, omega = laue.find_rotation_angles(
+            G_0, rho_0_factor, rho_1_factor, rho_2_factor, omega_range)
+        self.assertGreater(len(omega), 0)
+        self.assertTrue(np.all(omega >= omega_range[0]))
+        self.assertTrue(np.all(omega < omega_range[1]))
+
+        # The rotated diffraction vectors fulfill the Laue equations, |k + G| = |k|.
+        for (i, j), w in zip(reflection_index.T, omega):
+            R = np.eye(3) + np.sin(w) * K + (1 - np.cos(w)) * K.dot(K)
+            G = R.dot(G_0[i, :, j])
+            self.assertAlmostEqual(np.linalg.norm(k + G) / np.linalg.norm(k), 1, places=6)
+
+        # Solutions within a rotation smaller than pi agree with the time parametric solver.
+        reflection_index, omega = laue.find_rotation_angles(
+            G_0, rho_0_factor, rho_1_factor, rho_2_factor, (0, np.pi / 2.))
+        _, time_values = laue.find_solutions_to_tangens_half_angle_equation(
+            G_0, rho_0_factor, rho_1_factor, rho_2_factor, np.pi / 2.)
+        self.assertTrue(np.allclose(np.sort(omega), np.sort(time_values * np.pi / 2.), atol=1e-4))
+
+    def test_find_reflections(self):
+        U_0, B_0, cell, strain = self.get_pseudorandom_crystal()
+        U_1, _, _, _ = self.get_pseudorandom_crystal()
+        U, B = np.array([U_0, U_1]), np.array([B_0, B_0])
+        wavelength = cell[0] / 18.
+        k = np.array([1.0, 0, 0]) * 2 * np.pi / wavelength
+        rotation_axis = np.array([0, 0, 1.0])
+        miller_indices = np.array([[h, k_, l_] for h in range(-2, 3) for k_ in range(-2, 3) for l_ in range(-2, 3)
+                                   if (h, k_, l_) != (0, 0, 0)], dtype=float)
+        G_0 = laue.get_G(U, B, miller_indices)
+
+        rx, ry, rz = rotation_axis
+        K = np.array([[0, -rz, ry],
+                      [rz, 0, -rx],
+                      [-ry, rx, 0]])
+        rho_0_factor = -k.dot(K.dot(K))
+        rho_1_factor = k.dot(K)
+        rho_2_factor = k.dot(np.eye(3, 3) + K.dot(K))
+
+        # Time parametric solutions agree with the vectorized solver.
+        rotation_angle = np.pi / 2.
+        crystal_indices, hkl_indices, time_values, G = laue.find_reflections(
+            U, B, miller_indices, rho_0_factor, rho_1_factor, rho_2_factor, delta_omega=rotation_angle)
+        reflection_index, expected_time_values = laue.find_solutions_to_tangens_half_angle_equation(
+            G_0, rho_0_factor, rho_1_factor, rho_2_factor, rotation_angle)
+        self.assertGreater(len(time_values), 0)
+        self.assertEqual(len(time_values), len(expected_time_values))
+        self.assertTrue(np.all(time_values >= 0) and np.all(time_values <= 1))
+        self.assertTrue(np.allclose(np.sort(time_values), np.sort(expected_time_values), atol=1e-4))
+        self.assertTrue(np.allclose(G, G_0[crystal_indices, :, hkl_indices]))
+
+        # Rotation angle solutions fulfill the Laue equations, |k + G| = |k|, over a full turn.
+        omega_range = (-np.pi / 3., 5 * np.pi / 3.)
+        crystal_indices, hkl_indices, omega, G = laue.find_reflections(
+            U, B, miller_indices, rho_0_factor, rho_1_factor, rho_2_factor, omega_range=omega_range)
+        reflection_index, expected_omega = laue.find_rotation_angles(
+            G_0, rho_0_factor, rho_1_factor, rho_2_factor, omega_range)
+        self.assertEqual(len(omega), len(expected_omega))
+        self.assertTrue(np.all(omega >= omega_range[0]))
+        self.assertTrue(np.all(omega < omega_range[1]))
+        for g, w in zip(G, omega):
+            R = np.eye(3) + np.sin(w) * K + (1 - np.cos(w)) * K.dot(K)
+            self.assertAlmostEqual(np.linalg.norm(k + R.dot(g)) / np.linalg.norm(k), 1, places=8)
+
     def get_pseudorandom_crystal(self):
         phi1, PHI, phi2 = np.random.rand(3,) * 2 * np.pi
         U = tools.euler_to_u(phi1, PHI, phi2)
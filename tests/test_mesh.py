@@ -1,6 +1,6 @@
 import unittest
 import numpy as np
-from xrd_simulator.mesh import TetraMesh
+from xrd_simulator.mesh import TetraMesh, _SphereTree
 from xrd_simulator.motion import RigidBodyMotion
 import os
 import copy
@@ -99,6 +99,25 @@ class TestBeam(unittest.TestCase):
 
         self.assertAlmostEqual(mesh.eradius[0], eradius_rotated[0])
 
+    def test_sphere_tree(self):
+        np.random.seed(10)
+        centres = np.random.rand(5000, 3) * 100
+        radius = np.random.rand(5000,) + 0.5
+        tree = _SphereTree(centres, radius)
+        for _ in range(5):
+            # A random slab, or box, of halfspaces.
+            normals = np.random.rand(3, 3) - 0.5
+            normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+            normals = np.concatenate((normals, -normals))
+            point = np.random.rand(3,) * 100
+            halfspaces = np.concatenate((normals, -normals.dot(point)[:, np.newaxis] - 10), axis=1)
+            expected = np.where(~np.any(centres.dot(normals.T) + halfspaces[:, 3] > radius[:, np.newaxis], axis=1))[0]
+            self.assertGreater(len(expected), 0)
+            self.assertTrue(np.array_equal(np.sort(tree.query(halfspaces)), expected))
+
+        self.assertEqual(len(_SphereTree(np.zeros((0, 3)), np.zeros((0,))).query(halfspaces)), 0)
+        self.assertTrue(np.array_equal(_SphereTree(centres[0:1], radius[0:1]).query(halfspaces[0:0]), [0]))
+
     def test_update(self):
         rotation_axis = np.array([0, 0, 1.0])
         rotation_angle = np.pi / 4.37
@@ -0,0 +1,91 @@
+import unittest
+import os
+import time
+import numba
+import numpy as np
+from xrd_simulator import parallel
+from xrd_simulator.parallel import WorkerPool
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _get_number_of_threads(_):
+    return numba.get_num_threads()
+
+
+def _sum_shared_array(name):
+    arrays, context = parallel._get_worker_state()
+    return np.sum(arrays[name]) * context["scale"]
+
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(10)
+
+    def test_shared_arrays(self):
+        arrays = {"a": np.random.rand(10, 3), "b": np.arange(7), "c": np.zeros((0, 4))}
+        with parallel._SharedArrays(arrays) as shared_arrays:
+            attached, handles = parallel._attach_shared_arrays(shared_arrays.specs)
+            for name in arrays:
+                self.assertEqual(attached[name].dtype, arrays[name].dtype)
+                self.assertTrue(np.array_equal(attached[name], arrays[name]))
+            attached["a"][0, 0] = -1.0
+            self.assertNotEqual(arrays["a"][0, 0], -1.0)
+            del attached
+            for shm in handles:
+                shm.close()
+
+    def test_worker_pool(self):
+        sample = object()
+        arrays = {"a": np.random.rand(100), "b": np.ones((4, 4))}
+        with WorkerPool(number_of_processes=2) as worker_pool:
+            worker_pool._set_sample(sample, 0, lambda: arrays)
+            sums = worker_pool._map(_sum_shared_array, ["a", "b", "a"], {"scale": 2.0})
+            self.assertAlmostEqual(sums[0], 2 * np.sum(arrays["a"]))
+            self.assertAlmostEqual(sums[1], 32.0)
+            self.assertAlmostEqual(sums[2], sums[0])
+
+            # The sample stays resident until its version changes.
+            token = worker_pool._sample_token
+            worker_pool._set_sample(sample, 0, lambda: {})
+            self.assertIs(worker_pool._sample_token, token)
+            sums = worker_pool._map(_sum_shared_array, ["b"], {"scale": 1.0})
+            self.assertAlmostEqual(sums[0], 16.0)
+
+            # Rows updated within a version are written into the resident arrays in place.
+            updates = (np.array([1, 2]), {"b": 2 * np.ones((2, 4))})
+            worker_pool._set_sample(sample, 0, lambda: {}, 1, lambda revision: updates)
+            self.assertIs(worker_pool._sample_token, token)
+            sums = worker_pool._map(_sum_shared_array, ["b"], {"scale": 1.0})
+            self.assertAlmostEqual(sums[0], 24.0)
+
+            worker_pool._set_sample(sample, 1, lambda: {"b": np.zeros((4,))})
+            self.assertIsNot(worker_pool._sample_token, token)
+            sums = worker_pool._map(_sum_shared_array, ["b", "b"], {"scale": 1.0})
+            self.assertEqual(sums, [0.0, 0.0])
+
+    def test_worker_pool_threads(self):
+        # The workers share the cores of the machine rather than each starting a thread per core.
+        number_of_threads = min(max(1, os.cpu_count() // 2), numba.config.NUMBA_NUM_THREADS)
+        with WorkerPool(number_of_processes=2) as worker_pool:
+            threads = worker_pool._map(_get_number_of_threads, [None] * 4, {})
+        self.assertEqual(threads, [number_of_threads] * 4)
+
+    def test_worker_pool_busy_times(self):
+        tasks = [0.2, 0.05, 0.05, 0.05, 0.05]
+        with WorkerPool(number_of_processes=2) as worker_pool:
+            results = worker_pool._map(_sleep, tasks, {})
+            busy_times = worker_pool.busy_times
+        self.assertEqual(results, tasks)
+        self.assertLessEqual(len(busy_times), 2)
+        self.assertGreaterEqual(sum(busy_times.values()), sum(tasks))
+        # The long task is handed out first and the short ones are picked up by the other worker meanwhile.
+        self.assertLess(max(busy_times.values()), sum(tasks) - 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 
 import os
+import tempfile
 import unittest
 import numpy as np
+from xfab import tools, structure
 from xrd_simulator.phase import Phase
+from xrd_simulator import utils
 
 
 class TestPhase(unittest.TestCase):
@@ -72,6 +75,85 @@ class TestPhase(unittest.TestCase):
         for i in range(ph.structure_factors.shape[0]):
             self.assertGreaterEqual(ph.structure_factors[i, 0], 0)
 
+    def test_get_structure_factors(self):
+        data = os.path.join(os.path.dirname(__file__), 'data', 'quartz.cif')
+        unit_cell = [4.926, 4.926, 5.4189, 90., 90., 120.]
+        sgname = 'P3221'
+        ph = Phase(unit_cell, sgname, path_to_cif_file=data)
+        ph.setup_diffracting_planes(1.0, 1 * np.pi / 180, 15 * np.pi / 180)
+
+        atom_factory = structure.build_atomlist()
+        atom_factory.CIFread(ciffile=None, cifblkname=None, cifblk=utils._cif_open(data))
+        atoms = atom_factory.atomlist.atom
+        for hkl, structure_factor in zip(ph.miller_indices, ph.structure_factors):
+            expected = structure.StructureFactor(hkl, unit_cell, sgname, atoms, disper=None)
+            self.assertTrue(np.allclose(structure_factor, expected[0:2]))
+
+    def test_diffracting_planes_cache(self):
+        data = os.path.join(os.path.dirname(__file__), 'data', 'Fe_mp-150_conventional_standard.cif')
+        unit_cell = [3.64570000, 3.64570000, 3.64570000, 90.0, 90.0, 90.0]
+        sgname = 'Fm-3m'
+        wavelength = 0.5
+        ph = Phase(unit_cell, sgname, path_to_cif_file=data)
+
+        ph.setup_diffracting_planes(wavelength, 0, 20 * np.pi / 180)
+        miller_indices, structure_factors = ph.miller_indices, ph.structure_factors
+        ph.setup_diffracting_planes(wavelength, 0, 20 * np.pi / 180)
+        self.assertTrue(ph.miller_indices is miller_indices)
+        self.assertTrue(ph.structure_factors is structure_factors)
+
+        # A Bragg angle window inside a cached one is selected from the cached planes.
+        min_bragg_angle, max_bragg_angle = 5 * np.pi / 180, 12 * np.pi / 180
+        ph.setup_diffracting_planes(wavelength, min_bragg_angle, max_bragg_angle)
+        sintlmin = np.sin(min_bragg_angle) / wavelength
+        sintlmax = np.sin(max_bragg_angle) / wavelength
+        expected = tools.genhkl_all(unit_cell, sintlmin, sintlmax, sgname=sgname)
+        self.assertEqual(ph.miller_indices.shape, expected.shape)
+        self.assertEqual(set(map(tuple, ph.miller_indices)), set(map(tuple, expected)))
+        self.assertEqual(ph.structure_factors.shape[0], ph.miller_indices.shape[0])
+        for hkl, structure_factor in zip(miller_indices, structure_factors):
+            mask = np.all(ph.miller_indices == hkl, axis=1)
+            if np.any(mask):
+                self.assertTrue(np.allclose(ph.structure_factors[mask][0], structure_factor))
+
+        ph.cache_size = 1
+        ph.setup_diffracting_planes(wavelength, 0, 10 * np.pi / 180)
+        ph.setup_diffracting_planes(wavelength, 0, 20 * np.pi / 180)
+        self.assertFalse(ph.miller_indices is miller_indices)
+        self.assertTrue(np.allclose(np.sort(ph.miller_indices, axis=0), np.sort(miller_indices, axis=0)))
+
+    def test_diffracting_planes_cache_directory(self):
+        data = os.path.join(os.path.dirname(__file__), 'data', 'Fe_mp-150_conventional_standard.cif')
+        unit_cell = [3.64570000, 3.64570000, 3.64570000, 90.0, 90.0, 90.0]
+        with tempfile.TemporaryDirectory() as path_to_cache_directory:
+            ph = Phase(unit_cell, 'Fm-3m', path_to_cif_file=data, path_to_cache_directory=path_to_cache_directory)
+            ph.setup_diffracting_planes(0.5, 0, 20 * np.pi / 180)
+            self.assertEqual(len(os.listdir(path_to_cache_directory)), 1)
+
+            loaded_ph = Phase(unit_cell, 'Fm-3m', path_to_cif_file=data, path_to_cache_directory=path_to_cache_directory)
+            loaded_ph.setup_diffracting_planes(0.5, 0, 20 * np.pi / 180)
+            self.assertTrue(np.array_equal(loaded_ph.miller_indices, ph.miller_indices))
+            self.assertTrue(np.array_equal(loaded_ph.structure_factors, ph.structure_factors))
+
+        # Structure factors cached for a CIF file are not reused once the file is edited.
+        with tempfile.TemporaryDirectory() as path_to_cache_directory:
+            path_to_cif_file = os.path.join(path_to_cache_directory, 'Fe.cif')
+            with open(data) as f:
+                cif = f.read()
+            with open(path_to_cif_file, 'w') as f:
+                f.write(cif)
+            ph = Phase(unit_cell, 'Fm-3m', path_to_cif_file=path_to_cif_file,
+                       path_to_cache_directory=path_to_cache_directory)
+            ph.setup_diffracting_planes(0.5, 0, 20 * np.pi / 180)
+            with open(path_to_cif_file, 'w') as f:
+                f.write(cif.replace('0.00000000  0.00000000  0.00000000  1', '0.00000000  0.00000000  0.00000000  0'))
+            edited_ph = Phase(unit_cell, 'Fm-3m', path_to_cif_file=path_to_cif_file,
+                              path_to_cache_directory=path_to_cache_directory)
+            edited_ph.setup_diffracting_planes(0.5, 0, 20 * np.pi / 180)
+            self.assertFalse(np.allclose(edited_ph.structure_factors, ph.structure_factors))
+            ph.setup_diffracting_planes(0.5, 0, 20 * np.pi / 180)
+            self.assertTrue(np.allclose(ph.structure_factors, edited_ph.structure_factors))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,12 +1,16 @@
 import unittest
+import copy
 import numpy as np
-from xrd_simulator.polycrystal import Polycrystal
+from xrd_simulator.polycrystal import Polycrystal, _estimate_element_costs, _get_balanced_tasks, _get_interval_mask, \
+    _BYTES_PER_REFLECTION
 from xrd_simulator.mesh import TetraMesh
 from xrd_simulator.phase import Phase
 from xrd_simulator.detector import Detector
 from xrd_simulator.beam import Beam
 from xrd_simulator.motion import RigidBodyMotion
+from xrd_simulator.parallel import WorkerPool
 from xrd_simulator.utils import _epsilon_to_b
+from xrd_simulator import utils
 from xfab import tools
 import os
 
@@ -123,6 +127,352 @@ class TestPolycrystal(unittest.TestCase):
             20,
             msg="Few or no rings appeared from diffraction.")
 
+    def test_diffract_analytic_scattering_regions(self):
+        rotation_angle = 10 * np.pi / 180.
+        motion = RigidBodyMotion(np.array([0, 0, 1]), rotation_angle, np.array([0, 0, 0]))
+        self.polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+        scattering_units = self.detector.frames[0]
+        self.assertGreater(len(scattering_units), 0)
+
+        # Scattering regions are the tets themselves, with volumes and centroids given by the mesh.
+        element_index = scattering_units.element_index
+        volumes = np.abs(self.polycrystal.mesh_lab.evolumes[element_index])
+        self.assertTrue(np.allclose(scattering_units.volume, volumes))
+        self.assertTrue(np.all(np.diff(scattering_units.vertex_offsets) == 4))
+        for i in range(0, len(scattering_units), 50):
+            scattering_unit = scattering_units[i]
+            centroid = motion(self.polycrystal.mesh_lab.ecentroids[element_index[i]], scattering_unit.time)
+            self.assertTrue(np.allclose(scattering_unit.centroid, centroid.flatten(), atol=1e-4))
+            self.assertTrue(scattering_unit._convex_hull is None)
+            self.assertTrue(np.isclose(scattering_unit.convex_hull.volume, scattering_unit.volume))
+
+    def test_diffract_max_memory(self):
+        rotation_angle = 10 * np.pi / 180.
+        rotation_axis = np.array([0, 0, 1])
+        translation = np.array([0, 0, 0])
+        motion = RigidBodyMotion(rotation_axis, rotation_angle, translation)
+
+        self.polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+        number_of_hkls = len(self.phases[0].miller_indices)
+        self.polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True,
+                                  max_memory=100 * number_of_hkls * _BYTES_PER_REFLECTION * rotation_angle / np.pi)
+
+        full, chunked = self.detector.frames
+        self.assertGreater(len(full), 0)
+        self.assertEqual(len(full), len(chunked))
+        full = full.take(np.lexsort((full.time, full.element_index)))
+        chunked = chunked.take(np.lexsort((chunked.time, chunked.element_index)))
+        self.assertTrue(np.array_equal(full.element_index, chunked.element_index))
+        self.assertTrue(np.allclose(full.time, chunked.time))
+        self.assertTrue(np.allclose(full.zd, chunked.zd))
+        self.assertTrue(np.allclose(full.volume, chunked.volume))
+
+    def test_diffract_grains(self):
+        rotation_angle = 10 * np.pi / 180.
+        motion = RigidBodyMotion(np.array([0, 0, 1]), rotation_angle, np.array([0, 0, 0]))
+
+        # A few grains each meshed by many elements.
+        element_grain_map = np.random.randint(0, 5, size=(self.mesh.number_of_elements,))
+        orientation = self.orientation[0:5][element_grain_map]
+        polycrystal = Polycrystal(self.mesh, orientation, np.zeros((3, 3)), self.phases)
+        self.assertEqual(len(np.unique(polycrystal.element_grain_map)), 5)
+        for grain in range(5):
+            self.assertEqual(len(np.unique(polycrystal.element_grain_map[element_grain_map == grain])), 1)
+
+        polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+        per_element = Polycrystal(self.mesh, orientation, np.zeros((3, 3)), self.phases,
+                                  element_grain_map=np.arange(self.mesh.number_of_elements))
+        per_element.diffract(self.beam, self.detector, motion, BB_intersection=True)
+
+        grains, elements = self.detector.frames
+        self.assertGreater(len(grains), 0)
+        self.assertEqual(len(grains), len(elements))
+        grains = grains.take(np.lexsort((grains.time, grains.element_index)))
+        elements = elements.take(np.lexsort((elements.time, elements.element_index)))
+        self.assertTrue(np.array_equal(grains.element_index, elements.element_index))
+        self.assertTrue(np.array_equal(grains.hkl_index, elements.hkl_index))
+        self.assertTrue(np.allclose(grains.time, elements.time))
+        self.assertTrue(np.allclose(grains.zd, elements.zd))
+
+        with self.assertRaises(ValueError):
+            Polycrystal(self.mesh, orientation, np.zeros((3, 3)), self.phases, element_grain_map=np.arange(3))
+
+        # Elements differing by round-off only are part of the same grain.
+        perturbed = np.nextafter(orientation, 2 * orientation)
+        mask = np.random.rand(self.mesh.number_of_elements) > 0.5
+        orientation[mask] = perturbed[mask]
+        polycrystal = Polycrystal(self.mesh, orientation, np.zeros((3, 3)), self.phases)
+        self.assertEqual(len(np.unique(polycrystal.element_grain_map)), 5)
+        for grain in range(5):
+            self.assertEqual(len(np.unique(polycrystal.element_grain_map[element_grain_map == grain])), 1)
+
+    def test_diffract_single_precision(self):
+        rotation_angle = 10 * np.pi / 180.
+        motion = RigidBodyMotion(np.array([0, 0, 1]), rotation_angle, np.array([0, 0, 0]))
+        self.polycrystal.diffract(self.beam, self.detector, motion)
+        reference_miller_indices = np.copy(self.phases[0].miller_indices)
+
+        self.addCleanup(utils.set_precision, utils.get_precision())
+        utils.set_precision("float32")
+        mesh = TetraMesh.generate_mesh_from_vertices(self.mesh.coord, self.mesh.enod)
+        polycrystal = Polycrystal(mesh, self.orientation, np.zeros((3, 3)), self.phases)
+        for array in (mesh.coord, mesh.espherecentroids, mesh.evolumes, polycrystal.orientation_lab, polycrystal._eB):
+            self.assertEqual(array.dtype, np.float32)
+        polycrystal.diffract(self.beam, self.detector, motion)
+        self.assertEqual(self.detector.frames[1].zd.dtype, np.float32)
+
+        # Accuracy check: single precision gives the same reflections and only moves the detector hits by a small
+        # fraction of a pixel.
+        reference, frame = [
+            table.take(np.lexsort((table.time, *miller_indices[table.hkl_index].T[::-1], table.element_index)))
+            for table, miller_indices in zip(self.detector.frames, (reference_miller_indices, self.phases[0].miller_indices))
+        ]
+        self.assertEqual(len(reference), len(frame))
+        self.assertTrue(np.array_equal(reference.element_index, frame.element_index))
+        self.assertTrue(np.array_equal(
+            reference_miller_indices[reference.hkl_index], self.phases[0].miller_indices[frame.hkl_index]))
+        self.assertLess(np.max(np.abs(reference.time - frame.time)), 1e-4)
+        self.assertLess(np.max(np.abs(reference.zd - frame.zd)), 0.01 * self.pixel_size)
+        self.assertLess(np.max(np.abs(reference.yd - frame.yd)), 0.01 * self.pixel_size)
+        self.assertLess(np.max(np.abs(reference.volume - frame.volume)), 1e-4 * np.max(reference.volume))
+
+    def test_transform_single_precision(self):
+        self.addCleanup(utils.set_precision, utils.get_precision())
+        utils.set_precision("float32")
+        strain = 0.001 * (np.random.rand(self.mesh.number_of_elements, 3, 3) - 0.5)
+        strain = 0.5 * (strain + strain.transpose(0, 2, 1))
+        polycrystal = Polycrystal(self.mesh, self.orientation, strain, self.phases)
+
+        # Rounding errors do not accumulate over many small single precision rotations.
+        motion = RigidBodyMotion(np.array([0, 1., 1.]) / np.sqrt(2.), np.pi / 180., np.array([0, 0, 0]))
+        for _ in range(1000):
+            polycrystal.transform(motion, time=1)
+        rotation = polycrystal.mesh_lab.rotation
+        self.assertEqual(polycrystal.orientation_lab.dtype, np.float32)
+        self.assertLess(np.max(np.abs(polycrystal.orientation_lab - np.matmul(rotation, self.orientation))), 1e-6)
+        self.assertLess(np.max(np.abs(polycrystal.strain_lab - np.matmul(np.matmul(rotation, strain), rotation.T))), 1e-9)
+        self.assertLess(np.max(np.abs(polycrystal.orientation_sample - self.orientation)), 1e-6)
+
+    def test_diffract_update_frame(self):
+        rotation_angle = 10 * np.pi / 180.
+        motion = RigidBodyMotion(np.array([0, 0, 1]), rotation_angle, np.array([0, 0, 0]))
+        polycrystal = copy.deepcopy(self.polycrystal)
+        polycrystal.transform(motion, time=0.3)
+        polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+
+        element_indices = np.arange(0, self.mesh.number_of_elements, 7)
+        strain = 0.001 * (np.random.rand(len(element_indices), 3, 3) - 0.5)
+        strain = 0.5 * (strain + strain.transpose(0, 2, 1))
+        orientation = self.orientation[element_indices[::-1]]
+        polycrystal.update_elements(element_indices, orientation=orientation, strain=strain)
+        polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True, update_frame=0)
+
+        reference = Polycrystal(self.mesh, self.orientation, np.zeros((3, 3)), self.phases)
+        reference.transform(motion, time=0.3)
+        reference.update_elements(element_indices, orientation=orientation, strain=strain)
+        reference.diffract(self.beam, self.detector, motion, BB_intersection=True)
+        self.assertTrue(np.allclose(polycrystal._eB, reference._eB))
+        self.assertTrue(np.allclose(polycrystal.strain_sample, reference.strain_sample))
+        self.assertTrue(np.allclose(polycrystal.orientation_sample, reference.orientation_sample))
+
+        previous, updated, full = self.detector.frames
+        self.assertGreater(len(updated), 0)
+        self.assertEqual(len(updated), len(full))
+        self.assertFalse(np.array_equal(previous.zd, full.zd))
+        updated = updated.take(np.lexsort((updated.time, updated.element_index)))
+        full = full.take(np.lexsort((full.time, full.element_index)))
+        self.assertTrue(np.array_equal(updated.element_index, full.element_index))
+        self.assertTrue(np.allclose(updated.time, full.time))
+        self.assertTrue(np.allclose(updated.zd, full.zd))
+
+        # Nothing is recomputed if no elements have been updated.
+        polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True, update_frame=1)
+        self.assertEqual(len(self.detector.frames[-1]), len(full))
+
+    def test_assign_element_arrays(self):
+        rotation_angle = 10 * np.pi / 180.
+        motion = RigidBodyMotion(np.array([0, 0, 1]), rotation_angle, np.array([0, 0, 0]))
+        polycrystal = copy.deepcopy(self.polycrystal)
+        polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+        version = polycrystal._version
+
+        # Assigned orientations and strains are not hidden by the cached per element arrays.
+        strain = 0.001 * (np.random.rand(self.mesh.number_of_elements, 3, 3) - 0.5)
+        polycrystal.orientation_lab = self.orientation[::-1]
+        polycrystal.strain_lab = 0.5 * (strain + strain.transpose(0, 2, 1))
+        self.assertGreater(polycrystal._version, version)
+        polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+
+        reference = Polycrystal(self.mesh, self.orientation[::-1], polycrystal.strain_lab, self.phases)
+        reference.diffract(self.beam, self.detector, motion, BB_intersection=True)
+        self.assertTrue(np.allclose(polycrystal._get_eUB(), reference._get_eUB()))
+        self.assertTrue(np.array_equal(polycrystal.element_grain_map, reference.element_grain_map))
+
+        # Sample frame arrays are assigned through the lab frame arrays.
+        polycrystal.transform(RigidBodyMotion(np.array([0, 1., 0]), rotation_angle, np.array([10., 5., 0])), time=0.5)
+        version = polycrystal._version
+        polycrystal.orientation_sample = self.orientation
+        polycrystal.strain_sample = np.eye(3) * 0.001
+        self.assertGreater(polycrystal._version, version)
+        self.assertTrue(np.allclose(polycrystal.orientation_sample, self.orientation))
+        self.assertTrue(np.allclose(polycrystal.strain_sample, np.eye(3) * 0.001))
+        self.assertTrue(np.allclose(polycrystal._get_eUB(), np.matmul(polycrystal.orientation_lab, polycrystal._eB)))
+
+        previous, assigned, expected = self.detector.frames
+        self.assertFalse(np.array_equal(previous.zd, expected.zd))
+        assigned = assigned.take(np.lexsort((assigned.time, assigned.element_index)))
+        expected = expected.take(np.lexsort((expected.time, expected.element_index)))
+        self.assertTrue(np.array_equal(assigned.element_index, expected.element_index))
+        self.assertTrue(np.allclose(assigned.zd, expected.zd))
+
+    def test_diffract_update_frame_worker_pool(self):
+        rotation_angle = 10 * np.pi / 180.
+        motion = RigidBodyMotion(np.array([0, 0, 1]), rotation_angle, np.array([0, 0, 0]))
+        polycrystal = copy.deepcopy(self.polycrystal)
+        element_indices = np.arange(0, self.mesh.number_of_elements, 7)
+        with WorkerPool(number_of_processes=2) as worker_pool:
+            polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True, worker_pool=worker_pool)
+            token, bragg_angle_cache = worker_pool._sample_token, polycrystal._max_bragg_angle_cache
+
+            # Updates of a subset of the elements are written into the resident sample arrays, and the Bragg angle
+            # bounds are kept.
+            for orientation in (self.orientation[element_indices[::-1]], np.eye(3)):
+                polycrystal.update_elements(element_indices, orientation=orientation)
+                polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True, worker_pool=worker_pool,
+                                     update_frame=len(self.detector.frames) - 1)
+            self.assertIs(worker_pool._sample_token, token)
+            self.assertIs(polycrystal._max_bragg_angle_cache, bragg_angle_cache)
+            resident_arrays = worker_pool._sample_arrays.arrays
+            self.assertTrue(np.array_equal(resident_arrays["eUB"], polycrystal._get_eUB()))
+            self.assertTrue(np.array_equal(resident_arrays["element_grain_map"], polycrystal.element_grain_map))
+
+        reference = copy.deepcopy(self.polycrystal)
+        reference.update_elements(element_indices, orientation=np.eye(3))
+        reference.diffract(self.beam, self.detector, motion, BB_intersection=True)
+        updated, expected = self.detector.frames[-2:]
+        updated = updated.take(np.lexsort((updated.time, updated.element_index)))
+        expected = expected.take(np.lexsort((expected.time, expected.element_index)))
+        self.assertTrue(np.array_equal(updated.element_index, expected.element_index))
+        self.assertTrue(np.allclose(updated.zd, expected.zd))
+
+    def test_diffract_proximity(self):
+        rotation_angle = 10 * np.pi / 180.
+        motion = RigidBodyMotion(np.array([0, 0, 1]), rotation_angle, np.array([0, 0, 0]))
+        self.polycrystal.transform(
+            RigidBodyMotion(np.array([0, 1., 0]), rotation_angle, np.array([10., 5., 0])), time=0.5)
+
+        # A narrow beam illuminating a slice of the sample.
+        w = np.sqrt(self.detector_size / 10.) / 4.
+        beam_vertices = np.array([
+            [-self.detector_distance, -w, -w],
+            [-self.detector_distance, w, -w],
+            [-self.detector_distance, w, w],
+            [-self.detector_distance, -w, w],
+            [self.detector_distance, -w, -w],
+            [self.detector_distance, w, -w],
+            [self.detector_distance, w, w],
+            [self.detector_distance, -w, w]])
+        beam = Beam(beam_vertices, self.beam.wave_vector, self.beam.wavelength, self.beam.polarization_vector)
+
+        candidates = self.polycrystal._get_beam_candidates(beam, motion)
+        self.assertGreater(np.sum(candidates), 0)
+        self.assertLess(np.sum(candidates), self.mesh.number_of_elements)
+
+        self.polycrystal.diffract(beam, self.detector, motion, BB_intersection=True)
+        self.polycrystal.diffract(beam, self.detector, motion, BB_intersection=True, proximity=True)
+        full, culled = self.detector.frames
+        self.assertGreater(len(full), 0)
+        # The proximity check samples the motion, such that elements grazing the beam in between samples may be lost.
+        self.assertTrue(np.all(np.isin(culled.element_index, full.element_index)))
+        self.assertGreater(len(culled), 0.98 * len(full))
+
+    def test_diffract_worker_pool(self):
+        rotation_angle = 10 * np.pi / 180.
+        rotation_axis = np.array([0, 0, 1])
+        translation = np.array([0, 0, 0])
+        motion = RigidBodyMotion(rotation_axis, rotation_angle, translation)
+
+        with WorkerPool(number_of_processes=2) as worker_pool:
+            for _ in range(2):
+                self.polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True,
+                                          worker_pool=worker_pool)
+                self.polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+                self.polycrystal.transform(motion, time=1.0)
+            patterns = self.detector.render('all', lorentz=False, polarization=False,
+                                            structure_factor=False, verbose=False, worker_pool=worker_pool)
+        serial_patterns = self.detector.render('all', lorentz=False, polarization=False,
+                                               structure_factor=False, verbose=False)
+
+        self.assertTrue(np.allclose(patterns, serial_patterns))
+        for i in range(0, 4, 2):
+            self.assertGreater(np.sum(patterns[i]), 0)
+            self.assertTrue(np.allclose(patterns[i], patterns[i + 1]))
+            self.assertEqual(len(self.detector.frames[i]), len(self.detector.frames[i + 1]))
+        self.assertFalse(np.allclose(patterns[0], patterns[2]))
+
+        # The load balance of a pool started for a single call is kept with the polycrystal.
+        self.polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True, number_of_processes=2)
+        self.assertGreater(len(self.polycrystal.busy_times), 0)
+        self.assertTrue(all(busy_time > 0 for busy_time in self.polycrystal.busy_times.values()))
+
+    def test_diffract_scan(self):
+        step = 5 * np.pi / 180.
+        rotation_axis = np.array([0, 0, 1])
+        motion = RigidBodyMotion(rotation_axis, step, np.array([0, 0, 0]))
+        polycrystal = copy.deepcopy(self.polycrystal)
+
+        polycrystal.diffract_scan(self.beam, self.detector, np.array([0, step, 2 * step]), rotation_axis,
+                                  BB_intersection=True)
+        for i in range(2):
+            self.polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+            self.polycrystal.transform(motion, time=1.0)
+
+        k = np.linalg.norm(self.beam.wave_vector)
+        for scan_frame, frame in zip(self.detector.frames[0:2], self.detector.frames[2:4]):
+            self.assertGreater(len(scan_frame), 0)
+            self.assertLessEqual(abs(len(scan_frame) - len(frame)), 0.001 * len(frame) + 2)
+            common = np.intersect1d(scan_frame.element_index, frame.element_index)
+            self.assertGreater(len(common), 0.99 * len(np.unique(frame.element_index)))
+            self.assertTrue(np.allclose(np.linalg.norm(scan_frame.scattered_wave_vector, axis=1), k))
+            self.assertTrue(np.all((scan_frame.time >= 0) & (scan_frame.time <= 1)))
+        self.assertTrue(np.all(self.detector.frames[0].time < 0.5))
+        self.assertTrue(np.all(self.detector.frames[1].time >= 0.5))
+
+    def test_interval_mask(self):
+        proximity_intervals = (np.array([0, 0, 2]), np.array([0.0, 0.6, 0.2]), np.array([0.3, 1.0, 0.4]))
+        element = np.array([0, 0, 0, 1, 2, 2, 2])
+        time = np.array([0.1, 0.5, 0.7, 0.5, 0.1, 0.3, 0.5])
+        mask = _get_interval_mask(element, time, proximity_intervals)
+        self.assertTrue(np.array_equal(mask, [True, False, True, False, False, True, False]))
+
+    def test_balanced_tasks(self):
+        w = 20.
+        beam_vertices = np.array([
+            [-self.detector_distance, -w, -w],
+            [-self.detector_distance, w, -w],
+            [-self.detector_distance, w, w],
+            [-self.detector_distance, -w, w],
+            [self.detector_distance, -w, -w],
+            [self.detector_distance, w, -w],
+            [self.detector_distance, w, w],
+            [self.detector_distance, -w, w]])
+        self.beam.set_beam_vertices(beam_vertices)
+        motion = RigidBodyMotion(np.array([0, 0, 1]), 10 * np.pi / 180., np.array([0, 0, 0]))
+        mesh = self.polycrystal.mesh_lab
+
+        costs = _estimate_element_costs(self.beam, motion, mesh.espherecentroids, mesh.eradius, True, False)
+        self.assertGreater(np.max(costs), 1)
+        self.assertLess(np.min(costs), 1)
+
+        tasks = _get_balanced_tasks(costs, 32)
+        self.assertLessEqual(len(tasks), 32)
+        self.assertTrue(np.array_equal(np.sort(np.concatenate(tasks)), np.arange(mesh.number_of_elements)))
+        for task in tasks:
+            self.assertTrue(np.all(np.diff(task) > 0))
+        task_costs = np.array([np.sum(costs[task]) for task in tasks])
+        self.assertLessEqual(np.max(task_costs), np.sum(costs) / 32 + np.max(costs))
+        self.assertGreaterEqual(np.max(costs[tasks[0]]), np.max(costs[tasks[-1]]))
+
     def test_save_and_load(self):
         orientation_lab = self.polycrystal.orientation_lab.copy()
         path = os.path.join(
@@ -152,6 +502,68 @@ class TestPolycrystal(unittest.TestCase):
         os.remove(path + ".xdmf")
         os.remove(path + ".h5")
 
+    def test_load_legacy_state(self):
+        motion = RigidBodyMotion(np.array([0, 0, 1]), 10 * np.pi / 180., np.array([0, 0, 0]))
+        sample_motion = RigidBodyMotion(np.array([0, 1., 0]), 10 * np.pi / 180., np.array([10., 5., 0]))
+        self.polycrystal.transform(sample_motion, time=0.5)
+        self.polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+
+        # Polycrystals pickled by earlier versions lack the grain map and the cached arrays, store the orientations
+        # and strains as plain attributes and the lab frame mesh as a moved copy of the sample frame mesh.
+        state = dict(self.polycrystal.__dict__)
+        del state["element_grain_map"], state["_version"], state["_eUB"], state["_updated_elements"]
+        state["orientation_lab"] = state.pop("_orientation_lab")
+        state["strain_lab"] = state.pop("_strain_lab")
+        del state["_orientation_reference"], state["_strain_reference"], state["_reference_rotation"]
+        state["orientation_sample"] = self.polycrystal.orientation_sample
+        state["strain_sample"] = self.polycrystal.strain_sample
+        state["mesh_lab"] = copy.deepcopy(self.mesh)
+        state["mesh_lab"].update(sample_motion, time=0.5)
+        polycrystal = Polycrystal.__new__(Polycrystal)
+        polycrystal.__setstate__(state)
+        self.assertTrue(np.all(polycrystal._updated_elements))
+        self.assertTrue(np.allclose(polycrystal.mesh_lab.rotation, self.polycrystal.mesh_lab.rotation))
+        self.assertTrue(np.allclose(polycrystal.mesh_lab.translation, self.polycrystal.mesh_lab.translation))
+        self.assertTrue(np.allclose(polycrystal.orientation_sample, self.orientation))
+        polycrystal.diffract(self.beam, self.detector, motion, BB_intersection=True)
+
+        expected, legacy = self.detector.frames
+        self.assertGreater(len(expected), 0)
+        self.assertTrue(np.array_equal(expected.element_index, legacy.element_index))
+        self.assertTrue(np.allclose(expected.zd, legacy.zd))
+
+    def test_save_and_load_hdf5(self):
+        motion = RigidBodyMotion(np.array([0, 0, 1]), 10 * np.pi / 180., np.array([0, 0, 0]))
+        self.polycrystal.transform(
+            RigidBodyMotion(np.array([0, 1., 0]), 10 * np.pi / 180., np.array([10., 5., 0])), time=0.5)
+        path = os.path.join(os.path.join(os.path.dirname(__file__), 'data'), 'my_polycrystal.hdf5')
+        self.addCleanup(os.remove, path)
+        self.polycrystal.save(path, save_mesh_as_xdmf=False)
+        polycrystal = Polycrystal.load(path)
+
+        # The large arrays are memory mapped rather than read into memory.
+        self.assertIsInstance(polycrystal.mesh_sample.coord, np.memmap)
+        self.assertIsInstance(polycrystal.orientation_lab, np.memmap)
+        self.assertTrue(np.array_equal(polycrystal.mesh_lab.coord, self.polycrystal.mesh_lab.coord))
+        self.assertTrue(np.array_equal(polycrystal.mesh_lab.enod, self.polycrystal.mesh_lab.enod))
+        self.assertTrue(np.array_equal(polycrystal.orientation_lab, self.polycrystal.orientation_lab))
+        self.assertTrue(np.array_equal(polycrystal.element_grain_map, self.polycrystal.element_grain_map))
+        self.assertEqual(polycrystal.phases[0].sgname, self.phases[0].sgname)
+
+        self.polycrystal.diffract(self.beam, self.detector, motion)
+        polycrystal.diffract(self.beam, self.detector, motion)
+        expected, frame = [table.take(np.lexsort((table.time, table.element_index))) for table in self.detector.frames]
+        self.assertEqual(len(frame), len(expected))
+        self.assertTrue(np.allclose(frame.zd, expected.zd))
+
+        # Updates are kept in memory, the file is not modified.
+        polycrystal.update_elements([0], orientation=np.eye(3))
+        self.assertTrue(np.allclose(Polycrystal.load(path).orientation_lab[0], self.polycrystal.orientation_lab[0]))
+
+        self.polycrystal.save(path, save_mesh_as_xdmf=False, quaternions=True)
+        polycrystal = Polycrystal.load(path)
+        self.assertTrue(np.allclose(polycrystal.orientation_lab, self.polycrystal.orientation_lab))
+
     def test_dimension_handling(self):
 
         Polycrystal(mesh=self.mesh,
@@ -190,6 +602,7 @@ class TestPolycrystal(unittest.TestCase):
         motion = RigidBodyMotion(rotation_axis, rotation_angle, translation)
 
         time = 0.8436
+        eUB = polycrystal._get_eUB()
         polycrystal.transform(motion, time=time)
         Rot_mat = motion.rotator.get_rotation_matrix(time * rotation_angle)
         unit_vector = np.random.rand(3,)
@@ -207,8 +620,45 @@ class TestPolycrystal(unittest.TestCase):
             self.assertAlmostEqual(
                 s1, s2, msg="Transformation does not preserve directional strains")
 
+        # The cached G_0 mapping is updated by the transform.
+        self.assertTrue(np.allclose(np.matmul(Rot_mat, eUB), polycrystal._eUB))
+        self.assertTrue(np.allclose(
+            polycrystal._get_eUB(), np.matmul(polycrystal.orientation_lab, polycrystal._eB)))
+
         # TODO: also test the orientation transformations.
 
+    def test_transform_mesh(self):
+        coord = np.copy(self.mesh.coord)
+        self.assertIs(self.polycrystal.mesh_sample, self.mesh)
+        self.assertTrue(np.shares_memory(self.polycrystal.mesh_lab.coord, self.mesh.coord))
+        self.assertFalse(self.polycrystal.mesh_lab.coord.flags.writeable)
+
+        motion = RigidBodyMotion(np.array([0, 1., 0]), 10 * np.pi / 180., np.array([-34.0, 0.243, 345.324]))
+        reference = copy.deepcopy(self.mesh)
+        for time in (0.3, 0.7):
+            previous_coord = self.polycrystal.mesh_lab.coord
+            self.polycrystal.transform(motion, time=time)
+            reference.update(motion, time=time)
+            # Arrays returned before a motion are not moved with the mesh.
+            self.assertFalse(np.allclose(previous_coord, self.polycrystal.mesh_lab.coord))
+
+        # The lab frame mesh is moved without modifying the sample frame mesh.
+        mesh_lab = self.polycrystal.mesh_lab
+        self.assertTrue(np.array_equal(self.mesh.coord, coord))
+        self.assertIs(mesh_lab.enod, self.mesh.enod)
+        self.assertIs(mesh_lab.eradius, self.mesh.eradius)
+        for name in ("coord", "enormals", "ecentroids", "espherecentroids", "centroid"):
+            self.assertTrue(np.allclose(getattr(mesh_lab, name), getattr(reference, name)), msg=name)
+        self.assertTrue(np.allclose(self.polycrystal.orientation_sample, self.orientation))
+
+        # The lab frame mesh is saved with the moved geometry.
+        self.assertTrue(np.allclose(mesh_lab._mesh.points, reference.coord))
+        path = os.path.join(os.path.join(os.path.dirname(__file__), 'data'), 'my_mesh_lab.xdmf')
+        mesh_lab.save(path)
+        self.addCleanup(os.remove, path)
+        self.addCleanup(os.remove, path.replace('.xdmf', '.h5'))
+        self.assertTrue(np.allclose(TetraMesh.load(path).coord, reference.coord))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 import numpy as np
-from xrd_simulator.scattering_unit import ScatteringUnit
+from xrd_simulator.scattering_unit import ScatteringUnit, ScatteringUnitTable
 from scipy.spatial import ConvexHull
 from xrd_simulator.phase import Phase
 import os
@@ -94,6 +94,96 @@ class TestScatteringUnit(unittest.TestCase):
         vol = self.scattering_unit.volume
         self.assertAlmostEqual(vol, 1 / 6., msg="volume is wrong")
 
+    def test_lazy_convex_hull(self):
+        scattering_unit = ScatteringUnit(None,
+                                         self.scattered_wave_vector,
+                                         self.incident_wave_vector,
+                                         self.wavelength,
+                                         self.incident_polarization_vector,
+                                         self.rotation_axis,
+                                         self.time,
+                                         self.phase,
+                                         hkl_indx=0,
+                                         element_index=0,
+                                         vertices=self.ch.points[self.ch.vertices])
+        self.assertTrue(scattering_unit._convex_hull is None)
+        self.assertAlmostEqual(scattering_unit.volume, 1 / 6.)
+        self.assertTrue(scattering_unit._convex_hull is not None)
+        self.assertEqual(scattering_unit.convex_hull.vertices.shape[0], 4)
+
+    def test_unpickle_eager_convex_hull(self):
+        # Scattering units pickled before the convex hull was built lazily hold it as a plain attribute.
+        state = dict(self.scattering_unit.__dict__)
+        state["convex_hull"] = state.pop("_convex_hull")
+        del state["_vertices"], state["_volume"]
+        scattering_unit = ScatteringUnit.__new__(ScatteringUnit)
+        scattering_unit.__setstate__(state)
+        self.assertTrue(scattering_unit.convex_hull is self.ch)
+        self.assertAlmostEqual(scattering_unit.volume, self.ch.volume)
+        self.assertTrue(np.allclose(scattering_unit.centroid, self.scattering_unit.centroid))
+
+    def test_table(self):
+        table = ScatteringUnitTable.from_scattering_units([self.scattering_unit] * 3)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.vertices.shape, (12, 3))
+        self.assertTrue(np.allclose(table.vertex_offsets, [0, 4, 8, 12]))
+        self.assertTrue(np.allclose(table.centroid, 0.25))
+
+        table.time[:] = [0.3, 0.1, 0.2]
+        table.volume[:] = [1., 2., 3.]
+        subtable = table.take(np.argsort(table.time))
+        self.assertTrue(np.allclose(subtable.time, [0.1, 0.2, 0.3]))
+        self.assertTrue(np.allclose(subtable.volume, [2., 3., 1.]))
+
+        joined = ScatteringUnitTable.concatenate([table, subtable[1:]])
+        self.assertEqual(len(joined), 5)
+        self.assertTrue(np.allclose(joined.vertex_offsets, np.arange(6) * 4))
+
+        scattering_unit = joined[-1]
+        self.assertAlmostEqual(scattering_unit.time, 0.3)
+        self.assertAlmostEqual(scattering_unit.volume, 1.)
+        self.assertTrue(scattering_unit.phase is self.phase)
+        self.assertTrue(np.allclose(scattering_unit.hkl, self.scattering_unit.hkl))
+        self.assertAlmostEqual(scattering_unit.lorentz_factor, self.scattering_unit.lorentz_factor)
+        self.assertEqual(len([su for su in joined]), 5)
+
+        empty = ScatteringUnitTable.empty(self.incident_wave_vector, self.wavelength,
+                                          self.incident_polarization_vector, self.rotation_axis, [self.phase])
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(len(ScatteringUnitTable.concatenate([empty, table])), 3)
+
+
+    def test_table_intensity_factors(self):
+        directions = np.array([[0, 1, 1.], [0, 0, 1.], [1, 0, 0.], [1, 1, 0.]])
+        scattered_wave_vector = 2 * np.pi * directions / (np.linalg.norm(directions, axis=1, keepdims=True) * self.wavelength)
+        table = ScatteringUnitTable(
+            np.zeros((4,)), np.zeros((4,)), np.arange(4), np.zeros((4,)), scattered_wave_vector,
+            np.zeros((4,)), np.zeros((4,)), np.ones((4,)), np.zeros((4, 3)), np.arange(5),
+            self.incident_wave_vector, self.wavelength, self.incident_polarization_vector, self.rotation_axis,
+            [self.phase])
+
+        lorentz_factor = table.lorentz_factor
+        self.assertAlmostEqual(lorentz_factor[0], np.sqrt(2.))
+        self.assertTrue(np.isinf(lorentz_factor[1]))
+        self.assertTrue(np.isinf(lorentz_factor[2]))
+        self.assertTrue(np.allclose(table.polarization_factor, [0.5, 1, 1, 0.5]))
+        self.assertTrue(np.allclose(table.real_structure_factor, self.phase.structure_factors[:4, 0]))
+        self.assertTrue(np.allclose(table.imaginary_structure_factor, self.phase.structure_factors[:4, 1]))
+        for i, scattering_unit in enumerate(table):
+            self.assertEqual(scattering_unit.lorentz_factor, lorentz_factor[i])
+            self.assertAlmostEqual(scattering_unit.polarization_factor, table.polarization_factor[i])
+
+        # The factors are kept with the table, until the quantities they are computed from are replaced.
+        self.assertIs(table.lorentz_factor, lorentz_factor)
+        table.scattered_wave_vector = scattered_wave_vector[::-1]
+        self.assertAlmostEqual(table.lorentz_factor[3], np.sqrt(2.))
+        self.assertTrue(np.allclose(table.polarization_factor, [0.5, 1, 1, 0.5][::-1]))
+
+        structure_factors = self.phase.structure_factors
+        self.addCleanup(setattr, self.phase, "structure_factors", structure_factors)
+        self.phase.structure_factors = 2 * structure_factors
+        self.assertTrue(np.allclose(table.real_structure_factor, 2 * structure_factors[:4, 0]))
+
 
 if __name__ == '__main__':
     unittest.main()
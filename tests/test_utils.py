@@ -3,6 +3,7 @@ import numpy as np
 from xfab import tools
 from xrd_simulator import utils
 from scipy.spatial.transform import Rotation
+from scipy.spatial import ConvexHull, HalfspaceIntersection
 
 
 class TestUtils(unittest.TestCase):
@@ -56,6 +57,137 @@ class TestUtils(unittest.TestCase):
                 msg="Tilted projection through unity cube should give greater than unity clip length",
             )
 
+    def test_clip_tetrahedra(self):
+        # Unit cube as halfspaces.
+        halfspaces = np.array(
+            [
+                [-1.0, 0.0, 0.0, 0.0],
+                [1.0, 0.0, 0.0, -1.0],
+                [0.0, -1.0, 0.0, 0.0],
+                [0.0, 1.0, 0.0, -1.0],
+                [0.0, 0.0, -1.0, 0.0],
+                [0.0, 0.0, 1.0, -1.0],
+            ]
+        )
+        tetrahedra = np.array(
+            [
+                [[0.1, 0.1, 0.1], [0.9, 0.1, 0.1], [0.1, 0.9, 0.1], [0.1, 0.1, 0.9]],  # contained
+                [[2.0, 2.0, 2.0], [3.0, 2.0, 2.0], [2.0, 3.0, 2.0], [2.0, 2.0, 3.0]],  # outside
+                [[0.5, 0.5, 0.5], [1.5, 0.5, 0.5], [0.5, 1.5, 0.5], [0.5, 0.5, 1.5]],  # corner cut off
+                [[1.0, 0.0, 0.0], [2.0, 0.0, 0.0], [1.0, 1.0, 0.0], [1.0, 0.0, 1.0]],  # touching a face
+            ]
+        )
+        volumes, centroids, vertices, vertex_offsets = utils._clip_tetrahedra(tetrahedra, halfspaces, 1e-9)
+
+        self.assertEqual(vertex_offsets.shape, (5,))
+        self.assertEqual(vertices.shape[0], vertex_offsets[-1])
+        self.assertAlmostEqual(volumes[0], 0.8**3 / 6.)
+        self.assertTrue(np.allclose(centroids[0], np.mean(tetrahedra[0], axis=0)))
+        self.assertEqual(vertex_offsets[1] - vertex_offsets[0], 4)
+        self.assertEqual(volumes[1], 0)
+        self.assertEqual(vertex_offsets[2] - vertex_offsets[1], 0)
+        self.assertAlmostEqual(volumes[2], 1. / 6. - 3 * (0.5**3 / 6.))
+        self.assertEqual(volumes[3], 0)
+
+        np.random.seed(5)
+        tetrahedra = np.random.rand(200, 1, 3) * 2 - 0.5 + np.random.normal(0, 0.3, (200, 4, 3))
+        volumes, centroids, vertices, vertex_offsets = utils._clip_tetrahedra(tetrahedra, halfspaces, 1e-9)
+        for i, tetrahedron in enumerate(tetrahedra):
+            region = vertices[vertex_offsets[i]:vertex_offsets[i + 1]]
+            if volumes[i] > 0:
+                hull = ConvexHull(region)
+                self.assertAlmostEqual(hull.volume, volumes[i])
+                self.assertEqual(len(hull.vertices), len(region))
+                self.assertTrue(np.allclose(centroids[i], np.mean(region, axis=0)))
+                combined_halfspaces = np.vstack((ConvexHull(tetrahedron).equations, halfspaces))
+                expected = ConvexHull(HalfspaceIntersection(combined_halfspaces, centroids[i]).intersections)
+                self.assertAlmostEqual(expected.volume, volumes[i])
+            else:
+                self.assertEqual(len(region), 0)
+
+    def test_get_convex_polyhedra_planes(self):
+        # Unit cube as halfspaces.
+        halfspaces = np.array(
+            [
+                [-1.0, 0.0, 0.0, 0.0],
+                [1.0, 0.0, 0.0, -1.0],
+                [0.0, -1.0, 0.0, 0.0],
+                [0.0, 1.0, 0.0, -1.0],
+                [0.0, 0.0, -1.0, 0.0],
+                [0.0, 0.0, 1.0, -1.0],
+            ]
+        )
+        tetrahedra = np.random.rand(200, 1, 3) * 2 - 0.5 + np.random.normal(0, 0.3, (200, 4, 3))
+        volumes, _, vertices, vertex_offsets = utils._clip_tetrahedra(tetrahedra, halfspaces, 1e-9)
+        keep = np.where(volumes > 1e-6)[0]
+        vertices = np.concatenate([vertices[vertex_offsets[i]:vertex_offsets[i + 1]] for i in keep])
+        vertex_offsets = np.concatenate(([0], np.cumsum(np.diff(vertex_offsets)[keep])))
+        # A flat polyhedron has no interior.
+        vertices = np.vstack((vertices, [[0., 0., 0.], [1., 0., 0.], [0., 1., 0.], [1., 1., 0.]]))
+        vertex_offsets = np.append(vertex_offsets, vertex_offsets[-1] + 4)
+
+        planes, plane_offsets, plane_counts = utils._get_convex_polyhedra_planes(vertices, vertex_offsets, 1e-9)
+        self.assertEqual(plane_counts[-1], -1)
+        points = np.random.rand(500, 3) * 2 - 0.5
+        for i in range(len(keep)):
+            self.assertGreaterEqual(plane_counts[i], 4)
+            self.assertLessEqual(plane_offsets[i] + plane_counts[i], plane_offsets[i + 1])
+            region = vertices[vertex_offsets[i]:vertex_offsets[i + 1]]
+            face_planes = planes[plane_offsets[i]:plane_offsets[i] + plane_counts[i]]
+            self.assertTrue(np.allclose(np.linalg.norm(face_planes[:, 0:3], axis=1), 1))
+            self.assertTrue(np.all(region.dot(face_planes[:, 0:3].T) + face_planes[:, 3] < 1e-9))
+            equations = ConvexHull(region).equations
+            inside = np.all(points.dot(face_planes[:, 0:3].T) + face_planes[:, 3] <= 0, axis=1)
+            expected = np.all(points.dot(equations[:, 0:3].T) + equations[:, 3] <= 0, axis=1)
+            self.assertTrue(np.array_equal(inside, expected))
+
+    def test_project_convex_polyhedra(self):
+        rows, cols = 20, 30
+        row_index, col_index = np.meshgrid(np.arange(rows), np.arange(cols), indexing="ij")
+        pixel_coordinates = np.ascontiguousarray(
+            np.stack((np.full((rows, cols), -10.0), row_index + 0.5, col_index + 0.5), axis=2)
+        )
+        # Overlapping boxes holding more pixels than the frame, such that the polyhedra are traced in chunks.
+        number_of_polyhedra = 12
+        centres = np.column_stack(
+            (np.random.rand(number_of_polyhedra), np.random.rand(number_of_polyhedra) * rows,
+             np.random.rand(number_of_polyhedra) * cols)
+        )
+        hulls = [ConvexHull(centre + (np.random.rand(10, 3) - 0.5) * 16) for centre in centres]
+        boxes = np.zeros((number_of_polyhedra, 4), dtype=np.int64)
+        for i, hull in enumerate(hulls):
+            low, high = np.min(hull.points, axis=0), np.max(hull.points, axis=0)
+            boxes[i] = [max(int(low[1]), 0), min(int(high[1]) + 1, rows),
+                        max(int(low[2]), 0), min(int(high[2]) + 1, cols)]
+        self.assertGreater(np.sum((boxes[:, 1] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 2])), rows * cols)
+        ray_directions = np.tile([1.0, 0.0, 0.0], (number_of_polyhedra, 1))
+        planes = np.ascontiguousarray(np.concatenate([hull.equations for hull in hulls]))
+        plane_offsets = np.concatenate(([0], np.cumsum([len(hull.equations) for hull in hulls])))
+        weights = np.random.rand(number_of_polyhedra)
+        weights[0] = np.inf
+
+        expected = np.zeros((rows, cols))
+        expected_lengths = np.zeros((number_of_polyhedra,))
+        for i, hull in enumerate(hulls):
+            r0, r1, c0, c1 = boxes[i]
+            clip_lengths = utils._clip_line_with_convex_polyhedron(
+                np.ascontiguousarray(pixel_coordinates[r0:r1, c0:c1].reshape(-1, 3)),
+                ray_directions[i],
+                np.ascontiguousarray(-hull.equations[:, 0:3] * hull.equations[:, 3:4]),
+                np.ascontiguousarray(hull.equations[:, 0:3]),
+            )
+            expected_lengths[i] = np.sum(clip_lengths)
+            if i > 0:
+                expected[r0:r1, c0:c1] += weights[i] * clip_lengths.reshape(r1 - r0, c1 - c0)
+
+        for number_of_threads in (1, 3):
+            frame = np.zeros((rows, cols), dtype=np.float32)
+            projected_lengths = utils._project_convex_polyhedra(
+                pixel_coordinates, boxes, ray_directions, planes, plane_offsets, weights, number_of_threads, frame
+            )
+            self.assertTrue(np.allclose(projected_lengths, expected_lengths))
+            self.assertTrue(np.allclose(frame, expected, atol=1e-5))
+
     def test_lab_strain_to_B_matrix(self):
         U = Rotation.random().as_matrix()
         strain_tensor = (np.random.rand(3, 3) - 0.5) * 1e-2  # random strain tensor
@@ -180,6 +312,17 @@ class TestUtils(unittest.TestCase):
         eps2 = utils._b_to_epsilon(B, B0)
         self.assertTrue(np.allclose(eps1, eps2))
 
+    def test_set_precision(self):
+        self.addCleanup(utils.set_precision, utils.get_precision())
+        utils.set_precision("float32")
+        self.assertEqual(utils.get_precision(), np.float32)
+        array = utils._as_precision(np.zeros((3,), dtype=np.float32))
+        self.assertIs(utils._as_precision(array), array)
+        utils.set_precision(np.float64)
+        self.assertEqual(utils._as_precision(array).dtype, np.float64)
+        with self.assertRaises(ValueError):
+            utils.set_precision("float16")
+
     def test_get_misorientations(self):
         orientations = np.zeros((2, 3, 3))
         orientations[0, :, :] = np.eye(3)
@@ -12,6 +12,7 @@ import numpy as np
 import dill
 from scipy.spatial import ConvexHull, HalfspaceIntersection
 from scipy.optimize import linprog
+from xrd_simulator import utils
 
 
 class Beam:
@@ -145,6 +146,62 @@ class Beam:
         else:
             return None
 
+    def _intersect_tetrahedra(self, tetrahedra, volumes=None):
+        """Compute the beam intersection with a batch of tetrahedra.
+
+        Tetrahedra fully contained by the beam are their own intersection. The remaining tetrahedra are clipped by
+        the beam halfspaces at once, see :func:`xrd_simulator.utils._clip_tetrahedra`. Tetrahedra for which the
+        batched clipping fails are intersected one by one using :meth:`intersect`.
+
+        Args:
+            tetrahedra (:obj:`numpy array`): Vertices of the tetrahedra ``shape=(n,4,3)``.
+            volumes (:obj:`numpy array`): Volumes of the tetrahedra ``shape=(n,)``, used for the tetrahedra fully
+                contained by the beam. Defaults to None, in which case these are computed from the vertices.
+
+        Returns:
+            volumes (:obj:`numpy array`) intersection volumes, zero for tetrahedra not intersecting the beam,
+            ``shape=(n,)``, vertices (:obj:`numpy array`) flat buffer of the intersection vertices ``shape=(N,3)``
+            and vertex_offsets (:obj:`numpy array`) offsets into ``vertices`` of each intersection ``shape=(n+1,)``.
+
+        """
+        tetrahedra = np.ascontiguousarray(tetrahedra, dtype=np.float64).reshape(-1, 4, 3)
+        distances = tetrahedra.dot(self.halfspaces[:, 0:3].T) + self.halfspaces[:, 3]
+        contained = np.all(distances < 0, axis=(1, 2))
+        clipped = np.where(~contained)[0]
+
+        tolerance = 1e-9 * max(1.0, np.max(np.abs(tetrahedra), initial=0.0))
+        clipped_volumes, _, clipped_vertices, clipped_offsets = utils._clip_tetrahedra(
+            tetrahedra[clipped], self.halfspaces, tolerance
+        )
+        for i in np.where(clipped_volumes < 0)[0]:
+            region = self.intersect(tetrahedra[clipped[i]])
+            clipped_volumes[i] = 0 if region is None else region.volume
+            region_vertices = np.zeros((0, 3)) if region is None else region.points[region.vertices]
+            clipped_vertices = np.concatenate(
+                (clipped_vertices[: clipped_offsets[i]], region_vertices, clipped_vertices[clipped_offsets[i + 1] :])
+            )
+            clipped_offsets[i + 1 :] += len(region_vertices) - (clipped_offsets[i + 1] - clipped_offsets[i])
+
+        intersection_volumes = np.zeros((tetrahedra.shape[0],))
+        if volumes is None:
+            a, b, c = (tetrahedra[contained, 1:] - tetrahedra[contained, 0:1]).transpose(1, 0, 2)
+            intersection_volumes[contained] = np.abs(np.sum(np.cross(a, b) * c, axis=1)) / 6.0
+        else:
+            intersection_volumes[contained] = volumes[contained]
+        intersection_volumes[clipped] = clipped_volumes
+
+        vertex_counts = np.full((tetrahedra.shape[0],), 4, dtype=np.int64)
+        vertex_counts[clipped] = np.diff(clipped_offsets)
+        vertex_offsets = np.concatenate(([0], np.cumsum(vertex_counts)))
+        vertices = np.zeros((vertex_offsets[-1], 3))
+        contained_index = vertex_offsets[:-1][contained][:, np.newaxis] + np.arange(4)
+        vertices[contained_index.flatten()] = tetrahedra[contained].reshape(-1, 3)
+        clipped_index = np.repeat(
+            vertex_offsets[clipped] - clipped_offsets[:-1], vertex_counts[clipped]
+        ) + np.arange(clipped_offsets[-1])
+        vertices[clipped_index] = clipped_vertices
+        return intersection_volumes, vertices, vertex_offsets
+
     def save(self, path):
         """Save the xray beam to disc (via pickling).
 
@@ -232,16 +289,7 @@ class Beam:
         """
 
         inverse_rigid_body_motion = rigid_body_motion.inverse()
-
-        dx = np.min(sphere_radius) / 2.0
-        translation = np.abs(rigid_body_motion.translation / dx)
-        number_of_sampling_points = int(
-            np.max(
-                [np.max(translation), np.degrees(rigid_body_motion.rotation_angle), 2]
-            )
-            + 1
-        )
-        sample_times = np.linspace(0, 1, number_of_sampling_points)
+        sample_times = self._get_proximity_sample_times(sphere_radius, rigid_body_motion)
 
         R = sphere_radius.reshape(1, sphere_radius.shape[0])
         not_candidates = np.zeros((len(sample_times), R.shape[1]), dtype=bool)
@@ -258,6 +306,59 @@ class Beam:
 
         return ~not_candidates, sample_times
 
+    def _get_proximity_sample_times(self, sphere_radius, rigid_body_motion):
+        """Times at which to sample a motion such that the translation moves spheres by at most half the smallest
+        radius, and the rotation is at most 1 degree, between samples, see :meth:`_get_candidate_spheres`."""
+        dx = np.min(sphere_radius) / 2.0
+        translation = np.abs(rigid_body_motion.translation / dx)
+        number_of_sampling_points = int(
+            np.max(
+                [np.max(translation), np.degrees(rigid_body_motion.rotation_angle), 2]
+            )
+            + 1
+        )
+        return np.linspace(0, 1, number_of_sampling_points)
+
+    def _get_candidate_elements(
+        self,
+        sphere_tree,
+        rigid_body_motion,
+        sample_times,
+        rotation=np.eye(3),
+        translation=np.zeros((3,)),
+    ):
+        """Mask spheres of a spatial index which come close to the beam at any of a set of times of a motion.
+
+        The spheres of the index are given in a sample frame which maps to the lab frame, at time=0 of the motion, as
+        x_lab = rotation.dot(x_sample) + translation. Instead of moving the spheres, the beam halfspaces are mapped
+        to the sample frame at each time, such that the index is reused for any motion of the sample. The spheres are
+        checked as in :meth:`_get_candidate_spheres`.
+
+        Args:
+            sphere_tree (:obj:`xrd_simulator.mesh._SphereTree`): Spatial index of the spheres in the sample frame.
+            rigid_body_motion (:obj:`xrd_simulator.motion.RigidBodyMotion`): Rigid body motion object describing the
+                polycrystal transformation as a function of time.
+            sample_times (:obj:`numpy array`): Times of the motion at which to check the spheres.
+            rotation (:obj:`numpy array`): Rotation from the sample to the lab frame ``shape=(3,3)``.
+            translation (:obj:`numpy array`): Translation from the sample to the lab frame ``shape=(3,)``.
+
+        Returns:
+            (:obj:`numpy array`) boolean mask, True for spheres which may intersect the beam, ``shape=(n,)``.
+
+        """
+        normals, offsets = self.halfspaces[:, 0:3], self.halfspaces[:, 3]
+        mask = np.zeros((len(sphere_tree.order),), dtype=bool)
+        for time in sample_times:
+            # x_lab(time) = R (rotation x_sample + translation - origin) + origin + time * motion translation
+            R = rigid_body_motion.rotator.get_rotation_matrix(rigid_body_motion.rotation_angle * time)
+            origin = rigid_body_motion.origin
+            shift = R.dot(translation - origin) + origin + time * rigid_body_motion.translation
+            halfspaces = np.zeros(self.halfspaces.shape)
+            halfspaces[:, 0:3] = normals.dot(R.dot(rotation))
+            halfspaces[:, 3] = normals.dot(shift) + offsets
+            mask[sphere_tree.query(halfspaces)] = True
+        return mask
+
     def _get_proximity_intervals(
         self, sphere_centres, sphere_radius, rigid_body_motion
     ):
@@ -266,6 +367,11 @@ class Beam:
         This method can be used as a pre-checker before running the `intersect()` method on a polyhedral
         set. This avoids wasting compute resources on polyhedra which clearly do not intersect the beam.
 
+        For pure rotations the intervals are exact, see
+        :meth:`_get_analytic_proximity_intervals`. Otherwise, the intervals are extracted from the runs of consecutive
+        sample times at which the spheres are candidates, see :meth:`_get_candidate_spheres`, and are padded by one
+        sample time on each side.
+
         Args:
             sphere_centres (:obj:`numpy array`): Centroids of a spheres ``shape=(3,n)``.
             sphere_radius (:obj:`numpy array`): Radius of a spheres ``shape=(n,)``.
@@ -273,48 +379,117 @@ class Beam:
                 polycrystal transformation as a function of time on the domain time=[0,1].
 
         Returns:
-            (:obj:`list` of :obj:`list` of :obj:`list`): Parametric ranges in which the spheres
-            has an intersection with the beam. [(:obj:`None`)] if no intersection exist in ```time=[0,1]```.
-            the entry at ```[i][j]``` is a list with two floats ```[t_1,t_2]``` and gives the j:th
-            intersection interval of sphere number i with the beam.
+            (:obj:`tuple` of :obj:`numpy array`): The sphere indices, start times and end times of the intervals,
+            each of ``shape=(m,)``. The intervals are sorted by sphere and then by time, spheres with no intersection
+            in ```time=[0,1]``` have no intervals.
 
         """
-        # TODO: better unit tests.
+        if np.allclose(rigid_body_motion.translation, 0):
+            return self._get_analytic_proximity_intervals(
+                sphere_centres, sphere_radius, rigid_body_motion
+            )
+
         candidate_mask, sample_times = self._get_candidate_spheres(
             sphere_centres, sphere_radius, rigid_body_motion
         )
 
-        all_intersections = []
-        for j in range(candidate_mask.shape[1]):
-            if np.sum(candidate_mask[:, j]) == 0:
-                merged_intersection = [None]
-                all_intersections.append(merged_intersection)
-            else:
-                counting = False
-                merged_intersection = []
-
-                i = 0
-                if candidate_mask[i, j] and not counting:
-                    merged_intersection.append([sample_times[i], sample_times[i + 1]])
-                    counting = True
-
-                for i in range(1, candidate_mask.shape[0] - 1):
-
-                    if candidate_mask[i, j] and not counting:
-                        merged_intersection.append(
-                            [sample_times[i - 1], sample_times[i + 1]]
-                        )
-                        counting = True
-                    elif not candidate_mask[i, j] and counting:
-                        merged_intersection[-1][1] = sample_times[i + 1]
-                        counting = False
-
-                i = candidate_mask.shape[0] - 1
-                if candidate_mask[i, j] and not counting:
-                    merged_intersection.append([sample_times[i - 1], sample_times[i]])
-                elif candidate_mask[i, j] and counting:
-                    merged_intersection[-1][1] = sample_times[i]
-
-                all_intersections.append(merged_intersection)
-
-        return all_intersections
+        # Run-length encoding of the candidate mask of each sphere, runs start where the padded mask steps up and
+        # end where it steps down. Row major ordering keeps the starts and ends of each sphere paired and sorted.
+        padding = np.zeros((candidate_mask.shape[1], 1), dtype=np.int8)
+        steps = np.diff(
+            np.concatenate((padding, candidate_mask.T.astype(np.int8), padding), axis=1), axis=1
+        )
+        sphere_index, run_start = np.nonzero(steps == 1)
+        _, run_end = np.nonzero(steps == -1)
+
+        last = len(sample_times) - 1
+        start_times = sample_times[np.maximum(run_start - 1, 0)]
+        end_times = sample_times[np.minimum(run_end, last)]
+        return sphere_index, start_times, end_times
+
+    def _get_analytic_proximity_intervals(self, sphere_centres, sphere_radius, rigid_body_motion):
+        """Compute the exact parametric intervals in which spheres are not outside any beam halfspace, for a pure
+        rotation.
+
+        The signed distance of a sphere centre to a halfspace is of the form A + B sin(omega) + C cos(omega) in the
+        rotation angle omega. The times at which a sphere is fully outside a halfspace thus form an arc of at most
+        2 pi, which is found in closed form. The proximity intervals are the complement in time=[0,1] of the
+        union of these intervals over all halfspaces, such that the cost is independent of the motion and of the
+        sphere sizes. The test is the same as in :meth:`_get_candidate_spheres`, i.e a sphere with a signed distance
+        larger than its radius to any halfspace is rejected.
+
+        Args:
+            sphere_centres (:obj:`numpy array`): Centroids of a spheres ``shape=(n,3)``.
+            sphere_radius (:obj:`numpy array`): Radius of a spheres ``shape=(n,)``.
+            rigid_body_motion (:obj:`xrd_simulator.motion.RigidBodyMotion`): Rigid body motion object describing a
+                pure rotation (zero translation).
+
+        Returns:
+            (:obj:`tuple` of :obj:`numpy array`): The sphere indices, start times and end times of the intervals, see
+            :meth:`_get_proximity_intervals`.
+
+        """
+        centres = np.asarray(sphere_centres, dtype=np.float64).reshape(-1, 3)
+        radius = np.asarray(sphere_radius, dtype=np.float64).reshape(-1, 1)
+        normals, offsets = self.halfspaces[:, 0:3], self.halfspaces[:, 3]
+        rotation_angle = rigid_body_motion.rotation_angle
+
+        # With v = centre - origin and R(omega) = I + sin(omega) K + (1 - cos(omega)) K^2 the distance to
+        # halfspace j is A + B sin(omega) + C cos(omega) = A + rho cos(omega - alpha).
+        K, K2 = rigid_body_motion.rotator.K, rigid_body_motion.rotator.K2
+        origin = rigid_body_motion.origin
+        v = centres - origin
+        A = (v + v.dot(K2.T)).dot(normals.T) + normals.dot(origin) + offsets
+        B = v.dot(K.T).dot(normals.T)
+        C = -v.dot(K2.T).dot(normals.T)
+        rho = np.sqrt(B**2 + C**2)
+        alpha = np.arctan2(B, C)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(rho > 0, (radius - A) / rho, np.where(A > radius, -np.inf, np.inf))
+        # The sphere is outside for omega in (alpha - beta, alpha + beta), modulo 2 pi.
+        beta = np.where(ratio >= 1, -np.inf, np.where(ratio < -1, np.inf, np.arccos(np.clip(ratio, -1, 1))))
+        centre = np.mod(alpha, 2 * np.pi)
+        shifts = np.array([-2 * np.pi, 0, 2 * np.pi])
+        outside_start = (centre[:, :, np.newaxis] + shifts - beta[:, :, np.newaxis]) / rotation_angle
+        outside_end = (centre[:, :, np.newaxis] + shifts + beta[:, :, np.newaxis]) / rotation_angle
+
+        return self._get_interval_complements(
+            outside_start.reshape(len(centres), -1), outside_end.reshape(len(centres), -1)
+        )
+
+    def _get_interval_complements(self, start, end):
+        """Compute the complement, on time=[0,1], of the union of a set of intervals per sphere.
+
+        Args:
+            start (:obj:`numpy array`): Start times of the intervals of each sphere ``shape=(n,m)``, intervals with
+                a start larger than their end are empty.
+            end (:obj:`numpy array`): End times of the intervals of each sphere ``shape=(n,m)``.
+
+        Returns:
+            (:obj:`tuple` of :obj:`numpy array`): The sphere indices, start times and end times of the complement
+            intervals, sorted by sphere and time.
+
+        """
+        number_of_spheres = start.shape[0]
+        start, end = np.clip(start, -1, 2), np.clip(end, -1, 2)
+        empty = start > end
+        start, end = np.where(empty, 2, start), np.where(empty, 2, end)
+
+        # The intervals of sphere i are offset by 6*i such that all spheres can be merged in one pass, sentinel
+        # intervals before and after time=[0,1] delimit the complement of each sphere.
+        sentinels = np.array([[-1.0, 0.0], [1.0, 2.0]])
+        start = np.concatenate((start, np.broadcast_to(sentinels[:, 0], (number_of_spheres, 2))), axis=1)
+        end = np.concatenate((end, np.broadcast_to(sentinels[:, 1], (number_of_spheres, 2))), axis=1)
+        sphere_index = np.repeat(np.arange(number_of_spheres), start.shape[1])
+        offset = 6.0 * sphere_index
+        start, end = start.flatten() + offset, end.flatten() + offset
+
+        order = np.argsort(start, kind="stable")
+        start, end, sphere_index, offset = start[order], end[order], sphere_index[order], offset[order]
+        covered_until = np.maximum.accumulate(end)
+        gap = (start[1:] > covered_until[:-1]) & (sphere_index[1:] == sphere_index[:-1])
+        return (
+            sphere_index[1:][gap],
+            covered_until[:-1][gap] - offset[1:][gap],
+            start[1:][gap] - offset[1:][gap],
+        )
@@ -12,11 +12,15 @@ Below follows a detailed description of the detector class attributes and functi
 
 """
 
+import copy
 import numpy as np
-from xrd_simulator import utils
+from xrd_simulator import utils, parallel
+from xrd_simulator.scattering_unit import ScatteringUnitTable
+from scipy.spatial import ConvexHull
 import dill
-from scipy.signal import convolve2d
-from multiprocessing import Pool
+from numba import get_num_threads
+from scipy.ndimage import convolve1d
+from scipy.signal import choose_conv_method, convolve2d, fftconvolve
 
 
 class Detector:
@@ -40,7 +44,8 @@ class Detector:
         pixel_size_y (:obj:`float`): Pixel side length along ydhat (rectangular pixels) in units of microns.
         det_corner_0,det_corner_1,det_corner_2 (:obj:`numpy array`): Detector corner 3d coordinates ``shape=(3,)``.
             The origin of the detector is at det_corner_0.
-        frames (:obj:`list` of :obj:`list` of :obj:`scattering_unit.ScatteringUnit`): Analytical diffraction patterns which
+        frames (:obj:`list` of :obj:`scattering_unit.ScatteringUnitTable`): Analytical diffraction patterns, one table of
+            scattering units per frame. (A frame may also be given as a :obj:`list` of :obj:`scattering_unit.ScatteringUnit`.)
         zdhat,ydhat (:obj:`numpy array`): Detector basis vectors.
         normal (:obj:`numpy array`): Detector normal, fromed as the cross product: numpy.cross(self.zdhat, self.ydhat)
         zmax,ymax (:obj:`numpy array`): Detector width and height.
@@ -49,10 +54,31 @@ class Detector:
             z and y coordinates are assumed to be in local units of pixels. I.e point_spread_function(0, 0) returns the
             value of the pointspread function at the location of the point being spread. This is meant to model blurring
             due to detector optics. Defaults to a Gaussian with standard deviation 1.0 and mean at (z,y)=(0,0).
-
+        point_spread_subpixel_bins (:obj:`int`): Number of bins, along each of zdhat and ydhat, into which sub pixel hit
+            locations are quantised when rendering with ```method=centroid_with_scintillator```. The point spread function
+            is evaluated once per bin, such that the rendering cost does not depend on the cost of the point spread function.
+            Defaults to 16.
+        point_spread_convolution_method (:obj:`str`): How the point spread kernel is convolved with the rendered frames,
+            one of ```direct```, ```separable```, ```fft``` or ```auto```. With ```separable``` the kernel must be the outer
+            product of two vectors (such as the default Gaussian) and the frame is convolved by two 1D passes. With
+            ```auto``` separable kernels are convolved as ```separable``` and other kernels as ```direct``` or ```fft```
+            depending on the frame and kernel size. Defaults to ```auto```.
+        point_spread_tile_size (:obj:`int`): If not None the frames are divided into tiles of this side length in pixels and
+            only tiles holding non-zero pixels are convolved, speeding up the convolution of sparse frames. Defaults to None.
+        busy_times (:obj:`dict` of :obj:`float`): Time in seconds spent computing by each worker process, keyed by process
+            id, during the most recent call to :func:`render` with several processes, see
+            :attr:`xrd_simulator.parallel.WorkerPool.busy_times`. Useful to check the load balance of the rendering.
 
     """
 
+    # Renderers that render all scattering units of a frame in one call, the remaining renderers are called once per
+    # scattering unit.
+    _frame_renderers = (
+        "_render_centroids",
+        "_render_centroids_with_scintillator",
+        "_render_projections",
+    )
+
     def __init__(
         self, pixel_size_z, pixel_size_y, det_corner_0, det_corner_1, det_corner_2
     ):
@@ -73,6 +99,20 @@ class Detector:
         self.pixel_coordinates = self._get_pixel_coordinates()
 
         self._point_spread_kernel_shape = (5, 5)
+        self.point_spread_subpixel_bins = 16
+        self.point_spread_convolution_method = "auto"
+        self.point_spread_tile_size = None
+        self._point_spread_kernel_bank = None
+        self.busy_times = {}
+
+    def __setstate__(self, state):
+        # Detectors pickled by earlier versions lack the attributes added since, which are given their defaults.
+        state.setdefault("point_spread_subpixel_bins", 16)
+        state.setdefault("_point_spread_kernel_bank", None)
+        state.setdefault("point_spread_convolution_method", "auto")
+        state.setdefault("point_spread_tile_size", None)
+        state.setdefault("busy_times", {})
+        self.__dict__.update(state)
 
     def point_spread_function(self, z, y):
         return np.exp(-0.5 * (z * z + y * y) / (1.0 * 1.0))
@@ -109,6 +149,7 @@ class Detector:
         method="centroid",
         verbose=True,
         number_of_processes=1,
+        worker_pool=None,
     ):
         """Render a pixelated diffraction pattern onto the detector plane .
 
@@ -132,6 +173,8 @@ class Detector:
             verbose (:obj:`bool`): Prints progress. Defaults to True.
             number_of_processes (:obj:`int`): Optional keyword specifying the number of desired processes to use for diffraction
                 computation. Defaults to 1, i.e a single processes.
+            worker_pool (:obj:`xrd_simulator.parallel.WorkerPool`): Optional persistent pool of worker processes to use
+                for rendering, in which case number_of_processes is taken from the pool. Defaults to None.
         Returns:
             A pixelated frame as a (:obj:`numpy array`) with shape inferred form the detector geometry and
             pixel size.
@@ -140,6 +183,9 @@ class Detector:
 
         """
 
+        if worker_pool is not None:
+            number_of_processes = worker_pool.number_of_processes
+
         if verbose and number_of_processes != 1:
             raise NotImplemented(
                 "Verbose mode is not implemented for multiprocesses computations"
@@ -151,13 +197,13 @@ class Detector:
             frames_to_render = [frames_to_render]
 
         if method == "project":
-            renderer = self._projection_render
+            renderer = self._render_projections
             kernel = self._get_point_spread_function_kernel()
         elif method == "centroid":
-            renderer = self._centroid_render
+            renderer = self._render_centroids
             kernel = self._get_point_spread_function_kernel()
         elif method == "centroid_with_scintillator":
-            renderer = self._centroid_render_with_scintillator
+            renderer = self._render_centroids_with_scintillator
             kernel = None
         else:
             raise ValueError(
@@ -180,22 +226,34 @@ class Detector:
             )
         else:
             args = []
+            # One frame per task, such that frames are handed out dynamically to idle workers.
             for frames_bundle in np.array_split(
-                np.array(frames_to_render), number_of_processes
+                np.array(frames_to_render), len(frames_to_render)
             ):
                 args.append(
                     (
                         frames_bundle,
                         kernel,
-                        renderer,
+                        renderer.__name__,
                         lorentz,
                         polarization,
                         structure_factor,
                         verbose,
                     )
                 )
-            with Pool(number_of_processes) as p:  # TODO: better unit tests
-                nested_frame_bundles = p.map(self._render_and_convolve, args)
+            # The detector, with its frames, is sent to each worker once rather than once per bundle.
+            context = {"detector": self}
+            if worker_pool is None:
+                with parallel.WorkerPool(number_of_processes) as worker_pool:
+                    nested_frame_bundles = worker_pool._map(
+                        _render_frames_bundle, args, context
+                    )
+            else:
+                nested_frame_bundles = worker_pool._map(
+                    _render_frames_bundle, args, context
+                )
+            # Kept with the detector, as a pool started for this call is closed by now.
+            self.busy_times = dict(worker_pool.busy_times)
             rendered_frames = []
             for frames_bundle in nested_frame_bundles:
                 rendered_frames.extend(frames_bundle)
@@ -219,22 +277,29 @@ class Detector:
         rendered_frames = []
         for frame_index in frames_bundle:
             frame = np.zeros(
-                (self.pixel_coordinates.shape[0], self.pixel_coordinates.shape[1])
+                (self.pixel_coordinates.shape[0], self.pixel_coordinates.shape[1]),
+                dtype=utils.get_precision(),
             )
-            for si, scattering_unit in enumerate(self.frames[frame_index]):
-                if verbose:
-                    progress_bar_message = (
-                        "Rendering "
-                        + str(len(self.frames[frame_index]))
-                        + " scattering volumes unto the detector"
-                    )
-                    progress_fraction = float(si + 1) / len(self.frames[frame_index])
-                    utils._print_progress(
-                        progress_fraction, message=progress_bar_message
-                    )
+            if renderer.__name__ in self._frame_renderers:
+                # All scattering units of the frame are rendered at once.
                 renderer(
-                    scattering_unit, frame, lorentz, polarization, structure_factor
+                    self.frames[frame_index], frame, lorentz, polarization, structure_factor
                 )
+            else:
+                for si, scattering_unit in enumerate(self.frames[frame_index]):
+                    if verbose:
+                        progress_bar_message = (
+                            "Rendering "
+                            + str(len(self.frames[frame_index]))
+                            + " scattering volumes unto the detector"
+                        )
+                        progress_fraction = float(si + 1) / len(self.frames[frame_index])
+                        utils._print_progress(
+                            progress_fraction, message=progress_bar_message
+                        )
+                    renderer(
+                        scattering_unit, frame, lorentz, polarization, structure_factor
+                    )
             if kernel is not None:
                 frame = self._apply_point_spread_function(frame, kernel)
             rendered_frames.append(frame)
@@ -251,10 +316,67 @@ class Detector:
             infmask = np.isinf(frame)  # Due to approximate Lorentz factors
             frame[infmask] = 0
             if not np.all(frame == 0):
-                frame = convolve2d(frame, kernel, mode="same")
+                kernel = kernel.astype(frame.dtype)
+                if self.point_spread_tile_size is None:
+                    frame = self._convolve(frame, kernel)
+                else:
+                    frame = self._convolve_tiles(frame, kernel, self.point_spread_tile_size)
             frame[infmask] = np.inf
         return frame
 
+    def _convolve(self, frame, kernel):
+        """Convolve a frame with a point spread kernel, as scipy.signal.convolve2d(frame, kernel, mode="same"), using
+        the point_spread_convolution_method.
+        """
+        method = self.point_spread_convolution_method
+        if method not in ("auto", "direct", "separable", "fft"):
+            raise ValueError(
+                "No such point spread convolution method: "
+                + str(method)
+                + " exist, method should be one of auto, direct, separable or fft"
+            )
+        if method in ("auto", "separable"):
+            factors = _get_separable_factors(kernel)
+            if factors is not None:
+                column, row = factors
+                frame = convolve1d(frame, column, axis=0, mode="constant", cval=0)
+                return convolve1d(frame, row, axis=1, mode="constant", cval=0)
+            elif method == "separable":
+                raise ValueError("The point spread function kernel is not separable.")
+            method = choose_conv_method(frame, kernel, mode="same")
+        if method == "fft":
+            return fftconvolve(frame, kernel, mode="same")
+        return convolve2d(frame, kernel, mode="same")
+
+    def _convolve_tiles(self, frame, kernel, tile_size):
+        """Convolve a frame with a point spread kernel as :func:`_convolve`, but only over the tiles of the frame that
+        hold non-zero pixels.
+
+        Each such tile is padded by the half width of the kernel, convolved, and added to the output such that the
+        result equals the convolution of the full frame.
+        """
+        ha, hb = kernel.shape[0] // 2, kernel.shape[1] // 2
+        rows, cols = frame.shape
+        row_starts = np.arange(0, rows, tile_size)
+        col_starts = np.arange(0, cols, tile_size)
+        nonzero = np.add.reduceat(
+            np.add.reduceat(frame != 0, row_starts, axis=0), col_starts, axis=1
+        )
+        convolved = np.zeros_like(frame)
+        for i, j in np.argwhere(nonzero):
+            r0, r1 = row_starts[i], min(row_starts[i] + tile_size, rows)
+            c0, c1 = col_starts[j], min(col_starts[j] + tile_size, cols)
+            tile = np.zeros((r1 - r0 + 2 * ha, c1 - c0 + 2 * hb), dtype=frame.dtype)
+            tile[ha : ha + r1 - r0, hb : hb + c1 - c0] = frame[r0:r1, c0:c1]
+            tile = self._convolve(tile, kernel)
+            # Tile pixel (0, 0) is located at frame pixel (r0 - ha, c0 - hb).
+            R0, R1 = max(r0 - ha, 0), min(r1 + ha, rows)
+            C0, C1 = max(c0 - hb, 0), min(c1 + hb, cols)
+            convolved[R0:R1, C0:C1] += tile[
+                R0 - r0 + ha : R1 - r0 + ha, C0 - c0 + hb : C1 - c0 + hb
+            ]
+        return convolved
+
     def pixel_index_to_theta_eta(
         self,
         incoming_wavevector,
@@ -468,6 +590,13 @@ class Detector:
 
         return kernel / np.sum(kernel)
 
+    def _get_geometry(self):
+        """Shallow copy of the detector without frames and pixel coordinates, cheap to send to worker processes."""
+        detector = copy.copy(self)
+        detector.frames = []
+        detector.pixel_coordinates = None
+        return detector
+
     def _get_pixel_coordinates(self):
         zds = np.arange(0, self.zmax, self.pixel_size_z)
         yds = np.arange(0, self.ymax, self.pixel_size_y)
@@ -503,6 +632,41 @@ class Detector:
             else:
                 frame[row, col] += scattering_unit.volume * intensity_scaling_factor
 
+    def _render_centroids(
+        self, scattering_units, frame, lorentz, polarization, structure_factor
+    ):
+        """Render all scattering units of a frame as :func:`_centroid_render`, depositing the intensities of all
+        scattering units onto the detector at once.
+
+        Args:
+            scattering_units (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable` or :obj:`list` of
+                :obj:`xrd_simulator.scattering_unit.ScatteringUnit`): The scattering units of the frame.
+            frame (:obj:`numpy array`): Frame to render onto.
+
+        """
+        if not isinstance(scattering_units, ScatteringUnitTable):
+            if len(scattering_units) == 0:
+                return
+            scattering_units = ScatteringUnitTable.from_scattering_units(scattering_units)
+        zd, yd = scattering_units.zd, scattering_units.yd
+        rows = np.floor(zd / self.pixel_size_z)
+        cols = np.floor(yd / self.pixel_size_y)
+        mask = self.contains(zd, yd) & (rows < frame.shape[0]) & (cols < frame.shape[1])
+        if not np.any(mask):
+            return
+        intensity_scaling_factors = self._get_intensity_factors(
+            scattering_units, lorentz, polarization, structure_factor
+        )[mask]
+        intensities = np.where(
+            np.isinf(intensity_scaling_factors),
+            np.inf,
+            scattering_units.volume[mask] * intensity_scaling_factors,
+        )
+        pixel_index = rows[mask].astype(np.int64) * frame.shape[1] + cols[mask].astype(np.int64)
+        frame += np.bincount(
+            pixel_index, weights=intensities, minlength=frame.size
+        ).reshape(frame.shape)
+
     def _centroid_render_with_scintillator(
         self, scattering_unit, frame, lorentz, polarization, structure_factor
     ):
@@ -543,6 +707,110 @@ class Detector:
                     scattering_unit.volume * intensity_scaling_factor * drifted_kernel
                 )
 
+    def _render_centroids_with_scintillator(
+        self, scattering_units, frame, lorentz, polarization, structure_factor
+    ):
+        """Render all scattering units of a frame as :func:`_centroid_render_with_scintillator`, depositing the
+        intensities of all scattering units onto the detector at once.
+
+        The sub pixel hit locations are quantised into point_spread_subpixel_bins bins along zdhat and ydhat and the
+        drifted point spread kernels are taken from a precomputed bank, see :func:`_get_point_spread_kernel_bank`.
+
+        Args:
+            scattering_units (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable` or :obj:`list` of
+                :obj:`xrd_simulator.scattering_unit.ScatteringUnit`): The scattering units of the frame.
+            frame (:obj:`numpy array`): Frame to render onto.
+
+        """
+        if not isinstance(scattering_units, ScatteringUnitTable):
+            if len(scattering_units) == 0:
+                return
+            scattering_units = ScatteringUnitTable.from_scattering_units(scattering_units)
+        zd, yd = scattering_units.zd, scattering_units.yd
+        mask = self.contains(zd, yd)
+        if not np.any(mask):
+            return
+        intensity_scaling_factors = self._get_intensity_factors(
+            scattering_units, lorentz, polarization, structure_factor
+        )[mask]
+        volumes = scattering_units.volume[mask]
+
+        bank = self._get_point_spread_kernel_bank()
+        number_of_bins, _, window_rows, window_cols = bank.shape
+        a, b = self.point_spread_kernel_shape
+        zd_in_pixels = zd[mask] / self.pixel_size_z
+        yd_in_pixels = yd[mask] / self.pixel_size_y
+        rows, cols = np.floor(zd_in_pixels), np.floor(yd_in_pixels)
+        row_bins = np.minimum(((zd_in_pixels - rows) * number_of_bins).astype(np.int64), number_of_bins - 1)
+        col_bins = np.minimum(((yd_in_pixels - cols) * number_of_bins).astype(np.int64), number_of_bins - 1)
+        rows, cols = rows.astype(np.int64), cols.astype(np.int64)
+
+        rendered = np.zeros((frame.size,))
+        infinite_pixels = []
+        chunk_size = 65536
+        for start in range(0, len(rows), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            window_row_index = (rows[chunk, np.newaxis] - a // 2 - 1) + np.arange(window_rows)
+            window_col_index = (cols[chunk, np.newaxis] - b // 2 - 1) + np.arange(window_cols)
+            row_inside = (window_row_index >= 0) & (window_row_index < frame.shape[0])
+            col_inside = (window_col_index >= 0) & (window_col_index < frame.shape[1])
+            inside = row_inside[:, :, np.newaxis] & col_inside[:, np.newaxis, :]
+
+            # The drifted kernels are normalised over the part of the window that falls on the detector.
+            kernels = bank[row_bins[chunk], col_bins[chunk]] * inside
+            kernels /= np.sum(kernels, axis=(1, 2))[:, np.newaxis, np.newaxis]
+
+            pixel_index = (
+                window_row_index[:, :, np.newaxis] * frame.shape[1] + window_col_index[:, np.newaxis, :]
+            )
+            infinite = np.isinf(intensity_scaling_factors[chunk])
+            weights = np.where(infinite, 0, volumes[chunk] * intensity_scaling_factors[chunk])
+            kernels *= weights[:, np.newaxis, np.newaxis]
+            rendered += np.bincount(
+                pixel_index[inside], weights=kernels[inside], minlength=frame.size
+            )
+            if np.any(infinite):
+                infinite_pixels.append(pixel_index[infinite][inside[infinite]])
+
+        frame += rendered.reshape(frame.shape)
+        for pixel_index in infinite_pixels:
+            frame.flat[pixel_index] = np.inf
+
+    def _get_point_spread_kernel_bank(self):
+        """Render the point_spread_function, drifted to the centre of each sub pixel bin, onto the pixel window used by
+        :func:`_render_centroids_with_scintillator`.
+
+        The bank is kept with the detector and only recomputed when the point spread function, the kernel shape or the
+        number of sub pixel bins change.
+
+        Returns:
+            (:obj:`numpy array`) of unnormalised kernels ``shape=(m, m, 2*(a//2) + 3, 2*(b//2) + 3)``, where m is the
+                number of sub pixel bins and (a, b) the point_spread_kernel_shape. The kernel of bin (i, j) is found at
+                bank[i, j].
+
+        """
+        key = (
+            self.point_spread_function,
+            tuple(self.point_spread_kernel_shape),
+            self.point_spread_subpixel_bins,
+        )
+        if self._point_spread_kernel_bank is not None and self._point_spread_kernel_bank[0] == key:
+            return self._point_spread_kernel_bank[1]
+
+        a, b = self.point_spread_kernel_shape
+        number_of_bins = self.point_spread_subpixel_bins
+        bin_centres = (np.arange(number_of_bins) + 0.5) / number_of_bins
+        # Pixel centre coordinates of the window relative to the first pixel of the hit.
+        zg = np.arange(2 * (a // 2) + 3) - a // 2 - 1 + 0.5
+        yg = np.arange(2 * (b // 2) + 3) - b // 2 - 1 + 0.5
+        Z = zg[np.newaxis, np.newaxis, :, np.newaxis] - bin_centres[:, np.newaxis, np.newaxis, np.newaxis]
+        Y = yg[np.newaxis, np.newaxis, np.newaxis, :] - bin_centres[np.newaxis, :, np.newaxis, np.newaxis]
+        Z, Y = np.broadcast_arrays(Z, Y)
+        bank = np.asarray(self.point_spread_function(Z, Y), dtype=np.float64)
+
+        self._point_spread_kernel_bank = (key, bank)
+        return bank
+
     def _projection_render(
         self, scattering_unit, frame, lorentz, polarization, structure_factor
     ):
@@ -577,6 +845,91 @@ class Detector:
                         * self.pixel_size_y
                     )
 
+    def _render_projections(
+        self, scattering_units, frame, lorentz, polarization, structure_factor
+    ):
+        """Render all scattering units of a frame as :func:`_projection_render`, raytracing all scattering regions of
+        the frame in a single parallel call, see :func:`xrd_simulator.utils._project_convex_polyhedra`.
+
+        Args:
+            scattering_units (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable` or :obj:`list` of
+                :obj:`xrd_simulator.scattering_unit.ScatteringUnit`): The scattering units of the frame.
+            frame (:obj:`numpy array`): Frame to render onto.
+
+        """
+        if not isinstance(scattering_units, ScatteringUnitTable):
+            if len(scattering_units) == 0:
+                return
+            scattering_units = ScatteringUnitTable.from_scattering_units(scattering_units)
+        boxes, mask = self._get_projected_bounding_boxes(scattering_units)
+        if not np.any(mask):
+            return
+        projected_units = scattering_units.take(mask)
+        intensity_scaling_factors = self._get_intensity_factors(
+            scattering_units, lorentz, polarization, structure_factor
+        )[mask]
+        planes, plane_offsets = self._get_hull_planes(projected_units)
+        ray_directions = projected_units.scattered_wave_vector / np.linalg.norm(
+            projected_units.scattered_wave_vector, axis=1, keepdims=True
+        )
+
+        projected_lengths = utils._project_convex_polyhedra(
+            np.ascontiguousarray(self.pixel_coordinates, dtype=np.float64),
+            boxes[mask],
+            np.ascontiguousarray(ray_directions, dtype=np.float64),
+            planes,
+            plane_offsets,
+            intensity_scaling_factors * self.pixel_size_z * self.pixel_size_y,
+            get_num_threads(),
+            frame,
+        )
+
+        # The projection of these scattering_units did not hit any pixel centroids of the detector.
+        missed = projected_lengths == 0
+        if np.any(missed):
+            self._render_centroids(
+                projected_units.take(missed), frame, lorentz, polarization, structure_factor
+            )
+        for box in boxes[mask][~missed & np.isinf(intensity_scaling_factors)]:
+            frame[box[0] : box[1], box[2] : box[3]] = np.inf
+
+    def _get_hull_planes(self, scattering_units):
+        """Face planes of the convex hulls of all rows of a scattering unit table in a flat buffer.
+
+        The planes are computed for all rows at once, see :func:`xrd_simulator.utils._get_convex_polyhedra_planes`.
+        Rows for which this fails are handled one by one with :obj:`scipy.spatial.ConvexHull`.
+
+        Returns:
+            (:obj:`tuple`) with planes (:obj:`numpy array`) the hull equations ``shape=(M,4)`` and plane_offsets
+            (:obj:`numpy array`) offsets into planes of each row ``shape=(n+1,)``.
+
+        """
+        vertices = np.ascontiguousarray(scattering_units.vertices, dtype=np.float64)
+        vertex_offsets = np.asarray(scattering_units.vertex_offsets, dtype=np.int64)
+        tolerance = 1e-9 * max(1.0, np.max(np.abs(vertices), initial=0.0))
+        planes, slot_offsets, plane_counts = utils._get_convex_polyhedra_planes(
+            vertices, vertex_offsets, tolerance
+        )
+
+        found = plane_counts >= 0
+        failed = np.where(~found)[0]
+        equations = [
+            ConvexHull(vertices[vertex_offsets[i] : vertex_offsets[i + 1]]).equations for i in failed
+        ]
+        plane_counts[failed] = [len(e) for e in equations]
+        plane_offsets = np.concatenate(([0], np.cumsum(plane_counts)))
+
+        # Gather the planes found by the batched computation from their reserved slots.
+        hull_planes = np.zeros((plane_offsets[-1], 4))
+        found_counts = plane_counts[found]
+        within = np.arange(np.sum(found_counts)) - np.repeat(np.cumsum(found_counts) - found_counts, found_counts)
+        hull_planes[np.repeat(plane_offsets[:-1][found], found_counts) + within] = planes[
+            np.repeat(slot_offsets[:-1][found], found_counts) + within
+        ]
+        for i, e in zip(failed, equations):
+            hull_planes[plane_offsets[i] : plane_offsets[i + 1]] = e
+        return hull_planes, plane_offsets
+
     def _get_intensity_factor(
         self, scattering_unit, lorentz, polarization, structure_factor
     ):
@@ -599,6 +952,32 @@ class Detector:
 
         return intensity_factor
 
+    def _get_intensity_factors(
+        self, scattering_units, lorentz, polarization, structure_factor
+    ):
+        """Intensity factors, see :func:`_get_intensity_factor`, of all rows of a scattering unit table.
+
+        The factors are computed for all rows at once and kept with the table, such that frames are not recomputed
+        when rendered again.
+
+        """
+        intensity_factors = np.ones((len(scattering_units),))
+        if lorentz:
+            intensity_factors *= scattering_units.lorentz_factor
+        if polarization:
+            intensity_factors *= scattering_units.polarization_factor
+        if structure_factor:
+            for phase_index in np.unique(scattering_units.phase_index):
+                if scattering_units.phases[phase_index].structure_factors is None:
+                    raise ValueError(
+                        "Structure factors have not been set, .cif file is required at sample instantiation."
+                    )
+            intensity_factors *= (
+                scattering_units.real_structure_factor**2
+                + scattering_units.imaginary_structure_factor**2
+            )
+        return intensity_factors
+
     def _detector_coordinate_to_pixel_index(self, zd, yd):
         row_index = int(zd / self.pixel_size_z)
         col_index = int(yd / self.pixel_size_y)
@@ -647,3 +1026,65 @@ class Detector:
         max_col_indx = np.min([max_col_indx + 1, int(self.ymax / self.pixel_size_y)])
 
         return min_row_indx, max_row_indx, min_col_indx, max_col_indx
+
+    def _get_projected_bounding_boxes(self, scattering_units):
+        """Compute the bounding detector pixel indices of the projections of all rows of a scattering unit table,
+        as in :func:`_get_projected_bounding_box`.
+
+        Returns:
+            (:obj:`tuple`) with boxes (:obj:`numpy array`) of pixel indices (row_min, row_max, col_min, col_max)
+            ``shape=(n,4)`` and a mask (:obj:`numpy array`) which is False for rows projecting outside the detector.
+
+        """
+        vertex_counts = np.diff(scattering_units.vertex_offsets)
+        projected_vertices = self.get_intersection(
+            np.repeat(scattering_units.scattered_wave_vector, vertex_counts, axis=0),
+            scattering_units.vertices,
+        )
+        starts = scattering_units.vertex_offsets[:-1]
+        min_zd = np.maximum(np.minimum.reduceat(projected_vertices[:, 0], starts), 0)
+        max_zd = np.minimum(np.maximum.reduceat(projected_vertices[:, 0], starts), self.zmax)
+        min_yd = np.maximum(np.minimum.reduceat(projected_vertices[:, 1], starts), 0)
+        max_yd = np.minimum(np.maximum.reduceat(projected_vertices[:, 1], starts), self.ymax)
+        mask = (min_zd <= max_zd) & (min_yd <= max_yd)
+
+        boxes = np.zeros((len(scattering_units), 4), dtype=np.int64)
+        boxes[:, 0] = (min_zd / self.pixel_size_z).astype(np.int64)
+        boxes[:, 1] = np.minimum(
+            (max_zd / self.pixel_size_z).astype(np.int64) + 1, int(self.zmax / self.pixel_size_z)
+        )
+        boxes[:, 2] = (min_yd / self.pixel_size_y).astype(np.int64)
+        boxes[:, 3] = np.minimum(
+            (max_yd / self.pixel_size_y).astype(np.int64) + 1, int(self.ymax / self.pixel_size_y)
+        )
+        boxes[~mask] = 0
+        return boxes, mask
+
+
+def _get_separable_factors(kernel):
+    """Factor a 2D kernel into the outer product of a column and a row vector.
+
+    Returns:
+        (:obj:`tuple`) with column and row (:obj:`numpy array`) such that numpy.outer(column, row) equals the kernel,
+        or None if the kernel is not separable.
+
+    """
+    u, singular_values, vt = np.linalg.svd(kernel.astype(np.float64))
+    if len(singular_values) > 1 and singular_values[1] > 1e-10 * singular_values[0]:
+        return None
+    scale = np.sqrt(singular_values[0])
+    return (u[:, 0] * scale).astype(kernel.dtype), (vt[0, :] * scale).astype(kernel.dtype)
+
+
+def _render_frames_bundle(args):
+    """Render and convolve a bundle of frames of the detector in a worker process.
+
+    The detector is read from the worker context, see :meth:`xrd_simulator.parallel.WorkerPool._map`, and the
+    renderer is passed by name as bound methods would otherwise pickle the detector with each task.
+
+    """
+    detector = parallel._get_worker_state()[1]["detector"]
+    frames_bundle, kernel, renderer_name, *options = args
+    return detector._render_and_convolve(
+        (frames_bundle, kernel, getattr(detector, renderer_name), *options)
+    )
@@ -4,6 +4,8 @@ for the advanced user, access to these functions may be of interest.
 """
 
 import numpy as np
+from numba import njit, prange
+from xrd_simulator import utils
 
 
 def get_G(U, B, G_hkl):
@@ -23,7 +25,7 @@ def get_G(U, B, G_hkl):
 
     """
 
-    return np.float32(np.matmul(np.matmul(U, B), G_hkl.T))
+    return utils._as_precision(np.matmul(np.matmul(U, B), G_hkl.T))
 
 
 def get_bragg_angle(G, wavelength):
@@ -85,6 +87,83 @@ def find_solutions_to_tangens_half_angle_equation(
 
     """
 
+    s1, s2 = _get_tangens_half_angle_roots(G_0, rho_0_factor, rho_1_factor, rho_2_factor)
+    t1 = 2 * np.arctan(s1) / delta_omega
+    del s1
+    indices_t1 = np.array(np.where(np.logical_and(t1 >= 0, t1 <= 1)))
+    values_t1 = t1[indices_t1[0, :], indices_t1[1, :]]
+
+    del t1
+    t2 = 2 * np.arctan(s2) / delta_omega
+    del s2, delta_omega
+    indices_t2 = np.array(np.where(np.logical_and(t2 >= 0, t2 <= 1)))
+    values_t2 = t2[indices_t2[0, :], indices_t2[1, :]]
+    del t2
+    return np.concatenate((indices_t1, indices_t2), axis=1), np.concatenate(
+        (values_t1, values_t2), axis=0
+    )
+
+
+def find_rotation_angles(G_0, rho_0_factor, rho_1_factor, rho_2_factor, omega_range):
+    """Find all rotation angles, :obj:`omega`, within a range for which the diffraction vectors fulfill the Laue equations.
+
+    This solves equation (1) of :func:`find_solutions_to_tangens_half_angle_equation` with :obj:`t \\Delta \\omega`
+    replaced by the rotation angle :obj:`omega`, for a pure rotation over an arbitrary angular range. Solutions are
+    wrapped by multiples of 2 pi into the range, such that ranges wider than pi, e.g full 360 degree rotation scans,
+    are solved in a single pass.
+
+    Args:
+        G_0 (:obj:`numpy array`): The non-rotated scattering vectors for all tetrahedra of a given phase.
+            dimensions --> (tetrahedra,coordinates,hkl_planes)
+        rho_0_factor,rho_1_factor,rho_2_factor (:obj:`float`): Factors to compute the \\rho_0,\\rho_1 and \\rho_2 of
+            equation (1) of :func:`find_solutions_to_tangens_half_angle_equation`.
+        omega_range (:obj:`tuple` of :obj:`float`): Start and end (radians) of the rotation range, at most 2 pi wide.
+
+    Returns:
+        (:obj:`tuple` of :obj:`numpy.array`): A tuple containing two numpy arrays:
+        - indices: 2D numpy array of (tetrahedron, hkl) indices of the solutions.
+        - values: 1D numpy array of rotation angles in radians, on the interval [omega_range[0], omega_range[1]).
+
+    """
+    omega_start, omega_end = omega_range
+    assert omega_end - omega_start <= 2 * np.pi, "The rotation range must be at most 2 pi wide."
+
+    if len(G_0.shape) == 2:
+        G_0 = G_0[np.newaxis, :, :]
+
+    all_indices, all_values = [], []
+    for s in _get_tangens_half_angle_roots(G_0, rho_0_factor, rho_1_factor, rho_2_factor):
+        omega = 2 * np.arctan(s)
+        indices = np.array(np.where(np.isfinite(omega)))
+        omega = omega[indices[0, :], indices[1, :]]
+
+        # Equation (2) is ill conditioned for rotations close to pi, where its leading coefficient vanishes,
+        # the angles are therefore refined by a Newton step on equation (1) in double precision.
+        G = np.float64(G_0[indices[0, :], :, indices[1, :]])
+        rho_0 = G.dot(np.float64(rho_0_factor))
+        rho_1 = G.dot(np.float64(rho_1_factor))
+        rho_2 = G.dot(np.float64(rho_2_factor)) + np.sum(G * G, axis=1) / 2.0
+        derivative = rho_1 * np.cos(omega) - rho_0 * np.sin(omega)
+        residual = rho_0 * np.cos(omega) + rho_1 * np.sin(omega) + rho_2
+        omega = omega - np.divide(
+            residual, derivative, out=np.zeros_like(omega), where=derivative != 0
+        )
+
+        omega = omega_start + np.mod(omega - omega_start, 2 * np.pi)
+        in_range = omega < omega_end
+        all_indices.append(indices[:, in_range])
+        all_values.append(omega[in_range])
+    return np.concatenate(all_indices, axis=1), np.concatenate(all_values, axis=0)
+
+
+def _get_tangens_half_angle_roots(G_0, rho_0_factor, rho_1_factor, rho_2_factor):
+    """Compute the two roots, s, of equation (2) of :func:`find_solutions_to_tangens_half_angle_equation`.
+
+    Returns:
+        (:obj:`tuple` of :obj:`numpy.array`) the roots of ``shape=(tetrahedra,hkl_planes)``, nan where no real
+        root exists.
+
+    """
     if (
         len(G_0.shape) == 2
     ):  # We add an empty dimension first in case it's a single tet G_0 being passed.
@@ -111,18 +190,236 @@ def find_solutions_to_tangens_half_angle_equation(
     rootval[rootval < 0] = np.nan
     s1 = leadingterm + np.sqrt(rootval)
     s2 = leadingterm - np.sqrt(rootval)
-    del rootval, leadingterm
-    t1 = 2 * np.arctan(s1) / delta_omega
-    del s1
-    indices_t1 = np.array(np.where(np.logical_and(t1 >= 0, t1 <= 1)))
-    values_t1 = t1[indices_t1[0, :], indices_t1[1, :]]
+    return s1, s2
 
-    del t1
-    t2 = 2 * np.arctan(s2) / delta_omega
-    del s2, delta_omega
-    indices_t2 = np.array(np.where(np.logical_and(t2 >= 0, t2 <= 1)))
-    values_t2 = t2[indices_t2[0, :], indices_t2[1, :]]
-    del t2
-    return np.concatenate((indices_t1, indices_t2), axis=1), np.concatenate(
-        (values_t1, values_t2), axis=0
+
+def find_reflections(
+    U,
+    B,
+    miller_indices,
+    rho_0_factor,
+    rho_1_factor,
+    rho_2_factor,
+    delta_omega=None,
+    omega_range=None,
+):
+    """Find all diffraction vectors, of a set of crystals, that fulfill the time dependent Laue equations.
+
+    This fuses :func:`get_G` with the solution of equation (1) of :func:`find_solutions_to_tangens_half_angle_equation`
+    and the selection of solutions within the motion, per crystal, in a compiled parallel loop. Only the valid
+    solutions are stored, such that the memory use is independent of the number of crystals and Miller indices.
+    The equation is solved in double precision and the roots are refined by a Newton step on equation (1). The
+    solutions are returned in the precision set by :func:`xrd_simulator.utils.set_precision`.
+
+    Exactly one of ``delta_omega`` and ``omega_range`` should be given.
+
+    Args:
+        U (:obj:`numpy array`): Orientation matrices of ``shape=(N,3,3)`` (unitary).
+        B (:obj:`numpy array`): Reciprocal to grain coordinate mapping matrices of ``shape=(N,3,3)``.
+        miller_indices (:obj:`numpy array`): Miller indices, i.e the h,k,l integers (``shape=(n,3)``).
+        rho_0_factor,rho_1_factor,rho_2_factor (:obj:`numpy array`): Factors to compute the \\rho_0,\\rho_1 and
+            \\rho_2 of equation (1) of :func:`find_solutions_to_tangens_half_angle_equation`, ``shape=(3,)``.
+        delta_omega (:obj:`float`): Radians of rotation of a motion, solutions are given as the parametric time in
+            the range [0,1] of the motion.
+        omega_range (:obj:`tuple` of :obj:`float`): Start and end (radians) of a rotation range at most 2 pi wide,
+            solutions are given as rotation angles on the interval [omega_range[0], omega_range[1]), as in
+            :func:`find_rotation_angles`.
+
+    Returns:
+        (:obj:`tuple` of :obj:`numpy.array`): A tuple containing four numpy arrays:
+        - crystal_indices: 1D numpy array of crystal indices of the solutions.
+        - hkl_indices: 1D numpy array of Miller index indices of the solutions.
+        - values: 1D numpy array of times, or rotation angles, of the solutions.
+        - G_0: 2D numpy array of the non-rotated diffraction vectors of the solutions ``shape=(n,3)``.
+
+    """
+    return _find_reflections(
+        np.matmul(U, B), miller_indices, rho_0_factor, rho_1_factor, rho_2_factor, delta_omega, omega_range
+    )
+
+
+def _find_reflections(UB, miller_indices, rho_0_factor, rho_1_factor, rho_2_factor, delta_omega, omega_range):
+    """:func:`find_reflections` given the products of the orientation and B matrices, UB, ``shape=(N,3,3)``."""
+    if omega_range is None:
+        lower_bound, upper_bound, wrap = 0.0, float(delta_omega), False
+    else:
+        assert omega_range[1] - omega_range[0] <= 2 * np.pi, "The rotation range must be at most 2 pi wide."
+        lower_bound, upper_bound, wrap = float(omega_range[0]), float(omega_range[1]), True
+
+    UB = np.ascontiguousarray(UB, dtype=np.float64).reshape(-1, 3, 3)
+    hkl = np.ascontiguousarray(miller_indices, dtype=np.float64).reshape(-1, 3)
+    factors = np.ascontiguousarray(
+        [rho_0_factor, rho_1_factor, rho_2_factor], dtype=np.float64
+    ).reshape(3, 3)
+
+    counts = _count_reflections(UB, hkl, factors, lower_bound, upper_bound, wrap)
+    offsets = np.concatenate(([0], np.cumsum(counts.sum(axis=1))))
+    crystal_indices, hkl_indices, values, G_0 = _fill_reflections(
+        UB, hkl, factors, lower_bound, upper_bound, wrap, counts, offsets
+    )
+    if omega_range is None:
+        values /= delta_omega
+    return crystal_indices, hkl_indices, utils._as_precision(values), utils._as_precision(G_0)
+
+
+@njit(cache=True)
+def _get_rotation_angles(hkl_h, hkl_k, hkl_l, coefficients, range_constants, lower_bound, upper_bound, wrap):
+    """Solve equation (1) of :func:`find_solutions_to_tangens_half_angle_equation` for a single diffraction vector.
+
+    Roots, s, of equation (2) which are clearly outside of the range are rejected before being converted to angles
+    and refined by a Newton step on equation (1), see :func:`_select_rotation_angle`.
+
+    Args:
+        hkl_h, hkl_k, hkl_l (:obj:`float`): Miller indices.
+        coefficients (:obj:`numpy array`): Crystal coefficients of the rho's, see :func:`_get_crystal_coefficients`.
+
+    Returns:
+        (:obj:`tuple` of :obj:`float`) the two rotation angles, nan where no solution exists in the range.
+
+    """
+    rho_0 = coefficients[0, 0] * hkl_h + coefficients[0, 1] * hkl_k + coefficients[0, 2] * hkl_l
+    rho_1 = coefficients[1, 0] * hkl_h + coefficients[1, 1] * hkl_k + coefficients[1, 2] * hkl_l
+    rho_2 = (
+        coefficients[2, 0] * hkl_h
+        + coefficients[2, 1] * hkl_k
+        + coefficients[2, 2] * hkl_l
+        + coefficients[3, 0] * hkl_h * hkl_h
+        + coefficients[3, 1] * hkl_k * hkl_k
+        + coefficients[3, 2] * hkl_l * hkl_l
+        + coefficients[4, 0] * hkl_h * hkl_k
+        + coefficients[4, 1] * hkl_h * hkl_l
+        + coefficients[4, 2] * hkl_k * hkl_l
+    )
+    if not wrap and range_constants[6]:
+        # For ranges shorter than pi, equation (1) has a root in the range only if it changes sign over the range or
+        # has an extremum in it, i.e if its derivative changes sign, such that most diffraction vectors are
+        # rejected before solving for the roots.
+        f_lower = rho_0 * range_constants[2] + rho_1 * range_constants[3] + rho_2
+        f_upper = rho_0 * range_constants[4] + rho_1 * range_constants[5] + rho_2
+        df_lower = rho_1 * range_constants[2] - rho_0 * range_constants[3]
+        df_upper = rho_1 * range_constants[4] - rho_0 * range_constants[5]
+        if f_lower * f_upper > 0 and df_lower * df_upper > 0:
+            return np.nan, np.nan
+
+    # Equation (1) has real solutions if, and only if, rho_0^2 + rho_1^2 >= rho_2^2.
+    discriminant = rho_0 * rho_0 + rho_1 * rho_1 - rho_2 * rho_2
+    denominator = rho_2 - rho_0
+    if discriminant < 0 or denominator == 0:
+        return np.nan, np.nan
+    a = rho_1 / denominator
+    root = np.sqrt(discriminant) / np.abs(denominator)
+    omega_1 = _select_rotation_angle(
+        -a + root, rho_0, rho_1, rho_2, range_constants, lower_bound, upper_bound, wrap
+    )
+    omega_2 = _select_rotation_angle(
+        -a - root, rho_0, rho_1, rho_2, range_constants, lower_bound, upper_bound, wrap
+    )
+    return omega_1, omega_2
+
+
+@njit(cache=True)
+def _get_crystal_coefficients(UB, factors):
+    """Coefficients of the rho's of equation (1) of :func:`find_solutions_to_tangens_half_angle_equation` as
+    polynomials in the Miller indices of a crystal, i.e the rho factors mapped to Miller index space, (rows 0 to 2)
+    and the metric tensor, UB^T UB / 2, (rows 3 and 4) giving the squared norm of G, ``shape=(5,3)``."""
+    coefficients = np.zeros((5, 3))
+    coefficients[0:3] = factors.dot(UB)
+    metric = UB.T.dot(UB) / 2.0
+    coefficients[3, 0], coefficients[3, 1], coefficients[3, 2] = metric[0, 0], metric[1, 1], metric[2, 2]
+    coefficients[4, 0], coefficients[4, 1], coefficients[4, 2] = 2 * metric[0, 1], 2 * metric[0, 2], 2 * metric[1, 2]
+    return coefficients
+
+
+@njit(cache=True)
+def _get_range_constants(lower_bound, upper_bound):
+    """Constants of a rotation range used when solving for rotation angles, i.e the bounds on s = tan(omega / 2),
+    widened to leave slack for the Newton refinement, the cosines and sines of the bounds and a flag set if the range
+    is shorter than pi, ``shape=(7,)``."""
+    s_lower, s_upper = np.tan(lower_bound / 2.0), np.tan(upper_bound / 2.0)
+    return np.array(
+        [
+            s_lower - 1e-6 * (1 + np.abs(s_lower)),
+            s_upper + 1e-6 * (1 + np.abs(s_upper)),
+            np.cos(lower_bound),
+            np.sin(lower_bound),
+            np.cos(upper_bound),
+            np.sin(upper_bound),
+            upper_bound - lower_bound < np.pi,
+        ]
     )
+
+
+@njit(cache=True)
+def _select_rotation_angle(s, rho_0, rho_1, rho_2, range_constants, lower_bound, upper_bound, wrap):
+    """Convert a root, s, of equation (2) to a rotation angle in the range lower_bound <= omega <= upper_bound, or if
+    wrap, lower_bound <= omega < upper_bound after wrapping by 2 pi. Returns nan if the angle is outside the range."""
+    if not wrap:
+        # omega = 2 arctan(s) is increasing in s, such that the range can be checked on s, the bounds have some
+        # slack for the refinement below.
+        if s < range_constants[0] or s > range_constants[1]:
+            return np.nan
+    omega = 2 * np.arctan(s)
+
+    # Newton step on equation (1), which is well conditioned also for rotations close to pi.
+    derivative = rho_1 * np.cos(omega) - rho_0 * np.sin(omega)
+    if derivative != 0:
+        omega -= (rho_0 * np.cos(omega) + rho_1 * np.sin(omega) + rho_2) / derivative
+
+    if wrap:
+        omega = lower_bound + np.mod(omega - lower_bound, 2 * np.pi)
+        if omega < upper_bound:
+            return omega
+    elif omega >= lower_bound and omega <= upper_bound:
+        return omega
+    return np.nan
+
+
+@njit(parallel=True, cache=True)
+def _count_reflections(UB, hkl, factors, lower_bound, upper_bound, wrap):
+    """Count the solutions of :func:`find_reflections` per crystal and root, ``shape=(N,2)``."""
+    range_constants = _get_range_constants(lower_bound, upper_bound)
+    counts = np.zeros((UB.shape[0], 2), dtype=np.int64)
+    for i in prange(UB.shape[0]):
+        coefficients = _get_crystal_coefficients(UB[i], factors)
+        for j in range(hkl.shape[0]):
+            omega_1, omega_2 = _get_rotation_angles(
+                hkl[j, 0], hkl[j, 1], hkl[j, 2], coefficients, range_constants, lower_bound, upper_bound, wrap
+            )
+            if not np.isnan(omega_1):
+                counts[i, 0] += 1
+            if not np.isnan(omega_2):
+                counts[i, 1] += 1
+    return counts
+
+
+@njit(parallel=True, cache=True)
+def _fill_reflections(UB, hkl, factors, lower_bound, upper_bound, wrap, counts, offsets):
+    """Store the solutions of :func:`find_reflections`, per crystal the solutions of the first root precede
+    those of the second root, as in :func:`find_solutions_to_tangens_half_angle_equation`."""
+    number_of_reflections = offsets[-1]
+    crystal_indices = np.zeros((number_of_reflections,), dtype=np.int64)
+    hkl_indices = np.zeros((number_of_reflections,), dtype=np.int64)
+    values = np.zeros((number_of_reflections,))
+    G_0 = np.zeros((number_of_reflections, 3))
+    range_constants = _get_range_constants(lower_bound, upper_bound)
+    for i in prange(UB.shape[0]):
+        coefficients = _get_crystal_coefficients(UB[i], factors)
+        index_1 = offsets[i]
+        index_2 = offsets[i] + counts[i, 0]
+        for j in range(hkl.shape[0]):
+            omega_1, omega_2 = _get_rotation_angles(
+                hkl[j, 0], hkl[j, 1], hkl[j, 2], coefficients, range_constants, lower_bound, upper_bound, wrap
+            )
+            if not np.isnan(omega_1):
+                crystal_indices[index_1] = i
+                hkl_indices[index_1] = j
+                values[index_1] = omega_1
+                G_0[index_1] = UB[i].dot(hkl[j])
+                index_1 += 1
+            if not np.isnan(omega_2):
+                crystal_indices[index_2] = i
+                hkl_indices[index_2] = j
+                values[index_2] = omega_2
+                G_0[index_2] = UB[i].dot(hkl[j])
+                index_2 += 1
+    return crystal_indices, hkl_indices, values, G_0
@@ -22,6 +22,20 @@ import meshio
 from xrd_simulator import utils
 from xrd_simulator import motion
 
+# Mesh arrays stored by TetraMesh._save_hdf5(), all other quantities are derived from these.
+_HDF5_ARRAYS = (
+    "coord",
+    "enod",
+    "dof",
+    "efaces",
+    "enormals",
+    "ecentroids",
+    "eradius",
+    "espherecentroids",
+    "evolumes",
+    "centroid",
+)
+
 
 class TetraMesh(object):
     """Defines a 3D tetrahedral mesh with associated geometry data such face normals, centroids, etc.
@@ -64,6 +78,7 @@ class TetraMesh(object):
         self.evolumes = None
         self.centroid = None
         self.number_of_elements = None
+        self._sphere_tree = None
 
     @classmethod
     def generate_mesh_from_vertices(cls, coord, enod):
@@ -117,10 +132,11 @@ class TetraMesh(object):
 
         """
         self._mesh.points += translation_vector
-        self.coord = np.array(self._mesh.points)
+        self.coord = np.array(self._mesh.points, dtype=self.coord.dtype)
         self.ecentroids += translation_vector
         self.espherecentroids += translation_vector
         self.centroid += translation_vector
+        self._sphere_tree = None
 
     def rotate(self, rotation_axis, angle):
         """Rotate the mesh.
@@ -143,7 +159,7 @@ class TetraMesh(object):
 
         """
         self._mesh.points = rigid_body_motion(self._mesh.points, time=time)
-        self.coord = np.array(self._mesh.points)
+        self.coord = np.array(self._mesh.points, dtype=self.coord.dtype)
 
         s1, s2, s3 = self.enormals.shape
         self.enormals = self.enormals.reshape(s1 * s2, 3)
@@ -155,6 +171,18 @@ class TetraMesh(object):
         self.espherecentroids = rigid_body_motion(self.espherecentroids, time=time)
 
         self.centroid = rigid_body_motion(self.centroid.reshape(1, 3), time=time)[0]
+        self._sphere_tree = None
+
+    def _get_sphere_tree(self):
+        """Bounding volume hierarchy over the element bounding spheres, built once and kept until the mesh moves.
+
+        Returns:
+            (:obj:`xrd_simulator.mesh._SphereTree`) spatial index of the element bounding spheres.
+
+        """
+        if getattr(self, "_sphere_tree", None) is None:
+            self._sphere_tree = _SphereTree(self.espherecentroids, self.eradius)
+        return self._sphere_tree
 
     def save(self, file, element_data=None):
         """Save the tetra mesh to .xdmf paraview readable format for visualization.
@@ -198,6 +226,27 @@ class TetraMesh(object):
         tetmesh._expand_mesh_data()
         return tetmesh
 
+    def _save_hdf5(self, group):
+        """Write the mesh arrays to a HDF5 group, stored contiguously such that they can be memory mapped on load."""
+        for name in _HDF5_ARRAYS:
+            group.create_dataset(name, data=getattr(self, name))
+
+    @classmethod
+    def _load_hdf5(cls, path, group):
+        """Mesh with arrays memory mapped from a HDF5 group written by :func:`_save_hdf5`.
+
+        Args:
+            path (:obj:`str`): Path to the HDF5 file.
+            group (:obj:`h5py.Group`): Group holding the mesh arrays, of the open file at path.
+
+        """
+        tetmesh = cls()
+        for name in _HDF5_ARRAYS:
+            setattr(tetmesh, name, utils._load_hdf5_array(path, group[name]))
+        tetmesh.number_of_elements = tetmesh.enod.shape[0]
+        tetmesh._mesh = meshio.Mesh(tetmesh.coord, [("tetra", tetmesh.enod)])
+        return tetmesh
+
     def _compute_mesh_faces(self, enod):
         """Compute all element faces nodal numbers. We create a matrix of all possible permutations and then we index the enod matrix."""
         permutations = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
@@ -322,20 +371,232 @@ class TetraMesh(object):
 
     def _set_fem_matrices(self):
         """Extract and set mesh FEM matrices from pygalmesh object."""
-        self.coord = np.array(self._mesh.points)
+        self.coord = np.array(self._mesh.points, dtype=utils.get_precision())
         self.enod = np.array(self._mesh.cells_dict["tetra"])
         self.dof = np.arange(0, self.coord.shape[0] * 3).reshape(self.coord.shape[0], 3)
         self.number_of_elements = self.enod.shape[0]
 
     def _expand_mesh_data(self):
-        """Compute extended mesh quantities such as element faces and normals."""
+        """Compute extended mesh quantities such as element faces and normals.
+
+        The quantities are computed in double precision and stored in the precision of the nodal coordinates.
+        """
+        coord = np.asarray(self.coord, dtype=np.float64)
+        dtype = self.coord.dtype
         self.efaces = self._compute_mesh_faces(self.enod)
-        self.enormals = self._compute_mesh_normals(self.coord, self.enod, self.efaces)
-        self.ecentroids = self._compute_mesh_centroids(self.coord, self.enod)
-        self.eradius, self.espherecentroids = self._compute_mesh_spheres(
-            self.coord, self.enod
-        )
-        self.centroid = np.mean(self.ecentroids, axis=0)
-        self.evolumes = self._compute_mesh_volumes(self.enod, self.coord)
+        self.enormals = self._compute_mesh_normals(coord, self.enod, self.efaces).astype(dtype, copy=False)
+        ecentroids = self._compute_mesh_centroids(coord, self.enod)
+        self.ecentroids = ecentroids.astype(dtype, copy=False)
+        eradius, espherecentroids = self._compute_mesh_spheres(coord, self.enod)
+        self.eradius = eradius.astype(dtype, copy=False)
+        self.espherecentroids = espherecentroids.astype(dtype, copy=False)
+        self.centroid = np.mean(ecentroids, axis=0).astype(dtype)
+        self.evolumes = self._compute_mesh_volumes(self.enod, coord).astype(dtype, copy=False)
 
         # TODO: considering leveraging this in beam.py for speed
+
+
+class _MovedTetraMesh(TetraMesh):
+    """A tetrahedral mesh represented as a reference mesh and an accumulated rigid body motion.
+
+    The topology and the quantities invariant under rigid body motions (enod, dof, efaces, eradius and evolumes) are
+    shared with the reference mesh, which is never modified. The moved quantities (coord, enormals, ecentroids,
+    espherecentroids and centroid) are computed on first access after each motion, into new arrays such that arrays
+    returned before a motion are left as they were. The moved quantities are read-only, until the mesh is first moved
+    they are views of the arrays of the reference mesh.
+
+    Args:
+        mesh (:obj:`xrd_simulator.mesh.TetraMesh`): The reference mesh.
+
+    Attributes:
+        rotation (:obj:`numpy array`): Accumulated rotation matrix ``shape=(3,3)``.
+        translation (:obj:`numpy array`): Accumulated translation ``shape=(3,)``, such that points of the reference
+            mesh, x, are moved to rotation x + translation.
+
+    """
+
+    def __init__(self, mesh):
+        self._reference = mesh
+        self.rotation = np.eye(3)
+        self.translation = np.zeros((3,))
+        self._moved = {}
+        self._sphere_tree = None
+
+    def __getstate__(self):
+        # The moved quantities are recomputed from the reference mesh when needed.
+        state = self.__dict__.copy()
+        state["_moved"] = {}
+        state["_sphere_tree"] = None
+        return state
+
+    @property
+    def _mesh(self):
+        # The meshio mesh of the moved nodes, the reference meshio mesh holds the unmoved geometry.
+        return meshio.Mesh(self.coord, [("tetra", self.enod)])
+
+    @property
+    def enod(self):
+        return self._reference.enod
+
+    @property
+    def dof(self):
+        return self._reference.dof
+
+    @property
+    def efaces(self):
+        return self._reference.efaces
+
+    @property
+    def eradius(self):
+        return self._reference.eradius
+
+    @property
+    def evolumes(self):
+        return self._reference.evolumes
+
+    @property
+    def number_of_elements(self):
+        return self._reference.number_of_elements
+
+    @property
+    def coord(self):
+        return self._get_moved("coord", translate=True)
+
+    @property
+    def enormals(self):
+        return self._get_moved("enormals", translate=False)
+
+    @property
+    def ecentroids(self):
+        return self._get_moved("ecentroids", translate=True)
+
+    @property
+    def espherecentroids(self):
+        return self._get_moved("espherecentroids", translate=True)
+
+    @property
+    def centroid(self):
+        return self._get_moved("centroid", translate=True)
+
+    def _get_moved(self, name, translate):
+        """Read-only reference mesh quantity moved by the accumulated rigid body motion, computed once per motion."""
+        if name not in self._moved:
+            reference = getattr(self._reference, name)
+            if np.array_equal(self.rotation, np.eye(3)) and not np.any(self.translation):
+                moved = reference.view()
+            else:
+                moved = np.matmul(reference, self.rotation.T.astype(reference.dtype))
+                if translate:
+                    moved += self.translation.astype(moved.dtype)
+            moved.flags.writeable = False
+            self._moved[name] = moved
+        return self._moved[name]
+
+    def translate(self, translation_vector):
+        """Translate the mesh.
+
+        Args:
+            translation_vector (:obj:`numpy.array`): [x,y,z] translation vector, shape=(3,)
+
+        """
+        self.translation = self.translation + translation_vector
+        self._moved = {}
+        self._sphere_tree = None
+
+    def update(self, rigid_body_motion, time):
+        """Apply a rigid body motion transformation to the mesh.
+
+        Args:
+            rigid_body_motion (:obj:`xrd_simulator.motion.RigidBodyMotion`): Rigid body motion object describing the
+                polycrystal transformation as a function of time on the domain time=[0,1].
+            time (:obj:`float`): Time between [0,1] at which to call the rigid body motion.
+
+        """
+        rotation = rigid_body_motion.rotator.get_rotation_matrix(
+            rigid_body_motion.rotation_angle * time
+        )
+        self.rotation = np.matmul(rotation, self.rotation)
+        self.translation = rigid_body_motion(self.translation, time)
+        self._moved = {}
+        self._sphere_tree = None
+
+
+class _SphereTree(object):
+    """Bounding volume hierarchy over a set of spheres for culling spheres against convex polyhedra.
+
+    The spheres are ordered along a Morton (z-order) curve and grouped bottom up, ``branching`` consecutive spheres
+    (or nodes) at a time, into axis aligned bounding boxes. The hierarchy is stored level by level as flat arrays, such
+    that queries descend the tree one level at a time in a vectorised manner and only visit nodes close to the query
+    polyhedron.
+
+    Args:
+        centres (:obj:`numpy array`): Sphere centroids ``shape=(N,3)``.
+        radius (:obj:`numpy array`): Sphere radii ``shape=(N,)``.
+        branching (:obj:`int`): Number of children of each node. Defaults to 16.
+
+    Attributes:
+        order (:obj:`numpy array`): Sphere indices in Morton order ``shape=(N,)``.
+        lower, upper (:obj:`list` of :obj:`numpy array`): Per level lower and upper corners of the node bounding
+            boxes, from the leaves to the root.
+
+    """
+
+    def __init__(self, centres, radius, branching=16):
+        centres = np.asarray(centres, dtype=np.float64).reshape(-1, 3)
+        radius = np.asarray(radius, dtype=np.float64).reshape(-1)
+        self.branching = branching
+        self.order = np.argsort(self._get_morton_codes(centres), kind="stable")
+        self.centres = centres[self.order]
+        self.radius = radius[self.order]
+        self.lower, self.upper = [], []
+        lower = self.centres - self.radius[:, np.newaxis]
+        upper = self.centres + self.radius[:, np.newaxis]
+        while len(lower) > 0 and (len(self.lower) == 0 or len(lower) > 1):
+            starts = np.arange(0, len(lower), branching)
+            lower = np.minimum.reduceat(lower, starts, axis=0)
+            upper = np.maximum.reduceat(upper, starts, axis=0)
+            self.lower.append(lower)
+            self.upper.append(upper)
+
+    def query(self, halfspaces):
+        """Find the spheres which are not fully outside any of a set of halfspaces.
+
+        Args:
+            halfspaces (:obj:`numpy array`): Halfspace equations of a convex polyhedron, a point x is on the interior if
+                halfspaces[i,:-1].dot(x) + halfspaces[i,-1] <= 0, ``shape=(M,4)``.
+
+        Returns:
+            (:obj:`numpy array`) indices of the spheres with a signed distance to all halfspaces of at most their
+            radius.
+
+        """
+        normals, offsets = halfspaces[:, 0:3], halfspaces[:, 3]
+        if len(self.lower) == 0:
+            return np.zeros((0,), dtype=int)
+        nodes = np.arange(len(self.lower[-1]))
+        for level in range(len(self.lower) - 1, -1, -1):
+            lower, upper = self.lower[level][nodes], self.upper[level][nodes]
+            distances = (
+                ((lower + upper) / 2.0).dot(normals.T)
+                - ((upper - lower) / 2.0).dot(np.abs(normals).T)
+                + offsets
+            )
+            nodes = nodes[~np.any(distances > 0, axis=1)]
+            number_of_children = len(self.lower[level - 1]) if level > 0 else len(self.radius)
+            nodes = (nodes[:, np.newaxis] * self.branching + np.arange(self.branching)).flatten()
+            nodes = nodes[nodes < number_of_children]
+        distances = self.centres[nodes].dot(normals.T) + offsets
+        nodes = nodes[~np.any(distances > self.radius[nodes, np.newaxis], axis=1)]
+        return self.order[nodes]
+
+    def _get_morton_codes(self, centres):
+        """Interleave the bits of the centres quantised to 10 bits per axis, ``shape=(N,)``."""
+        if len(centres) == 0:
+            return np.zeros((0,), dtype=np.int64)
+        lower, upper = np.min(centres, axis=0), np.max(centres, axis=0)
+        quantised = ((centres - lower) / np.maximum(upper - lower, 1e-12) * 1023).astype(np.int64)
+        codes = np.zeros((len(centres),), dtype=np.int64)
+        for bit in range(10):
+            for axis in range(3):
+                codes |= ((quantised[:, axis] >> bit) & 1) << (3 * bit + axis)
+        return codes
@@ -67,31 +67,33 @@ class RigidBodyMotion():
         """
         #assert time <= 1 and time >= 0, "The rigid body motion is only valid on the interval time=[0,1]"
         
+        # Single precision vectors are transformed in single precision, see xrd_simulator.utils.set_precision().
+        dtype = _get_float_dtype(vectors)
         if len(vectors.shape) == 1:
-            translation = self.translation
-            origin = self.origin
+            translation = self.translation.astype(dtype)
+            origin = self.origin.astype(dtype)
             centered_vectors = vectors - origin
             centered_rotated_vectors  =  self.rotator(centered_vectors, self.rotation_angle * time)
             rotated_vectors = centered_rotated_vectors + origin
-            return np.squeeze(rotated_vectors + translation * time)
+            return np.squeeze(rotated_vectors + translation * np.asarray(time, dtype=dtype))
         
         elif len(vectors.shape) == 2:
-            translation = self.translation.reshape(1,3)
-            origin = self.origin.reshape(1,3)      
+            translation = self.translation.reshape(1,3).astype(dtype)
+            origin = self.origin.reshape(1,3).astype(dtype)
             centered_vectors = vectors - origin
             centered_rotated_vectors  =  self.rotator(centered_vectors, self.rotation_angle * time)
             rotated_vectors = centered_rotated_vectors + origin
             if np.isscalar(time):
-                return rotated_vectors + translation * time
-            return np.squeeze(rotated_vectors + translation * np.array(time)[:,np.newaxis])
+                return rotated_vectors + translation * np.asarray(time, dtype=dtype)
+            return np.squeeze(rotated_vectors + translation * np.array(time, dtype=dtype)[:,np.newaxis])
         
         elif len(vectors.shape) == 3:
-            translation = self.translation.reshape(1,3)
-            origin = self.origin.reshape(1,3)
+            translation = self.translation.reshape(1,3).astype(dtype)
+            origin = self.origin.reshape(1,3).astype(dtype)
             centered_vectors = vectors - origin
             centered_rotated_vectors  =  self.rotator(centered_vectors.reshape(-1,3), self.rotation_angle * np.tile(time,(4,1)).T.reshape(-1)).reshape(-1,4,3)
             rotated_vectors = centered_rotated_vectors + origin       
-            return np.squeeze(rotated_vectors + translation * np.array(time)[:,np.newaxis,np.newaxis])
+            return np.squeeze(rotated_vectors + translation * np.array(time, dtype=dtype)[:,np.newaxis,np.newaxis])
     
     def rotate(self, vectors, time):
         """Find the rotational transformation of a set of vectors at a prescribed time.
@@ -173,6 +175,27 @@ class RigidBodyMotion():
         with open(path, 'rb') as f:
             return dill.load(f)
 
+
+class _RotationScan(RigidBodyMotion):
+    """Pure rotation about an axis through the origin parametrised directly by the rotation angle.
+
+    Calling the motion at time=omega rotates by omega radians. This lifts the restriction of
+    :class:`RigidBodyMotion` to rotations smaller than pi, such that a full rotation scan can be
+    computed in a single pass, see :func:`xrd_simulator.polycrystal.Polycrystal.diffract_scan`.
+
+    Args:
+        rotation_axis (:obj:`numpy array`): Rotation axis ``shape=(3,)``
+
+    """
+
+    def __init__(self, rotation_axis):
+        self.rotator = _RodriguezRotator(rotation_axis)
+        self.rotation_axis = rotation_axis
+        self.rotation_angle = 1.0
+        self.translation = np.zeros((3,))
+        self.origin = np.zeros((3,))
+
+
 class _RodriguezRotator(object):
     """Object for rotating vectors in the plane described by yhe unit normal rotation_axis.
 
@@ -212,9 +235,14 @@ class _RodriguezRotator(object):
 
         """
 
-        R = self.get_rotation_matrix(rotation_angle)
+        R = self.get_rotation_matrix(rotation_angle).astype(_get_float_dtype(vectors))
         
         if len(vectors.shape)==1:
             vectors = vectors[np.newaxis,:]
         
         return np.matmul(R,vectors[:,:,np.newaxis])[:,:,0] # Syntax valid for the rotation fo the G vectors from the grains
+
+
+def _get_float_dtype(vectors):
+    """Floating point type in which to transform vectors, single precision vectors are kept in single precision."""
+    return np.result_type(vectors, np.float32)
@@ -0,0 +1,280 @@
+"""The parallel module holds the machinery used to distribute diffraction and rendering computations over several
+processes. The idea is to create a :class:`xrd_simulator.parallel.WorkerPool` once and pass it along to
+:func:`xrd_simulator.polycrystal.Polycrystal.diffract` and :func:`xrd_simulator.detector.Detector.render` such that
+the worker processes (and their compiled numba functions) are reused between calls. Here is a minimal example of
+a rotation scan using a persistent pool of worker processes:
+
+    Examples:
+        .. code-block:: python
+
+            from xrd_simulator.parallel import WorkerPool
+
+            with WorkerPool(number_of_processes=8) as worker_pool:
+                for i in range(number_of_steps):
+                    polycrystal.diffract(beam, detector, motion, worker_pool=worker_pool)
+                    polycrystal.transform(motion, time=1.0)
+                diffraction_pattern = detector.render('all', worker_pool=worker_pool)
+
+Large per element arrays (mesh coordinates, orientations, B matrices, etc.) are placed in shared memory such that the
+workers can attach to them without copying or unpickling. The sample arrays stay resident in shared memory between
+calls for as long as the sample is not transformed, rows changed by updates of a subset of the elements are written
+into the resident arrays in place. The small per call objects (beam, detector, motion and phases)
+are serialised once per call and loaded once per worker. Workers then only receive small task descriptions, such as
+index ranges of elements, and return compact, array based, results.
+
+Below follows a detailed description of the worker pool class attributes and functions.
+
+"""
+
+import os
+import time
+from multiprocessing import Pool, resource_tracker, shared_memory
+import numpy as np
+import dill
+import numba
+
+# Per worker process state, set by _load_worker_state().
+_worker_arrays = {}
+_worker_context = {}
+_worker_state = {"sample": None, "context": None, "shared_memory": []}
+
+
+class WorkerPool(object):
+    """A persistent pool of worker processes for diffraction and rendering computations.
+
+    The pool may be used as a context manager, in which case the worker processes and shared memory are released on
+    exit, otherwise :meth:`close` must be called when the pool is no longer needed.
+
+    Tasks are handed out one at a time to idle workers, in the order given by the caller, such that uneven task costs
+    are balanced dynamically over the workers. The cores of the machine are shared between the workers, each of which
+    runs its numba parallel functions on os.cpu_count() // number_of_processes threads (at least one).
+
+    Args:
+        number_of_processes (:obj:`int`): Number of worker processes to start.
+
+    Attributes:
+        number_of_processes (:obj:`int`): Number of worker processes of the pool.
+        busy_times (:obj:`dict` of :obj:`float`): Time in seconds spent computing by each worker, keyed by process id,
+            during the most recent call to the pool. Useful to check the load balance of a computation.
+
+    """
+
+    def __init__(self, number_of_processes):
+        self.number_of_processes = number_of_processes
+        # Workers must share the resource tracker of this process, otherwise a tracker started by a worker
+        # would unlink the shared memory it has attached to when the worker exits.
+        resource_tracker.ensure_running()
+        number_of_threads = max(1, (os.cpu_count() or 1) // number_of_processes)
+        self._pool = Pool(number_of_processes, initializer=_initialize_worker, initargs=(number_of_threads,))
+        self._sample = None
+        self._sample_arrays = None
+        self._sample_token = None
+        self._number_of_tokens = 0
+        self.busy_times = {}
+
+    def close(self):
+        """Terminate the worker processes and release all shared memory."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._release_sample()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _set_sample(self, owner, version, get_arrays, revision=0, get_updates=None):
+        """Make the arrays of a sample resident in shared memory, unless they already are.
+
+        Args:
+            owner (:obj:`object`): Object owning the arrays, e.g a :class:`xrd_simulator.polycrystal.Polycrystal`.
+            version (:obj:`int`): Version of the owner, to be incremented by the owner whenever the arrays are replaced.
+            get_arrays (:obj:`callable`): Called without arguments to get the (:obj:`dict` of :obj:`numpy array`)
+                arrays of the sample, keyed by name, if these are not already resident.
+            revision (:obj:`int`): Revision of the owner within a version, to be incremented by the owner whenever rows
+                of the arrays change. Defaults to 0.
+            get_updates (:obj:`callable`): Called with the revision of the resident arrays to get the rows changed
+                since, as (:obj:`numpy array`, :obj:`dict` of :obj:`numpy array`) row indices and the new rows keyed by
+                array name, which are written into the resident arrays in place. Defaults to None, in which case the revision
+                must not change within a version.
+
+        """
+        if (
+            self._sample is not None
+            and self._sample[0] is owner
+            and self._sample[1] == version
+        ):
+            if self._sample[2] != revision:
+                # The workers are idle between calls and see the rows written into the shared memory they attached to.
+                indices, rows = get_updates(self._sample[2])
+                for name, values in rows.items():
+                    self._sample_arrays.arrays[name][indices] = values
+                self._sample = (owner, version, revision)
+            return
+        self._release_sample()
+        self._sample_arrays = _SharedArrays(get_arrays())
+        self._number_of_tokens += 1
+        self._sample_token = (self._number_of_tokens, self._sample_arrays.specs)
+        self._sample = (owner, version, revision)
+
+    def _release_sample(self):
+        if self._sample_arrays is not None:
+            self._sample_arrays.close()
+        self._sample = None
+        self._sample_arrays = None
+        self._sample_token = None
+
+    def _map(self, function, tasks, context):
+        """Apply a function to a list of tasks in the worker processes, handing out tasks in order to idle workers.
+
+        Args:
+            function (:obj:`callable`): Module level function called as function(task) in the workers. The sample
+                arrays and the context are available in the function through :func:`_get_worker_state`.
+            tasks (:obj:`list`): Small, picklable, task descriptions.
+            context (:obj:`dict`): Objects shared by all tasks of the call. These are serialised once for the call
+                and loaded once per worker.
+
+        Returns:
+            (:obj:`list`) the results of the function, in the order of the tasks.
+
+        """
+        blob = np.frombuffer(dill.dumps(context, dill.HIGHEST_PROTOCOL), dtype=np.uint8)
+        self._number_of_tokens += 1
+        with _SharedArrays({"context": blob}) as context_arrays:
+            context_token = (self._number_of_tokens, context_arrays.specs)
+            args = [
+                (function, self._sample_token, context_token, i, task)
+                for i, task in enumerate(tasks)
+            ]
+            results = [None] * len(tasks)
+            self.busy_times = {}
+            for i, pid, busy_time, result in self._pool.imap_unordered(
+                _run_task, args, chunksize=1
+            ):
+                results[i] = result
+                self.busy_times[pid] = self.busy_times.get(pid, 0.0) + busy_time
+            return results
+
+
+class _SharedArrays(object):
+    """A collection of named numpy arrays copied into blocks of shared memory.
+
+    The shared memory blocks are owned by the creating process and are released on :meth:`close`, or when the object is
+    used as a context manager, on exit.
+
+    Args:
+        arrays (:obj:`dict` of :obj:`numpy array`): Arrays to place in shared memory, keyed by name.
+
+    Attributes:
+        specs (:obj:`dict` of :obj:`tuple`): Picklable (shared memory name, shape, dtype) descriptors of the arrays,
+            keyed by name, which may be passed to :func:`_attach_shared_arrays` in another process.
+        arrays (:obj:`dict` of :obj:`numpy array`): Views of the arrays in shared memory, keyed by name.
+
+    """
+
+    def __init__(self, arrays):
+        self.specs = {}
+        self.arrays = {}
+        self._shared_memory = []
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self._shared_memory.append(shm)
+                self.arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+                self.arrays[name][...] = array
+                self.specs[name] = (shm.name, array.shape, array.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """Release all shared memory blocks."""
+        # The views must be released before the blocks can be closed.
+        self.arrays = {}
+        for shm in self._shared_memory:
+            shm.close()
+            shm.unlink()
+        self._shared_memory = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach_shared_arrays(specs):
+    """Attach to arrays placed in shared memory by a :class:`_SharedArrays` object.
+
+    Args:
+        specs (:obj:`dict` of :obj:`tuple`): Array descriptors, as given by :attr:`_SharedArrays.specs`.
+
+    Returns:
+        (:obj:`dict` of :obj:`numpy array`, :obj:`list` of :obj:`multiprocessing.shared_memory.SharedMemory`) the
+        zero-copy array views keyed by name and the shared memory handles, which must be kept alive while the views
+        are in use.
+
+    """
+    arrays, handles = {}, []
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        handles.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return arrays, handles
+
+
+def _initialize_worker(number_of_threads):
+    """Limit the numba threads of a worker process, such that the workers of a pool do not oversubscribe the cores."""
+    numba.set_num_threads(min(number_of_threads, numba.config.NUMBA_NUM_THREADS))
+
+
+def _load_worker_state(sample_token, context_token):
+    """Attach the worker process to the sample arrays and load the call context, unless already done.
+
+    Args:
+        sample_token (:obj:`tuple`): (identifier, array specs) of the resident sample arrays, or None.
+        context_token (:obj:`tuple`): (identifier, array specs) of the serialised call context.
+
+    """
+    sample_identifier = None if sample_token is None else sample_token[0]
+    if _worker_state["sample"] != sample_identifier:
+        _worker_arrays.clear()
+        for shm in _worker_state["shared_memory"]:
+            shm.close()
+        _worker_state["shared_memory"] = []
+        if sample_token is not None:
+            arrays, handles = _attach_shared_arrays(sample_token[1])
+            _worker_arrays.update(arrays)
+            _worker_state["shared_memory"] = handles
+        _worker_state["sample"] = sample_identifier
+
+    if _worker_state["context"] != context_token[0]:
+        arrays, handles = _attach_shared_arrays(context_token[1])
+        context = dill.loads(arrays.pop("context").tobytes())
+        handles[0].close()
+        _worker_context.clear()
+        _worker_context.update(context)
+        _worker_state["context"] = context_token[0]
+
+
+def _run_task(args):
+    """Load the worker state needed by a task and run it, see :meth:`WorkerPool._map`.
+
+    Returns:
+        (:obj:`tuple`) the task index, the worker process id, the time spent in seconds and the task result.
+
+    """
+    start_time = time.perf_counter()
+    function, sample_token, context_token, task_index, task = args
+    _load_worker_state(sample_token, context_token)
+    result = function(task)
+    return task_index, os.getpid(), time.perf_counter() - start_time, result
+
+
+def _get_worker_state():
+    """Return the (arrays, context) dictionaries of the sample arrays and call context in the current process."""
+    return _worker_arrays, _worker_context
@@ -15,8 +15,11 @@ Below follows a detailed description of the Phase class attributes and functions
 .. _The .cif file used in the above example can be found here.: https://github.com/FABLE-3DXRD/xrd_simulator/blob/main/docs/source/examples/quartz.cif?raw=true
 
 """
+import collections
+import hashlib
+import os
 import numpy as np
-from xfab import tools, structure
+from xfab import tools, structure, sg
 from xrd_simulator import utils
 
 
@@ -36,6 +39,8 @@ class Phase(object):
         sgname (:obj:`string`): Name of space group , e.g 'P3221' for quartz, SiO2, for instance
         path_to_cif_file (:obj:`string`): Path to CIF file. Defaults to None, in which case no structure
             factors are computed, i.e `structure_factors=None`.
+        path_to_cache_directory (:obj:`string`): Path to a directory in which to persist the diffracting planes
+            and structure factors between sessions. Defaults to None, in which case these are only cached in memory.
 
     Attributes:
         unit_cell (:obj:`list` of :obj:`float`): Crystal unit cell representation of the form
@@ -47,15 +52,27 @@ class Phase(object):
             of ``shape=(n,2)``. `structure_factors[i,0]` gives the real structure factor of `hkl=miller_indices[i,:]`
             while `structure_factors[i,0]` gives the corresponding imaginary part of the structure factor.
         path_to_cif_file (:obj:`string`): Path to CIF file.
+        path_to_cache_directory (:obj:`string`): Path to a directory in which the diffracting planes and structure
+            factors are persisted, None if not persisted.
+        cache_size (:obj:`int`): Maximum number of diffracting plane setups kept in memory, the least recently used
+            setups are evicted first. Defaults to 16.
 
     """
 
-    def __init__(self, unit_cell, sgname, path_to_cif_file=None):
+    def __init__(self, unit_cell, sgname, path_to_cif_file=None, path_to_cache_directory=None):
         self.unit_cell = unit_cell
         self.sgname = sgname
         self.miller_indices = None
         self.structure_factors = None
         self.path_to_cif_file = path_to_cif_file
+        self.path_to_cache_directory = path_to_cache_directory
+        self.cache_size = 16
+
+    def __getstate__(self):
+        # The in memory cache is not pickled, e.g when the phase is sent to worker processes.
+        state = self.__dict__.copy()
+        state.pop("_diffracting_planes_cache", None)
+        return state
 
     def setup_diffracting_planes(
             self,
@@ -73,17 +90,130 @@ class Phase(object):
 
         NOTE: This function will skip Miller indices that have a zero intensity due to the unit cell structure
         factor vanishing, i.e forbidden reflections, such as a 100 in an fcc for instance, will not be included.
+
+        NOTE: The Miller indices and structure factors are cached by their sin(theta)/lambda bounds. Repeated setups
+        with the same wavelength and Bragg angle bounds reuse the same arrays, and setups with bounds inside those of
+        a cached setup are selected from it, without calling xfab.
         """
-        
         sintlmin = np.sin(min_bragg_angle) / wavelength
         sintlmax = np.sin(max_bragg_angle) / wavelength
-        self.miller_indices = tools.genhkl_all(
-            self.unit_cell, sintlmin, sintlmax, sgname=self.sgname)
+        self.miller_indices, self.structure_factors = self._get_diffracting_planes(
+            sintlmin, sintlmax
+        )
+
+    def _get_diffracting_planes(self, sintlmin, sintlmax):
+        """Get the Miller indices, and structure factors, with sintlmin < sin(theta)/lambda <= sintlmax.
+
+        The setups are looked up, in order, in the in memory cache, in the cache directory and are otherwise
+        generated with xfab.
+
+        Returns:
+            (:obj:`tuple` of :obj:`numpy array`) Miller indices of ``shape=(n,3)`` and structure factors of
+            ``shape=(n,2)``, None if there is no CIF file.
+
+        """
+        cache = self.__dict__.setdefault(
+            "_diffracting_planes_cache", collections.OrderedDict()
+        )
+        phase_key = (
+            tuple(self.unit_cell),
+            self.sgname,
+            self.path_to_cif_file,
+            self._get_cif_digest(),
+        )
+        key = phase_key + (sintlmin, sintlmax)
+
+        if key in cache:
+            cache.move_to_end(key)
+            miller_indices, structure_factors, _ = cache[key]
+            return miller_indices, structure_factors
+
+        for (*cached_phase_key, cached_sintlmin, cached_sintlmax), entry in reversed(cache.items()):
+            if (
+                tuple(cached_phase_key) == phase_key
+                and cached_sintlmin <= sintlmin
+                and sintlmax <= cached_sintlmax
+            ):
+                miller_indices, structure_factors, stl = entry
+                mask = (stl > sintlmin) & (stl <= sintlmax)
+                entry = (
+                    miller_indices[mask],
+                    None if structure_factors is None else structure_factors[mask],
+                    stl[mask],
+                )
+                break
+        else:
+            entry = self._load_diffracting_planes(key)
+            if entry is None:
+                entry = self._generate_diffracting_planes(sintlmin, sintlmax)
+                self._save_diffracting_planes(key, entry)
+
+        cache[key] = entry
+        while len(cache) > max(getattr(self, "cache_size", 16), 1):
+            cache.popitem(last=False)
+        return entry[0], entry[1]
+
+    def _get_cif_digest(self):
+        """Digest of the contents of the CIF file, such that edits of the file are not served from the caches."""
+        if self.path_to_cif_file is None:
+            return None
+        with open(self.path_to_cif_file, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def _generate_diffracting_planes(self, sintlmin, sintlmax):
+        """Generate Miller indices, structure factors and sin(theta)/lambda of the diffracting planes with xfab."""
+        hkls = tools.genhkl_all(
+            self.unit_cell, sintlmin, sintlmax, sgname=self.sgname, output_stl=True
+        )
+        miller_indices, stl = hkls[:, 0:3], hkls[:, 3]
+        structure_factors = None
         if self.path_to_cif_file is not None:
-            self._set_structure_factors(self.miller_indices)
+            structure_factors = self._get_structure_factors(miller_indices)
+        return miller_indices, structure_factors, stl
+
+    def _get_cache_file(self, key):
+        path_to_cache_directory = getattr(self, "path_to_cache_directory", None)
+        if path_to_cache_directory is None:
+            return None
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(path_to_cache_directory, "diffracting_planes_" + digest + ".npz")
+
+    def _load_diffracting_planes(self, key):
+        path = self._get_cache_file(key)
+        if path is None or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            structure_factors = data["structure_factors"] if "structure_factors" in data else None
+            return data["miller_indices"], structure_factors, data["stl"]
+
+    def _save_diffracting_planes(self, key, entry):
+        path = self._get_cache_file(key)
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        miller_indices, structure_factors, stl = entry
+        arrays = {"miller_indices": miller_indices, "stl": stl}
+        if structure_factors is not None:
+            arrays["structure_factors"] = structure_factors
+        np.savez(path, **arrays)
 
     def _set_structure_factors(self, miller_indices):
         """Generate unit cell structure factors for all miller indices.
+        """
+        self.structure_factors = self._get_structure_factors(miller_indices)
+
+    def _get_structure_factors(self, miller_indices):
+        """Compute unit cell structure factors for all miller indices at once.
+
+        This is a vectorised version of xfab.structure.StructureFactor (without anomalous dispersion) evaluating
+        all Miller indices and space group symmetry operators together.
+
+        Args:
+            miller_indices (:obj:`numpy array`): Miller indices of ``shape=(n,3)``.
+
+        Returns:
+            (:obj:`numpy array`) real and imaginary parts of the structure factors of ``shape=(n,2)``.
+
         """
         atom_factory = structure.build_atomlist()
         cifblk = utils._cif_open(self.path_to_cif_file)
@@ -92,7 +222,24 @@ class Phase(object):
             cifblkname=None,
             cifblk=cifblk)
         atoms = atom_factory.atomlist.atom
-        self.structure_factors = np.zeros((miller_indices.shape[0], 2))
-        for i, hkl in enumerate(miller_indices):
-            self.structure_factors[i, :] = structure.StructureFactor(
-                hkl, self.unit_cell, self.sgname, atoms, disper=None)
+
+        space_group = sg.sg(sgname=self.sgname)
+        hkl = np.asarray(miller_indices, dtype=float).reshape(-1, 3)
+        stl = tools.sintl(self.unit_cell, hkl.T)
+        structure_factors = np.zeros((hkl.shape[0], 2))
+        for atom in atoms:
+            if atom.adp_type == "Uiso":
+                expij = np.exp(-8 * np.pi**2 * atom.adp * stl**2)[:, np.newaxis]
+            elif atom.adp_type == "Uani":
+                betaij = structure.Uij2betaij(atom.adp, self.unit_cell)
+                betaijrot = np.matmul(np.matmul(space_group.rot, betaij), space_group.rot)
+                expij = np.exp(-np.einsum("ni,sij,nj->ns", hkl, betaijrot, hkl))
+            else:
+                expij = 1
+            f = structure.FormFactor(atom.atomtype, stl)[:, np.newaxis]
+            r = np.matmul(space_group.rot, atom.pos) + space_group.trans
+            exponent = 2 * np.pi * hkl.dot(r.T)
+            site_pop = atom.occ * atom.symmulti / space_group.nsymop
+            structure_factors[:, 0] += np.sum(expij * np.cos(exponent) * f, axis=1) * site_pop
+            structure_factors[:, 1] += np.sum(expij * np.sin(exponent) * f, axis=1) * site_pop
+        return structure_factors
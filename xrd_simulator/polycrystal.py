@@ -10,15 +10,37 @@ Below follows a detailed description of the polycrystal class attributes and fun
 
 """
 
-import copy
-from multiprocessing import Pool
 import numpy as np
-from scipy.spatial import ConvexHull
-import pandas as pd
 import dill
+import h5py
+from scipy.spatial.transform import Rotation
 from xfab import tools
-from xrd_simulator.scattering_unit import ScatteringUnit
-from xrd_simulator import utils, laue
+from xrd_simulator.scattering_unit import ScatteringUnitTable
+from xrd_simulator.motion import RigidBodyMotion, _RotationScan
+from xrd_simulator import utils, laue, parallel
+from xrd_simulator.mesh import TetraMesh, _MovedTetraMesh
+
+# Peak bytes of the diffraction computation per reflection. The Laue equations are solved without per element and hkl
+# temporaries, such that the memory of a block is that of its reflections: the element, phase, hkl, time and G_0
+# columns (56 bytes) coexist with the rotated G vectors, the scattered wavevectors, the source points and the
+# temporaries of rotating them (about 6 x 24 bytes), the detector coordinates (16 bytes) and the moved element
+# vertices (96 bytes).
+_BYTES_PER_REFLECTION = 312
+
+# Approximate relative costs of diffracting elements used to balance the load of parallel computations. The unit
+# cost is that of solving the Laue equations for an element, to which the exact beam intersection of elements
+# crossing the beam boundary adds about as much again. Elements far from the beam are rejected almost for free
+# when proximity is used.
+_BEAM_BOUNDARY_ELEMENT_COST = 1.0
+_REJECTED_ELEMENT_COST = 0.1
+
+# Number of tasks per worker process when diffracting in parallel, tasks are handed out dynamically to idle workers.
+_TASKS_PER_PROCESS = 16
+
+# Grid spacing onto which orientation and strain components are rounded when detecting grains, such that elements
+# differing by round-off only are part of the same grain, and the number of elements keyed at a time.
+_GRAIN_KEY_RESOLUTION = 2.0**-32
+_GRAIN_KEY_CHUNK_SIZE = 65536
 
 
 def _diffract(dict):
@@ -33,16 +55,24 @@ def _diffract(dict):
             - 'phases' (list): List of Phase objects representing the phases present in the polycrystal.
             - 'espherecentroids' (numpy.ndarray): Array containing the centroids of the scattering elements.
             - 'eradius' (numpy.ndarray): Array containing the radii of the scattering elements.
-            - 'orientation_lab' (numpy.ndarray): Array containing orientation matrices in laboratory coordinates.
-            - 'eB' (numpy.ndarray): Array containing per-element 3x3 B matrices mapping hkl values to crystal coordinates.
+            - 'eUB' (numpy.ndarray): Array containing per-element 3x3 products of the orientation and B matrices, mapping
+              hkl values to diffraction vectors in laboratory coordinates.
             - 'element_phase_map' (numpy.ndarray): Array mapping elements to phases.
+            - 'element_grain_map' (numpy.ndarray): Array mapping elements to grains of identical orientation, strain
+              and phase, for which the diffraction condition is solved only once.
+            - 'element_index' (numpy.ndarray): Global mesh indices of the elements in the subset.
             - 'ecoord' (numpy.ndarray): Array containing coordinates of the scattering elements.
+            - 'evolumes' (numpy.ndarray): Array containing the (positive) volumes of the scattering elements.
             - 'verbose' (bool): Flag indicating whether to print progress.
             - 'proximity' (bool): Flag indicating whether to remove grains unlikely to be hit by the beam.
             - 'BB_intersection' (bool): Flag indicating whether to use Bounding-Box intersection for speed.
+            - 'max_memory' (float): Approximate memory budget in bytes for the per block diffraction arrays, None
+              for no limit. Elements are streamed through the diffraction computation in blocks fitting the budget.
+            - 'omega_range' (tuple, optional): Start and end rotation angles (radians) of a rotation scan, in which
+              case the 'rigid_body_motion' is a :class:`xrd_simulator.motion._RotationScan`. Defaults to None.
 
     Returns:
-        list: A list of ScatteringUnit objects representing diffraction events.
+        ScatteringUnitTable: A table of scattering units representing diffraction events.
     """
 
     beam = dict["beam"]
@@ -51,180 +81,561 @@ def _diffract(dict):
     phases = dict["phases"]
     espherecentroids = dict["espherecentroids"]
     eradius = dict["eradius"]
-    orientation_lab = dict["orientation_lab"]
-    eB = dict["eB"]
+    eUB = dict["eUB"]
     element_phase_map = dict["element_phase_map"]
+    element_grain_map = dict["element_grain_map"]
+    element_index = dict["element_index"]
     ecoord = dict["ecoord"]
+    evolumes = dict["evolumes"]
     verbose = dict[
         "verbose"
     ]  # should be deprecated or repurposed since computation now takes place phase by phase not by individual scatterer
     proximity = dict["proximity"]
     BB_intersection = dict["BB_intersection"]
-    number_of_elements = ecoord.shape[0]
+    max_memory = dict["max_memory"]
+    omega_range = dict.get("omega_range")
 
-    rho_0_factor = np.float32(-beam.wave_vector.dot(rigid_body_motion.rotator.K2))
-    rho_1_factor = np.float32(beam.wave_vector.dot(rigid_body_motion.rotator.K))
-    rho_2_factor = np.float32(
-        beam.wave_vector.dot(np.eye(3, 3) + rigid_body_motion.rotator.K2)
-    )
+    rho_0_factor = -beam.wave_vector.dot(rigid_body_motion.rotator.K2)
+    rho_1_factor = beam.wave_vector.dot(rigid_body_motion.rotator.K)
+    rho_2_factor = beam.wave_vector.dot(np.eye(3, 3) + rigid_body_motion.rotator.K2)
 
+    proximity_intervals = None
     if proximity:
         # Grains with no chance to be hit by the beam are removed beforehand, if proximity is toggled as True
-        proximity_intervals = beam._get_proximity_intervals(
-            espherecentroids, eradius, rigid_body_motion
-        )
-        possible_scatterers_mask = np.array(
-            [pi[0] is not None for pi in proximity_intervals]
-        )
-        espherecentroids = np.float32(espherecentroids[possible_scatterers_mask])
-        eradius = np.float32(eradius[possible_scatterers_mask])
+        if omega_range is None:
+            interval_element, start_times, end_times = beam._get_proximity_intervals(
+                espherecentroids, eradius, rigid_body_motion
+            )
+            possible_scatterers_mask = np.zeros((len(eradius),), dtype=bool)
+            possible_scatterers_mask[interval_element] = True
+            # The intervals are kept, indexed by the remaining elements, to reject reflections at times when the
+            # element is away from the beam.
+            remaining_index = np.cumsum(possible_scatterers_mask) - 1
+            proximity_intervals = (remaining_index[interval_element], start_times, end_times)
+        else:
+            possible_scatterers_mask = _get_scan_candidates(
+                beam, rigid_body_motion, omega_range, espherecentroids, eradius
+            )
+        espherecentroids = espherecentroids[possible_scatterers_mask]
+        eradius = eradius[possible_scatterers_mask]
 
-        orientation_lab = np.float32(orientation_lab[possible_scatterers_mask])
-        eB = np.float32(eB[possible_scatterers_mask])
+        eUB = eUB[possible_scatterers_mask]
         element_phase_map = element_phase_map[possible_scatterers_mask]
-        ecoord = np.float32(ecoord[possible_scatterers_mask])
+        element_grain_map = element_grain_map[possible_scatterers_mask]
+        element_index = element_index[possible_scatterers_mask]
+        ecoord = ecoord[possible_scatterers_mask]
+        evolumes = evolumes[possible_scatterers_mask]
 
-    reflections_df = (
-        pd.DataFrame()
-    )  # We create a dataframe to store all the relevant values for each individual reflection inr an organized manner
-    scattering_units = []  # The output
-
-    # For each phase of the sample, we compute all reflections at once in a vectorized manner
-    for i, phase in enumerate(phases):
-        # Get all scatterers belonging to one phase at a time, and the corresponding miller indices.
-        grain_index = np.where(element_phase_map == i)[0]
-        miller_indices = np.float32(phase.miller_indices)
-        # Get all scattering vectors for all scatterers in a given phase
-        G_0 = laue.get_G(orientation_lab[grain_index], eB[grain_index], miller_indices)
-        # Now G_0 and rho_factors are sent before computation to save memory when diffracting many grains.
-        reflection_index, time_values = (
-            laue.find_solutions_to_tangens_half_angle_equation(
-                G_0,
-                rho_0_factor,
-                rho_1_factor,
-                rho_2_factor,
-                rigid_body_motion.rotation_angle,
+    number_of_elements = ecoord.shape[0]
+    rotation_range = (
+        abs(rigid_body_motion.rotation_angle) if omega_range is None else omega_range[1] - omega_range[0]
+    )
+    block_size = _get_element_block_size(phases, number_of_elements, max_memory, rotation_range)
+
+    scattering_unit_tables = []
+    for start in range(0, number_of_elements, block_size):
+        block = slice(start, start + block_size)
+        scattering_unit_tables.append(
+            _diffract_block(
+                beam,
+                detector,
+                rigid_body_motion,
+                phases,
+                espherecentroids[block],
+                eUB[block],
+                element_phase_map[block],
+                element_grain_map[block],
+                element_index[block],
+                ecoord[block],
+                evolumes[block],
+                BB_intersection,
+                (rho_0_factor, rho_1_factor, rho_2_factor),
+                omega_range,
+                _get_block_intervals(proximity_intervals, block),
             )
         )
-        G_0_reflected = G_0.transpose(0, 2, 1)[
-            reflection_index[0, :], reflection_index[1, :]
-        ]
-
-        del G_0
-        # We now assemble the dataframes with the valid reflections for each grain and phase including time, hkl plane and G vector
-
-        table = pd.DataFrame(
-            {
-                "Grain": grain_index[reflection_index[0]],
-                "phase": i,
-                "hkl": reflection_index[1],
-                "time": time_values,
-                "G_0x": G_0_reflected[:, 0],
-                "G_0y": G_0_reflected[:, 1],
-                "G_0z": G_0_reflected[:, 2],
-            }
-        )
 
-        del G_0_reflected, reflection_index, time_values
-        reflections_df = pd.concat([reflections_df, table], axis=0).sort_values(
-            by="Grain"
+    if len(scattering_unit_tables) == 0:
+        return ScatteringUnitTable.empty(
+            beam.wave_vector,
+            beam.wavelength,
+            beam.polarization_vector,
+            rigid_body_motion.rotation_axis,
+            phases,
         )
+    return ScatteringUnitTable.concatenate(scattering_unit_tables)
 
-    reflections_df = reflections_df[
-        (0 < reflections_df["time"]) & (reflections_df["time"] < 1)
-    ]  # We filter out the times which exceed 0 or 1
-    reflections_df[["Gx", "Gy", "Gz"]] = rigid_body_motion.rotate(
-        reflections_df[["G_0x", "G_0y", "G_0z"]].values, reflections_df["time"].values
-    )
-    reflections_df[["k'x", "k'y", "k'z"]] = (
-        reflections_df[["Gx", "Gy", "Gz"]] + beam.wave_vector
+
+def _get_block_intervals(proximity_intervals, block):
+    """Select the proximity intervals of a block of elements, reindexed relative to the start of the block.
+
+    Args:
+        proximity_intervals (:obj:`tuple` of :obj:`numpy array`): Element indices, start times and end times of
+            intervals sorted by element, as given by :meth:`xrd_simulator.beam.Beam._get_proximity_intervals`, or None.
+        block (:obj:`slice`): Slice of the elements of the block.
+
+    Returns:
+        (:obj:`tuple` of :obj:`numpy array`) the intervals of the block, or None.
+
+    """
+    if proximity_intervals is None:
+        return None
+    interval_element, start_times, end_times = proximity_intervals
+    start, stop = np.searchsorted(interval_element, [block.start, block.stop])
+    return (
+        interval_element[start:stop] - block.start,
+        start_times[start:stop],
+        end_times[start:stop],
     )
-    reflections_df[["Source_x", "Source_y", "Source_z"]] = rigid_body_motion(
-        espherecentroids[reflections_df["Grain"]], reflections_df["time"].values
+
+
+def _get_interval_mask(element, time, proximity_intervals):
+    """Mask reflections occurring within a proximity interval of their element.
+
+    Args:
+        element (:obj:`numpy array`): Element index of each reflection ``shape=(n,)``.
+        time (:obj:`numpy array`): Time of each reflection ``shape=(n,)``.
+        proximity_intervals (:obj:`tuple` of :obj:`numpy array`): Element indices, start times and end times of
+            intervals sorted by element and time, see :meth:`xrd_simulator.beam.Beam._get_proximity_intervals`.
+
+    Returns:
+        (:obj:`numpy array`) boolean mask, True for reflections within an interval, ``shape=(n,)``.
+
+    """
+    interval_element, start_times, end_times = proximity_intervals
+    if len(interval_element) == 0:
+        return np.zeros((len(element),), dtype=bool)
+    # Times are on [0,1], such that element + time / 2 orders the intervals by element and then by time, the last
+    # interval starting before each reflection is the only one which may contain it.
+    interval = np.searchsorted(interval_element + start_times / 2.0, element + time / 2.0, side="right") - 1
+    found = interval >= 0
+    interval = np.maximum(interval, 0)
+    return found & (interval_element[interval] == element) & (time <= end_times[interval])
+
+
+def _get_scan_candidates(beam, rotation_scan, omega_range, espherecentroids, eradius):
+    """Mask elements with bounding spheres that come close to the beam during a rotation scan.
+
+    The scan is split into rotations of at most 90 degrees, for which the candidates are found as in
+    :func:`xrd_simulator.beam.Beam._get_proximity_intervals`.
+
+    Args:
+        beam (:obj:`xrd_simulator.beam.Beam`): Object representing a monochromatic beam of xrays.
+        rotation_scan (:obj:`xrd_simulator.motion._RotationScan`): Rotation of the scan.
+        omega_range (:obj:`tuple` of :obj:`float`): Start and end rotation angles (radians) of the scan.
+        espherecentroids (:obj:`numpy array`): Element bounding sphere centroids ``shape=(N,3)``.
+        eradius (:obj:`numpy array`): Element bounding sphere radii ``shape=(N,)``.
+
+    Returns:
+        (:obj:`numpy array`) boolean mask, True for elements which may intersect the beam, ``shape=(N,)``.
+
+    """
+    omega_start, omega_end = omega_range
+    number_of_rotations = int(np.ceil((omega_end - omega_start) / (np.pi / 2.0)))
+    omegas = np.linspace(omega_start, omega_end, number_of_rotations + 1)
+    mask = np.zeros((len(eradius),), dtype=bool)
+    for start, end in zip(omegas[:-1], omegas[1:]):
+        motion = RigidBodyMotion(rotation_scan.rotation_axis, end - start, np.zeros((3,)))
+        candidates, _ = beam._get_candidate_spheres(
+            rotation_scan(espherecentroids, start).reshape(-1, 3), eradius, motion
+        )
+        mask |= np.any(candidates, axis=0)
+    return mask
+
+
+def _diffract_elements(element_indices):
+    """Compute diffraction for a subset of elements in a worker process.
+
+    The element arrays are read from shared memory and the beam, detector, motion and phases from the worker
+    context, see :meth:`xrd_simulator.parallel.WorkerPool._map`.
+
+    Args:
+        element_indices (:obj:`numpy array`): Sorted indices of the elements to diffract.
+
+    Returns:
+        (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable`) the scattering units of the elements, with
+        phases set to None to keep the result compact when sent back to the parent process.
+
+    """
+    arrays, context = parallel._get_worker_state()
+    table = _diffract(
+        {
+            "espherecentroids": arrays["espherecentroids"][element_indices],
+            "eradius": arrays["eradius"][element_indices],
+            "eUB": arrays["eUB"][element_indices],
+            "element_phase_map": arrays["element_phase_map"][element_indices],
+            "element_grain_map": arrays["element_grain_map"][element_indices],
+            "element_index": element_indices,
+            "ecoord": arrays["coord"][arrays["enod"][element_indices]],
+            "evolumes": arrays["evolumes"][element_indices],
+            **context,
+        }
     )
-    reflections_df[["zd", "yd"]] = detector.get_intersection(
-        reflections_df[["k'x", "k'y", "k'z"]].values,
-        reflections_df[["Source_x", "Source_y", "Source_z"]].values,
+    table.phases = None
+    return table
+
+
+def _estimate_element_costs(
+    beam,
+    rigid_body_motion,
+    espherecentroids,
+    eradius,
+    proximity,
+    BB_intersection,
+    times=(0.0, 0.5, 1.0),
+):
+    """Estimate the relative cost of diffracting each element from its bounding sphere distance to the beam.
+
+    The spheres are classified as outside, inside or crossing the beam boundary from their signed distance to the
+    beam halfspaces at a few times of the rigid body motion.
+
+    Args:
+        beam (:obj:`xrd_simulator.beam.Beam`): Object representing a monochromatic beam of xrays.
+        rigid_body_motion (:obj:`xrd_simulator.motion.RigidBodyMotion`): Rigid body motion of the polycrystal.
+        espherecentroids (:obj:`numpy array`): Element bounding sphere centroids ``shape=(N,3)``.
+        eradius (:obj:`numpy array`): Element bounding sphere radii ``shape=(N,)``.
+        proximity (:obj:`bool`): True if elements far from the beam are rejected before solving the Laue equations.
+        BB_intersection (:obj:`bool`): True if the beam intersection is approximated by centroid inclusion.
+        times (:obj:`tuple` of :obj:`float`): Times of the motion at which to classify the spheres. Defaults to the
+            start, middle and end of the motion.
+
+    Returns:
+        (:obj:`numpy array`) of estimated costs ``shape=(N,)``.
+
+    """
+    normals, offsets = beam.halfspaces[:, 0:3], beam.halfspaces[:, 3]
+    crossing = np.zeros((len(eradius),), dtype=bool)
+    outside = np.ones((len(eradius),), dtype=bool)
+    for time in times:
+        centres = rigid_body_motion(espherecentroids, time).reshape(-1, 3)
+        distance = np.max(centres.dot(normals.T) + offsets, axis=1)
+        crossing |= np.abs(distance) <= eradius
+        outside &= distance > eradius
+
+    costs = np.ones((len(eradius),))
+    if proximity:
+        costs[outside] = _REJECTED_ELEMENT_COST
+    if not BB_intersection:
+        costs[crossing] += _BEAM_BOUNDARY_ELEMENT_COST
+    return costs
+
+
+def _get_balanced_tasks(costs, number_of_tasks):
+    """Partition elements into tasks of about equal estimated cost, ordered with the most expensive elements first.
+
+    Args:
+        costs (:obj:`numpy array`): Estimated cost per element ``shape=(N,)``.
+        number_of_tasks (:obj:`int`): Desired number of tasks.
+
+    Returns:
+        (:obj:`list` of :obj:`numpy array`) sorted element indices of each task, in the order in which the tasks
+        should be handed out to workers.
+
+    """
+    order = np.argsort(-costs, kind="stable")
+    cumulative_cost = np.cumsum(costs[order])
+    targets = cumulative_cost[-1] * np.arange(1, number_of_tasks) / number_of_tasks
+    bounds = np.searchsorted(cumulative_cost, targets, side="right")
+    return [np.sort(task) for task in np.split(order, bounds) if len(task) > 0]
+
+
+def _append_frames(detector, scattering_units, frame_index, number_of_frames):
+    """Split a table of scattering units into frames and append them to the detector.
+
+    Args:
+        detector (:obj:`xrd_simulator.detector.Detector`): Detector to append the frames to.
+        scattering_units (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable`): Scattering units of all frames.
+        frame_index (:obj:`numpy array`): Index of the frame of each scattering unit.
+        number_of_frames (:obj:`int`): Number of frames to append, some of which may be empty.
+
+    """
+    order = np.argsort(frame_index, kind="stable")
+    scattering_units = scattering_units.take(order)
+    frame_bounds = np.searchsorted(frame_index[order], np.arange(number_of_frames + 1))
+    for start, stop in zip(frame_bounds[:-1], frame_bounds[1:]):
+        detector.frames.append(scattering_units[start:stop])
+
+
+def _expand_grain_solutions(grain_indices, element_grain):
+    """Expand per grain solutions of the Laue equations to the member elements of the grains.
+
+    Args:
+        grain_indices (:obj:`numpy array`): Grain index of each solution ``shape=(n,)``.
+        element_grain (:obj:`numpy array`): Grain index of each element ``shape=(N,)``.
+
+    Returns:
+        (:obj:`tuple` of :obj:`numpy array`) element indices and the corresponding solution indices of the expanded
+        solutions, each solution is repeated once per member element of its grain.
+
+    """
+    members = np.argsort(element_grain, kind="stable")
+    member_counts = np.bincount(element_grain)
+    member_offsets = np.concatenate(([0], np.cumsum(member_counts)))
+    repeats = member_counts[grain_indices]
+    solution_indices = np.repeat(np.arange(grain_indices.shape[0]), repeats)
+    local_index = np.arange(solution_indices.shape[0]) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    element_indices = members[member_offsets[grain_indices][solution_indices] + local_index]
+    return element_indices, solution_indices
+
+
+def _get_grain_keys(element_phase_map, orientation_lab, strain_lab, elements):
+    """Phase index and orientation and strain components rounded onto the _GRAIN_KEY_RESOLUTION grid.
+
+    Returns:
+        (:obj:`numpy array`) integer keys of the elements ``shape=(n,19)``.
+
+    """
+    return np.concatenate(
+        (
+            np.asarray(element_phase_map[elements], dtype=np.int64).reshape(-1, 1),
+            np.round(orientation_lab[elements].reshape(-1, 9) / _GRAIN_KEY_RESOLUTION).astype(np.int64),
+            np.round(strain_lab[elements].reshape(-1, 9) / _GRAIN_KEY_RESOLUTION).astype(np.int64),
+        ),
+        axis=1,
     )
-    reflections_df = reflections_df[
-        detector.contains(reflections_df["zd"], reflections_df["yd"])
-    ]
 
-    element_vertices_0 = ecoord[reflections_df["Grain"]]
-    element_vertices = rigid_body_motion(
-        element_vertices_0, reflections_df["time"].values
+
+def _get_grain_map(element_phase_map, orientation_lab, strain_lab):
+    """Detect grains as the groups of elements with the same phase and (rounded) orientation and strain.
+
+    The rounded components of each element are hashed into a single integer, such that the grains are found by
+    sorting one integer per element. Hash collisions are detected by comparing the elements to the first element of
+    their grain, in which case the rounded components are compared in full.
+
+    Args:
+        element_phase_map (:obj:`numpy array`): Phase index of the elements ``shape=(N,)``.
+        orientation_lab (:obj:`numpy array`): Orientation matrices of the elements ``shape=(N,3,3)``.
+        strain_lab (:obj:`numpy array`): Strain tensors of the elements ``shape=(N,3,3)``.
+
+    Returns:
+        (:obj:`numpy array`) grain index of each element ``shape=(N,)``.
+
+    """
+    number_of_elements = len(element_phase_map)
+    multipliers = np.random.default_rng(0).integers(1, 2**63, size=(19,), dtype=np.uint64) | np.uint64(1)
+    hashes = np.zeros((number_of_elements,), dtype=np.uint64)
+    for start in range(0, number_of_elements, _GRAIN_KEY_CHUNK_SIZE):
+        chunk = slice(start, start + _GRAIN_KEY_CHUNK_SIZE)
+        keys = _get_grain_keys(element_phase_map, orientation_lab, strain_lab, chunk)
+        hashes[chunk] = np.sum(keys.astype(np.uint64) * multipliers, axis=1, dtype=np.uint64)
+    _, representative, element_grain_map = np.unique(hashes, return_index=True, return_inverse=True)
+
+    representative_keys = _get_grain_keys(element_phase_map, orientation_lab, strain_lab, representative)
+    for start in range(0, number_of_elements, _GRAIN_KEY_CHUNK_SIZE):
+        chunk = slice(start, start + _GRAIN_KEY_CHUNK_SIZE)
+        keys = _get_grain_keys(element_phase_map, orientation_lab, strain_lab, chunk)
+        if not np.array_equal(keys, representative_keys[element_grain_map[chunk]]):
+            _, element_grain_map = np.unique(
+                _get_grain_keys(element_phase_map, orientation_lab, strain_lab, slice(None)),
+                axis=0,
+                return_inverse=True,
+            )
+            break
+    return element_grain_map.reshape(-1)
+
+
+def _get_rigid_body_transform(points, moved_points):
+    """Rotation and translation that best move a set of points onto their moved positions (Kabsch algorithm).
+
+    Args:
+        points (:obj:`numpy array`): Points before the motion ``shape=(N,3)``.
+        moved_points (:obj:`numpy array`): The same points after the motion ``shape=(N,3)``.
+
+    Returns:
+        (:obj:`tuple` of :obj:`numpy array`) rotation matrix ``shape=(3,3)`` and translation ``shape=(3,)`` such that
+        moved_points are approximately rotation points + translation.
+
+    """
+    points = np.asarray(points, dtype=np.float64)
+    moved_points = np.asarray(moved_points, dtype=np.float64)
+    centroid, moved_centroid = np.mean(points, axis=0), np.mean(moved_points, axis=0)
+    u, _, vt = np.linalg.svd(np.matmul((points - centroid).T, moved_points - moved_centroid))
+    reflection = np.diag([1.0, 1.0, np.sign(np.linalg.det(np.matmul(vt.T, u.T)))])
+    rotation = np.matmul(np.matmul(vt.T, reflection), u.T)
+    return rotation, moved_centroid - np.matmul(rotation, centroid)
+
+
+def _get_element_block_size(phases, number_of_elements, max_memory, rotation_range):
+    """Number of elements that can be diffracted at once without exceeding a memory budget.
+
+    The dominating memory cost is that of the per reflection arrays (G vectors, scattered wavevectors,
+    etc.). Over a full turn each diffraction vector crosses the Ewald sphere twice, such that an element is
+    expected to give 2 * rotation_range / (2 pi) reflections per Miller index, see _BYTES_PER_REFLECTION.
+
+    Args:
+        phases (:obj:`list` of :obj:`xrd_simulator.phase.Phase`): Phases with diffracting planes set up.
+        number_of_elements (:obj:`int`): Total number of elements to be diffracted.
+        max_memory (:obj:`float`): Memory budget in bytes, None for no limit.
+        rotation_range (:obj:`float`): Angle (radians) rotated by the sample during the diffraction computation.
+
+    Returns:
+        (:obj:`int`) block size, at least 1.
+
+    """
+    number_of_hkls = max(len(phase.miller_indices) for phase in phases)
+    reflections_per_element = number_of_hkls * min(rotation_range / np.pi, 2.0)
+    if max_memory is None or reflections_per_element == 0:
+        return max(number_of_elements, 1)
+    bytes_per_element = _BYTES_PER_REFLECTION * reflections_per_element
+    return int(max(max_memory // bytes_per_element, 1))
+
+
+def _diffract_block(
+    beam,
+    detector,
+    rigid_body_motion,
+    phases,
+    espherecentroids,
+    eUB,
+    element_phase_map,
+    element_grain_map,
+    element_index,
+    ecoord,
+    evolumes,
+    BB_intersection,
+    rho_factors,
+    omega_range=None,
+    proximity_intervals=None,
+):
+    """Compute diffraction for a block of elements, see :func:`_diffract` for a description of the arguments.
+
+    If proximity_intervals, see :func:`_get_block_intervals`, are given reflections outside the intervals of their
+    elements are rejected.
+
+    Returns:
+        ScatteringUnitTable: A table of scattering units representing diffraction events.
+    """
+    rho_0_factor, rho_1_factor, rho_2_factor = rho_factors
+
+    # For each phase of the sample, we compute all reflections at once in a compiled kernel. The per phase
+    # results are collected and joined once after the loop, such that assembly is linear in the number of reflections.
+    reflection_element, reflection_phase, reflection_hkl, reflection_time, reflection_G_0 = (
+        [],
+        [],
+        [],
+        [],
+        [],
+    )
+    for i, phase in enumerate(phases):
+        # Get all scatterers belonging to one phase at a time, and the corresponding miller indices.
+        phase_element_index = np.where(element_phase_map == i)[0]
+        # Elements of a grain share orientation and strain, such that the Laue equations are solved once per grain,
+        # using the first element of the grain as representative.
+        _, representative, element_grain = np.unique(
+            element_grain_map[phase_element_index], return_index=True, return_inverse=True
+        )
+        # The scattering vectors are formed and the Laue equations solved per grain, keeping only the solutions
+        # within the motion, or within the rotation range of a rotation scan, in which the "time" of the motion
+        # is the rotation angle itself.
+        grain_indices, hkl_indices, time_values, G_0 = laue._find_reflections(
+            eUB[phase_element_index[representative]],
+            phase.miller_indices,
+            rho_0_factor,
+            rho_1_factor,
+            rho_2_factor,
+            delta_omega=rigid_body_motion.rotation_angle if omega_range is None else None,
+            omega_range=omega_range,
+        )
+        # The solutions of each grain are expanded to all of its member elements.
+        element_indices, solution_indices = _expand_grain_solutions(grain_indices, element_grain)
+        reflection_G_0.append(G_0[solution_indices])
+        reflection_element.append(phase_element_index[element_indices])
+        reflection_phase.append(np.full(element_indices.shape[0], i, dtype=int))
+        reflection_hkl.append(hkl_indices[solution_indices])
+        reflection_time.append(time_values[solution_indices])
+        del grain_indices, element_indices, solution_indices, hkl_indices, time_values, G_0
+
+    element = np.concatenate(reflection_element)
+    phase_index = np.concatenate(reflection_phase)
+    hkl_index = np.concatenate(reflection_hkl)
+    time = np.concatenate(reflection_time)
+    G_0 = np.concatenate(reflection_G_0, axis=0).reshape(-1, 3)
+    del reflection_element, reflection_phase, reflection_hkl, reflection_time, reflection_G_0
+
+    # Single ordering step: reflections are kept grouped by element and times outside (0, 1), or outside the
+    # proximity intervals of the element, are dropped.
+    order = np.argsort(element, kind="stable")
+    if omega_range is None:
+        order = order[(0 < time[order]) & (time[order] < 1)]
+    if proximity_intervals is not None:
+        order = order[_get_interval_mask(element[order], time[order], proximity_intervals)]
+    element, phase_index, hkl_index, time, G_0 = (
+        element[order],
+        phase_index[order],
+        hkl_index[order],
+        time[order],
+        G_0[order],
     )
 
-    reflections_np = (
-        reflections_df.values
-    )  # We move from pandas to numpy for enhanced speed
-    scattering_units = []
+    G = rigid_body_motion.rotate(G_0, time).reshape(-1, 3)
+    scattered_wave_vector = G + beam.wave_vector
+    source_point = rigid_body_motion(espherecentroids[element], time).reshape(-1, 3)
+    zd, yd = detector.get_intersection(scattered_wave_vector, source_point).T
+    mask = detector.contains(zd, yd)
 
     if BB_intersection:
         # A Bounding-Box intersection is a simplified way of computing the grains that interact with the beam (to enhance speed),
         # simply considering the beam as a prism and the tets that interact are those whose centroid is contained in the prism.
+        mask &= (
+            (source_point[:, 1] < beam.vertices[:, 1].max())
+            & (source_point[:, 1] > beam.vertices[:, 1].min())
+            & (source_point[:, 2] < beam.vertices[:, 2].max())
+            & (source_point[:, 2] > beam.vertices[:, 2].min())
+        )
+
+    element, phase_index, hkl_index, time = (
+        element[mask],
+        phase_index[mask],
+        hkl_index[mask],
+        time[mask],
+    )
+    scattered_wave_vector, zd, yd = scattered_wave_vector[mask], zd[mask], yd[mask]
+    element_vertices = rigid_body_motion(ecoord[element], time).reshape(-1, 4, 3)
 
-        reflections_np = reflections_np[
-            reflections_np[:, 14] < (beam.vertices[:, 1].max())
-        ]  #
-        reflections_np = reflections_np[
-            reflections_np[:, 14] > (beam.vertices[:, 1].min())
-        ]  #
-        reflections_np = reflections_np[
-            reflections_np[:, 15] < (beam.vertices[:, 2].max())
-        ]  #
-        reflections_np = reflections_np[
-            reflections_np[:, 15] > (beam.vertices[:, 2].min())
-        ]  #
-
-        for ei in range(reflections_np.shape[0]):
-            scattering_unit = ScatteringUnit(
-                ConvexHull(element_vertices[ei]),
-                reflections_np[ei, 10:13],  # outgoing wavevector
-                beam.wave_vector,
-                beam.wavelength,
-                beam.polarization_vector,
-                rigid_body_motion.rotation_axis,
-                reflections_np[ei, 3],  # time
-                phases[reflections_np[ei, 1].astype(int)],  # phase
-                reflections_np[ei, 2].astype(int),  # hkl index
-                ei,
-                zd=reflections_np[
-                    ei, 16
-                ],  # zd saved to avoid recomputing during redering
-                yd=reflections_np[ei, 17],
-            )  # yd saved to avoid recomputing during redering)
-
-            scattering_units.append(scattering_unit)
+    if BB_intersection:
+        # The scattering regions are the (rigidly moved) tets themselves, no convex hulls are needed.
+        volumes = evolumes[element]
+        vertices = element_vertices.reshape(-1, 3)
+        vertex_offsets = np.arange(0, 4 * element.shape[0] + 1, 4)
 
     else:
         """Otherwise, compute the true intersection of each tet with the beam to get the true scattering volume."""
-        for ei in range(element_vertices.shape[0]):
-            scattering_region = beam.intersect(element_vertices[ei])
-
-            if scattering_region is not None:
-                scattering_unit = ScatteringUnit(
-                    scattering_region,
-                    reflections_np[ei, 10:13],  # outgoing wavevector
-                    beam.wave_vector,
-                    beam.wavelength,
-                    beam.polarization_vector,
-                    rigid_body_motion.rotation_axis,
-                    reflections_np[ei, 3],  # time
-                    phases[reflections_np[ei, 1].astype(int)],  # phase
-                    reflections_np[ei, 2].astype(int),  # hkl index
-                    ei,
-                    zd=reflections_np[
-                        ei, 16
-                    ],  # zd saved to avoid recomputing during redering
-                    yd=reflections_np[
-                        ei, 17
-                    ],  # yd saved to avoid recomputing during redering
-                )
-
-                scattering_units.append(scattering_unit)
-
-    return scattering_units
+        volumes, vertices, vertex_offsets = beam._intersect_tetrahedra(
+            element_vertices, evolumes[element]
+        )
+        # Tets missing the beam have no vertices in the flat vertex buffer, so only the offsets are filtered.
+        mask = volumes > 0
+        element, phase_index, hkl_index, time = (
+            element[mask],
+            phase_index[mask],
+            hkl_index[mask],
+            time[mask],
+        )
+        scattered_wave_vector, zd, yd = scattered_wave_vector[mask], zd[mask], yd[mask]
+        volumes = volumes[mask]
+        vertex_offsets = np.concatenate(([0], np.cumsum(np.diff(vertex_offsets)[mask])))
+
+    if omega_range is not None:
+        # Rotation angles are stored as the fraction of the scan range, as for time in a rigid body motion.
+        time = (time - omega_range[0]) / (omega_range[1] - omega_range[0])
+
+    return ScatteringUnitTable(
+        element_index=element_index[element],
+        phase_index=phase_index,
+        hkl_index=hkl_index,
+        time=time,
+        scattered_wave_vector=scattered_wave_vector,
+        zd=zd,
+        yd=yd,
+        volume=volumes,
+        vertices=vertices,
+        vertex_offsets=vertex_offsets,
+        incident_wave_vector=beam.wave_vector,
+        wavelength=beam.wavelength,
+        incident_polarization_vector=beam.polarization_vector,
+        rotation_axis=rigid_body_motion.rotation_axis,
+        phases=phases,
+    )
 
 
 class Polycrystal:
@@ -236,7 +647,7 @@ class Polycrystal:
     Args:
         mesh (:obj:`xrd_simulator.mesh.TetraMesh`): Object representing a tetrahedral mesh which defines the
             geometry of the sample. (At instantiation it is assumed that the sample and lab coordinate systems
-            are aligned.)
+            are aligned.) The mesh is not copied and should not be modified after instantiation.
         orientation (:obj:`numpy array`): Per element orientation matrices (sometimes known by the capital letter U),
             (``shape=(N,3,3)``) or (``shape=(3,3)``) if the orientation is the same for all elements. The orientation
             matrix maps from crystal coordinates to sample coordinates.
@@ -247,6 +658,10 @@ class Polycrystal:
         element_phase_map (:obj:`numpy array`): Index of phase that elements belong to such that phases[element_phase_map[i]]
             gives the xrd_simulator.phase.Phase object of element number i. None if the sample is composed of a single phase.
             (Defaults to None)
+        element_grain_map (:obj:`numpy array`): Index of the grain that elements belong to (``shape=(N,)``). Elements of
+            a grain must share orientation, strain and phase, the diffraction condition is then solved once per grain.
+            None to detect the grains as the groups of elements with identical orientation, strain and phase.
+            (Defaults to None)
 
     Attributes:
         mesh_lab (:obj:`xrd_simulator.mesh.TetraMesh`): Object representing a tetrahedral mesh which defines the
@@ -259,39 +674,120 @@ class Polycrystal:
                                'sample':polycrystal_file,
                                'detector':detector_file},coordinate system. This quantity is not updated when the sample transforms.
         orientation_lab (:obj:`numpy array`): Per element orientation matrices mapping from the crystal to the lab coordinate
-            system, this quantity is updated when the sample transforms. (``shape=(N,3,3)``).
+            system, this quantity is updated when the sample transforms. (``shape=(N,3,3)``). Assigning new orientations
+            recomputes the quantities derived from them, in place modifications must be made with :func:`update_elements`.
         orientation_sample (:obj:`numpy array`): Per element orientation matrices mapping from the crystal to the sample
-            coordinate system.,  this quantity is not updated when the sample transforms. (``shape=(N,3,3)``).
+            coordinate system.,  this quantity is not updated when the sample transforms. (``shape=(N,3,3)``). It is
+            computed from orientation_lab, which is updated when new orientations are assigned.
         strain_lab (:obj:`numpy array`): Per element (Green-Lagrange) strain tensor in a fixed lab frame coordinate
-            system, this quantity is updated when the sample transforms. (``shape=(N,3,3)``).
+            system, this quantity is updated when the sample transforms. (``shape=(N,3,3)``). Assigning new strains
+            recomputes the quantities derived from them, in place modifications must be made with :func:`update_elements`.
         strain_sample (:obj:`numpy array`): Per element (Green-Lagrange) strain tensor in a sample coordinate
-            system., this quantity is not updated when the sample transforms. (``shape=(N,3,3)``).
+            system., this quantity is not updated when the sample transforms. (``shape=(N,3,3)``). It is computed
+            from strain_lab, which is updated when new strains are assigned.
         phases (:obj:`list` of :obj:`xrd_simulator.phase.Phase`): List of all unique phases present in the polycrystal.
         element_phase_map (:obj:`numpy array`): Index of phase that elements belong to such that phases[element_phase_map[i]]
             gives the xrd_simulator.phase.Phase object of element number i.
+        element_grain_map (:obj:`numpy array`): Index of grain that elements belong to, elements of the same grain
+            have identical orientation, strain and phase.
+        busy_times (:obj:`dict` of :obj:`float`): Time in seconds spent computing by each worker process, keyed by process
+            id, during the most recent call to :func:`diffract` or :func:`diffract_scan` with several processes, see
+            :attr:`xrd_simulator.parallel.WorkerPool.busy_times`. Useful to check the load balance of the computation.
 
     """
 
-    def __init__(self, mesh, orientation, strain, phases, element_phase_map=None):
+    def __init__(
+        self, mesh, orientation, strain, phases, element_phase_map=None, element_grain_map=None
+    ):
 
-        self.orientation_lab = self._instantiate_orientation(orientation, mesh)
-        self.strain_lab = self._instantiate_strain(strain, mesh)
+        self._orientation_lab = self._instantiate_orientation(orientation, mesh)
+        self._strain_lab = self._instantiate_strain(strain, mesh)
         self.element_phase_map, self.phases = self._instantiate_phase(
             phases, element_phase_map, mesh
         )
+        self.element_grain_map = self._instantiate_grain_map(
+            element_grain_map,
+            self.orientation_lab,
+            self.strain_lab,
+            self.element_phase_map,
+            mesh,
+        )
         self._eB = self._instantiate_eB(
             self.orientation_lab,
             self.strain_lab,
             self.phases,
             self.element_phase_map,
-            mesh,
         )
 
-        # Assuming sample and lab frames to be aligned at instantiation.
-        self.mesh_lab = copy.deepcopy(mesh)
-        self.mesh_sample = copy.deepcopy(mesh)
-        self.strain_sample = np.copy(self.strain_lab)
-        self.orientation_sample = np.copy(self.orientation_lab)
+        # Assuming sample and lab frames to be aligned at instantiation. The lab frame mesh shares all arrays with the
+        # sample frame mesh until the polycrystal is transformed.
+        self.mesh_sample = mesh
+        self.mesh_lab = _MovedTetraMesh(mesh)
+
+        # The lab frame orientations and strains are rotated from the arrays as they were set, see _move_element_arrays().
+        self._set_element_arrays_reference()
+
+        # Incremented whenever the lab frame arrays are replaced, see xrd_simulator.parallel.WorkerPool. Updates of a
+        # subset of the elements instead increment the revision and are logged, as (revision, element indices), such
+        # that only the updated rows are written into the arrays resident in a worker pool.
+        self._version = 0
+        self._revision = 0
+        self._element_updates = []
+
+        # Index of the next grain created by update_elements(), found when first needed.
+        self._next_grain_index = None
+
+        # Maximum Bragg angle of the most recent beam and detector, as (key, angle), see _get_bragg_angle_bounds().
+        self._max_bragg_angle_cache = None
+
+        # Per element products of the orientation and B matrices, see _get_eUB().
+        self._eUB = None
+
+        # Elements updated since the last call to diffract, see update_elements().
+        self._updated_elements = np.zeros((mesh.number_of_elements,), dtype=bool)
+
+        self.busy_times = {}
+
+    def __getstate__(self):
+        # The lab frame arrays are recomputed from the reference arrays on unpickling.
+        state = self.__dict__.copy()
+        del state["_orientation_lab"], state["_strain_lab"]
+        state["_eUB"] = None
+        return state
+
+    def __setstate__(self, state):
+        # Polycrystals pickled by earlier versions lack the attributes added since, which are given their defaults.
+        if not isinstance(state["mesh_lab"], _MovedTetraMesh):
+            # The lab frame mesh was a moved copy of the sample frame mesh, stored with the sample frame arrays.
+            mesh_lab = _MovedTetraMesh(state["mesh_sample"])
+            mesh_lab.rotation, mesh_lab.translation = _get_rigid_body_transform(
+                state["mesh_sample"].coord, state["mesh_lab"].coord
+            )
+            state["mesh_lab"] = mesh_lab
+            state.pop("orientation_sample", None)
+            state.pop("strain_sample", None)
+        for name in ("orientation_lab", "strain_lab"):
+            if name in state:
+                state["_" + name] = state.pop(name)
+        state.setdefault("_version", 0)
+        state.setdefault("_revision", 0)
+        state.setdefault("_element_updates", [])
+        state.setdefault("_next_grain_index", None)
+        state.setdefault("_max_bragg_angle_cache", None)
+        state.setdefault("_eUB", None)
+        state.setdefault("busy_times", {})
+        self.__dict__.update(state)
+        if "_orientation_reference" in state:
+            self._move_element_arrays()
+        else:
+            self._set_element_arrays_reference()
+        if "_updated_elements" not in state:
+            # No frame computed before pickling is known to be up to date.
+            self._updated_elements = np.ones((self.mesh_sample.number_of_elements,), dtype=bool)
+        if "element_grain_map" not in state:
+            self.element_grain_map = self._instantiate_grain_map(
+                None, self.orientation_lab, self.strain_lab, self.element_phase_map, self.mesh_sample
+            )
 
     def diffract(
         self,
@@ -305,6 +801,9 @@ class Polycrystal:
         number_of_frames=1,
         proximity=False,
         BB_intersection=False,
+        max_memory=None,
+        worker_pool=None,
+        update_frame=None,
     ):
         """Compute diffraction from the rotating and translating polycrystal while illuminated by an xray beam.
 
@@ -335,88 +834,131 @@ class Polycrystal:
             BB_intersection (:obj:`bool`): Set to True in order to assume the beam as a square prism, the scattering volume for the tetrahedra
                 to be the whole tetrahedron and the scattering tetrahedra to be all those whose centroids are included in the square prism.
                 Greatly speeds up computation, valid approximation for powder-like samples.
+            max_memory (:obj:`float`): Approximate upper bound, in bytes, on the memory used for the intermediate diffraction
+                arrays (G vectors and Laue equation solutions) of all processes combined. When set, the elements are
+                streamed through the computation in blocks such that peak memory does not grow with the sample size.
+                Defaults to None, in which case all elements of a process are diffracted at once.
+            worker_pool (:obj:`xrd_simulator.parallel.WorkerPool`): Optional persistent pool of worker processes to use
+                for the computation, in which case number_of_processes is taken from the pool. The sample arrays are kept
+                resident in the pool between calls for as long as the polycrystal is not transformed. Defaults to None,
+                in which case a new pool is started (and closed) if number_of_processes is larger than 1.
+            update_frame (:obj:`int`): Optional index of a detector frame computed by the previous call to diffract with
+                the same beam, detector and rigid body motion. Only the elements changed by :func:`update_elements`
+                since that call are diffracted, and a copy of the frame with the scattering units of these elements
+                replaced is appended to the detector. Only a single frame can be updated. Defaults to None, in which
+                case all elements are diffracted.
 
         """
-        if verbose and number_of_processes != 1:
-            raise NotImplemented(
-                "Verbose mode is not implemented for multiprocesses computations"
-            )
-
-        min_bragg_angle, max_bragg_angle = self._get_bragg_angle_bounds(
-            detector, beam, min_bragg_angle, max_bragg_angle
+        if update_frame is None:
+            element_indices = None
+        elif number_of_frames != 1:
+            raise ValueError("update_frame can only be used with number_of_frames=1")
+        else:
+            element_indices = np.where(self._updated_elements)[0]
+
+        all_scattering_units = self._get_scattering_units(
+            beam,
+            detector,
+            rigid_body_motion,
+            min_bragg_angle,
+            max_bragg_angle,
+            verbose,
+            number_of_processes,
+            proximity,
+            BB_intersection,
+            max_memory,
+            worker_pool,
+            element_indices=element_indices,
         )
 
-        for phase in self.phases:
-            with utils._verbose_manager(verbose):
-                phase.setup_diffracting_planes(
-                    beam.wavelength, min_bragg_angle, max_bragg_angle
-                )
-
-        espherecentroids = np.array_split(
-            self.mesh_lab.espherecentroids, number_of_processes, axis=0
-        )
-        eradius = np.array_split(self.mesh_lab.eradius, number_of_processes, axis=0)
-        orientation_lab = np.array_split(
-            self.orientation_lab, number_of_processes, axis=0
-        )
-        eB = np.array_split(self._eB, number_of_processes, axis=0)
-        element_phase_map = np.array_split(
-            self.element_phase_map, number_of_processes, axis=0
-        )
-        enod = np.array_split(self.mesh_lab.enod, number_of_processes, axis=0)
-
-        args = []
-        for i in range(number_of_processes):
-            ecoord = np.zeros((enod[i].shape[0], 4, 3))
-            for k, en in enumerate(enod[i]):
-                ecoord[k, :, :] = self.mesh_lab.coord[en]
-            args.append(
-                {
-                    "beam": beam,
-                    "detector": detector,
-                    "rigid_body_motion": rigid_body_motion,
-                    "phases": self.phases,
-                    "espherecentroids": espherecentroids[i],
-                    "eradius": eradius[i],
-                    "orientation_lab": orientation_lab[i],
-                    "eB": eB[i],
-                    "element_phase_map": element_phase_map[i],
-                    "ecoord": ecoord,
-                    "verbose": verbose,
-                    "proximity": proximity,
-                    "BB_intersection": BB_intersection,
-                }
+        if update_frame is not None:
+            previous_scattering_units = detector.frames[update_frame]
+            unchanged = ~self._updated_elements[previous_scattering_units.element_index]
+            all_scattering_units = ScatteringUnitTable.concatenate(
+                [previous_scattering_units.take(np.where(unchanged)[0]), all_scattering_units]
             )
-
-        if number_of_processes == 1:
-            all_scattering_units = _diffract(args[0])
-
-        else:
-            with Pool(number_of_processes) as p:
-                scattering_units = p.map(_diffract, args)
-            all_scattering_units = []
-            for su in scattering_units:
-                all_scattering_units.extend(su)
+            all_scattering_units = all_scattering_units.take(
+                np.argsort(all_scattering_units.element_index, kind="stable")
+            )
+        self._updated_elements[:] = False
 
         if number_of_frames == 1:
             detector.frames.append(all_scattering_units)
         else:
             # TODO: unit test
-            all_scattering_units.sort(
-                key=lambda scattering_unit: scattering_unit.time, reverse=True
+            frame_index = np.minimum(
+                (all_scattering_units.time * number_of_frames).astype(int),
+                number_of_frames - 1,
             )
-            dt = 1.0 / number_of_frames
-            start_time_of_current_frame = 0
-            while start_time_of_current_frame <= 1 - 1e-8:
-                frame = []
-                while (
-                    len(all_scattering_units) > 0
-                    and all_scattering_units[-1].time < start_time_of_current_frame + dt
-                ):
-                    frame.append(all_scattering_units.pop())
-                start_time_of_current_frame += dt
-                detector.frames.append(frame)
-            assert len(all_scattering_units) == 0
+            _append_frames(detector, all_scattering_units, frame_index, number_of_frames)
+
+    def diffract_scan(
+        self,
+        beam,
+        detector,
+        omega_edges,
+        rotation_axis=np.array([0, 0, 1.0]),
+        min_bragg_angle=0,
+        max_bragg_angle=None,
+        verbose=False,
+        number_of_processes=1,
+        proximity=False,
+        BB_intersection=False,
+        max_memory=None,
+        worker_pool=None,
+    ):
+        """Compute diffraction from a rotation scan of the polycrystal, collecting one detector frame per angular interval.
+
+        The result is the same as rotating the polycrystal step by step with :func:`diffract` and :func:`transform`,
+        collecting one frame per step, but the diffracting planes are set up and the Laue equations are solved once for
+        the full angular range, such that a full scan costs about as much as a single call to :func:`diffract`.
+
+        The rotation angles are relative to the current position of the polycrystal, which is not transformed by the scan.
+
+        Args:
+            beam (:obj:`xrd_simulator.beam.Beam`): Object representing a monochromatic beam of xrays.
+            detector (:obj:`xrd_simulator.detector.Detector`): Object representing a flat rectangular detector.
+            omega_edges (:obj:`numpy array`): Increasing rotation angles (radians) delimiting the frames of the scan, frame
+                number i integrates the signal between omega_edges[i] and omega_edges[i+1]. The full scan may be at most
+                2 pi wide. ``shape=(number_of_frames+1,)``
+            rotation_axis (:obj:`numpy array`): Rotation axis of the scan, through the lab origin ``shape=(3,)``.
+                Defaults to the lab z-axis.
+            min_bragg_angle, max_bragg_angle, verbose, number_of_processes, proximity, BB_intersection, max_memory,
+                worker_pool: See :func:`diffract`.
+
+        """
+        omega_edges = np.asarray(omega_edges, dtype=float)
+        assert len(omega_edges) > 1 and np.all(
+            np.diff(omega_edges) > 0
+        ), "omega_edges must be increasing and delimit at least one frame"
+        omega_range = (omega_edges[0], omega_edges[-1])
+        assert (
+            omega_range[1] - omega_range[0] <= 2 * np.pi
+        ), "The rotation scan must be at most 2 pi wide"
+
+        all_scattering_units = self._get_scattering_units(
+            beam,
+            detector,
+            _RotationScan(rotation_axis),
+            min_bragg_angle,
+            max_bragg_angle,
+            verbose,
+            number_of_processes,
+            proximity,
+            BB_intersection,
+            max_memory,
+            worker_pool,
+            omega_range=omega_range,
+        )
+
+        number_of_frames = len(omega_edges) - 1
+        omega = omega_range[0] + all_scattering_units.time * (
+            omega_range[1] - omega_range[0]
+        )
+        frame_index = np.clip(
+            np.searchsorted(omega_edges, omega, side="right") - 1, 0, number_of_frames - 1
+        )
+        _append_frames(detector, all_scattering_units, frame_index, number_of_frames)
 
     def transform(self, rigid_body_motion, time):
         """Transform the polycrystal by performing a rigid body motion (translation + rotation)
@@ -428,20 +970,151 @@ class Polycrystal:
 
         """
         self.mesh_lab.update(rigid_body_motion, time)
+        self._version += 1
+        self._element_updates = []
+
+        self._move_element_arrays()
+        # All elements have moved, such that no previous frame can be updated.
+        self._updated_elements[:] = True
+
+        # The B matrices are invariant under rigid body motions, such that the cached mapping from Miller indices to
+        # lab frame diffraction vectors is updated by a single matmul. It is taken from the rotated orientations,
+        # rather than by rotating the cache itself, which would accumulate rounding errors, see _move_element_arrays().
+        if self._eUB is not None:
+            self._eUB = np.matmul(self.orientation_lab, self._eB)
+
+    def update_elements(self, element_indices, orientation=None, strain=None):
+        """Update the crystal orientation and/or strain of a subset of the elements.
+
+        Only the B matrices of the updated elements are recomputed. The updated elements are recorded such that the
+        next call to :func:`diffract` may recompute only their scattering units, see the update_frame keyword.
+        Updated elements are no longer considered part of their previous grains.
+
+        Args:
+            element_indices (:obj:`numpy array`): Indices of the elements to update ``shape=(n,)``.
+            orientation (:obj:`numpy array`): New orientation matrices of the elements, in lab coordinates, ``shape=(n,3,3)``
+                or (``shape=(3,3)``) if the orientation is the same for all updated elements. Defaults to None, in which
+                case the orientations are kept.
+            strain (:obj:`numpy array`): New (Green-Lagrange) strain tensors of the elements, in lab coordinates,
+                ``shape=(n,3,3)`` or (``shape=(3,3)``) if the strain is the same for all updated elements. Defaults to None,
+                in which case the strains are kept.
 
-        Rot_mat = rigid_body_motion.rotator.get_rotation_matrix(
-            rigid_body_motion.rotation_angle * time
+        """
+        element_indices = np.asarray(element_indices, dtype=int).reshape(-1)
+        self._set_element_arrays_reference()
+        if orientation is not None:
+            orientation = np.broadcast_to(orientation, (len(element_indices), 3, 3))
+            self.orientation_lab[element_indices] = orientation
+        if strain is not None:
+            strain = np.broadcast_to(strain, (len(element_indices), 3, 3))
+            self.strain_lab[element_indices] = strain
+
+        self._eB[element_indices] = self._instantiate_eB(
+            self.orientation_lab[element_indices],
+            self.strain_lab[element_indices],
+            self.phases,
+            self.element_phase_map[element_indices],
+        )
+        if self._eUB is not None:
+            self._eUB[element_indices] = np.matmul(
+                self.orientation_lab[element_indices], self._eB[element_indices]
+            )
+        if self._next_grain_index is None:
+            self._next_grain_index = np.max(self.element_grain_map) + 1
+        self.element_grain_map[element_indices] = self._next_grain_index + np.arange(len(element_indices))
+        self._next_grain_index += len(element_indices)
+        self._updated_elements[element_indices] = True
+        self._revision += 1
+        self._element_updates.append((self._revision, element_indices))
+
+    @property
+    def orientation_lab(self):
+        return self._orientation_lab
+
+    @orientation_lab.setter
+    def orientation_lab(self, orientation):
+        self._orientation_lab = self._instantiate_orientation(orientation, self.mesh_sample)
+        self._set_element_arrays_reference()
+        self._update_all_elements()
+
+    @property
+    def strain_lab(self):
+        return self._strain_lab
+
+    @strain_lab.setter
+    def strain_lab(self, strain):
+        self._strain_lab = self._instantiate_strain(strain, self.mesh_sample)
+        self._set_element_arrays_reference()
+        self._update_all_elements()
+
+    def _set_element_arrays_reference(self):
+        """Set the current lab frame orientations and strains, and the rotation of the sample, as the reference."""
+        self._orientation_reference = self._orientation_lab
+        self._strain_reference = self._strain_lab
+        self._reference_rotation = np.array(self.mesh_lab.rotation, dtype=np.float64)
+
+    def _move_element_arrays(self):
+        """Rotate the reference orientations and strains to the lab frame by the sample rotation since they were set.
+
+        The rotation is accumulated in double precision by the lab frame mesh, such that the lab frame arrays are
+        rounded once per transform, whichever their precision, rather than accumulating the rounding errors of
+        repeated rotations.
+
+        """
+        if np.array_equal(self.mesh_lab.rotation, self._reference_rotation):
+            self._orientation_lab = self._orientation_reference
+            self._strain_lab = self._strain_reference
+            return
+        rotation = np.matmul(self.mesh_lab.rotation, self._reference_rotation.T)
+        orientation_rotation = rotation.astype(self._orientation_reference.dtype)
+        strain_rotation = rotation.astype(self._strain_reference.dtype)
+        self._orientation_lab = np.matmul(orientation_rotation, self._orientation_reference)
+        self._strain_lab = np.matmul(np.matmul(strain_rotation, self._strain_reference), strain_rotation.T)
+
+    def _update_all_elements(self):
+        """Recompute the quantities derived from the orientations and strains of all elements, see :func:`update_elements`."""
+        self.element_grain_map = self._instantiate_grain_map(
+            None, self.orientation_lab, self.strain_lab, self.element_phase_map, self.mesh_sample
+        )
+        self._eB = self._instantiate_eB(
+            self.orientation_lab, self.strain_lab, self.phases, self.element_phase_map
+        )
+        self._eUB = None
+        self._next_grain_index = None
+        self._updated_elements[:] = True
+        self._version += 1
+        self._element_updates = []
+
+    @property
+    def orientation_sample(self):
+        # Sample frame orientations are only needed for output and are therefore not stored.
+        return np.matmul(self._reference_rotation.T, self._orientation_reference)
+
+    @orientation_sample.setter
+    def orientation_sample(self, orientation):
+        self.orientation_lab = np.matmul(self.mesh_lab.rotation, orientation)
+
+    @property
+    def strain_sample(self):
+        return np.matmul(
+            np.matmul(self._reference_rotation.T, self._strain_reference), self._reference_rotation
         )
 
-        self.orientation_lab = np.matmul(Rot_mat, self.orientation_lab)
+    @strain_sample.setter
+    def strain_sample(self, strain):
+        self.strain_lab = np.matmul(
+            np.matmul(self.mesh_lab.rotation, strain), self.mesh_lab.rotation.T
+        )
 
-        self.strain_lab = np.matmul(np.matmul(Rot_mat, self.strain_lab), Rot_mat.T)
+    def save(self, path, save_mesh_as_xdmf=True, quaternions=False):
+        """Save polycrystal to disc (via pickling, or in HDF5 format if the path ends with .hdf5).
 
-    def save(self, path, save_mesh_as_xdmf=True):
-        """Save polycrystal to disc (via pickling).
+        The HDF5 format stores the mesh and the per element arrays contiguously, such that :func:`load` can memory
+        map them and large samples can be used without first being read into memory.
 
         Args:
-            path (:obj:`str`): File path at which to save, ending with the desired filename.
+            path (:obj:`str`): File path at which to save, ending with the desired filename. If the path ends with
+                .hdf5 the polycrystal is saved in HDF5 format, otherwise it is pickled to a .pc file.
             save_mesh_as_xdmf (:obj:`bool`): If true, saves the polycrystal mesh with associated
                 strains and crystal orientations as a .xdmf for visualization (sample coordinates).
                 The results can be vizualised with for instance paraview (https://www.paraview.org/).
@@ -449,32 +1122,40 @@ class Polycrystal:
                 tensor (in sample coordinates) and the 3 Bunge Euler angles (Bunge, H. J. (1982). Texture
                 Analysis in Materials Science. London: Butterworths.). Additionally a single field specifying
                 the material phases of the sample will be saved.
+            quaternions (:obj:`bool`): If true, and saving in HDF5 format, the orientations are stored as unit
+                quaternions ``shape=(N,4)``, which are converted back to matrices, in memory, on load. Defaults to False.
 
         """
-        if not path.endswith(".pc"):
-            pickle_path = path + ".pc"
-            xdmf_path = path + ".xdmf"
-        else:
-            pickle_path = path
+        if path.endswith(".hdf5"):
             xdmf_path = path.split(".")[0] + ".xdmf"
-        with open(pickle_path, "wb") as f:
-            dill.dump(self, f, dill.HIGHEST_PROTOCOL)
+            self._save_hdf5(path, quaternions)
+        else:
+            if not path.endswith(".pc"):
+                pickle_path = path + ".pc"
+                xdmf_path = path + ".xdmf"
+            else:
+                pickle_path = path
+                xdmf_path = path.split(".")[0] + ".xdmf"
+            with open(pickle_path, "wb") as f:
+                dill.dump(self, f, dill.HIGHEST_PROTOCOL)
         if save_mesh_as_xdmf:
+            strain_sample = self.strain_sample
+            orientation_sample = self.orientation_sample
             element_data = {}
-            element_data["Strain Tensor Component xx"] = self.strain_sample[:, 0, 0]
-            element_data["Strain Tensor Component yy"] = self.strain_sample[:, 1, 1]
-            element_data["Strain Tensor Component zz"] = self.strain_sample[:, 2, 2]
-            element_data["Strain Tensor Component xy"] = self.strain_sample[:, 0, 1]
-            element_data["Strain Tensor Component xz"] = self.strain_sample[:, 0, 2]
-            element_data["Strain Tensor Component yz"] = self.strain_sample[:, 1, 2]
+            element_data["Strain Tensor Component xx"] = strain_sample[:, 0, 0]
+            element_data["Strain Tensor Component yy"] = strain_sample[:, 1, 1]
+            element_data["Strain Tensor Component zz"] = strain_sample[:, 2, 2]
+            element_data["Strain Tensor Component xy"] = strain_sample[:, 0, 1]
+            element_data["Strain Tensor Component xz"] = strain_sample[:, 0, 2]
+            element_data["Strain Tensor Component yz"] = strain_sample[:, 1, 2]
             element_data["Bunge Euler Angle phi_1 [degrees]"] = []
             element_data["Bunge Euler Angle Phi [degrees]"] = []
             element_data["Bunge Euler Angle phi_2 [degrees]"] = []
             element_data["Misorientation from mean orientation [degrees]"] = []
 
-            misorientations = utils._get_misorientations(self.orientation_sample)
+            misorientations = utils._get_misorientations(orientation_sample)
 
-            for U, misorientation in zip(self.orientation_sample, misorientations):
+            for U, misorientation in zip(orientation_sample, misorientations):
                 phi_1, PHI, phi_2 = tools.u_to_euler(U)
                 element_data["Bunge Euler Angle phi_1 [degrees]"].append(
                     np.degrees(phi_1)
@@ -493,7 +1174,10 @@ class Polycrystal:
 
     @classmethod
     def load(cls, path):
-        """Load polycrystal from disc (via pickling).
+        """Load polycrystal from disc (via pickling, or in HDF5 format if the path ends with .hdf5).
+
+        The mesh and per element arrays of HDF5 files are memory mapped (copy on write), such that they are read from
+        disc only as they are accessed and the file itself is never modified.
 
         Args:
             path (:obj:`str`): File path at which to load, ending with the desired filename.
@@ -504,19 +1188,79 @@ class Polycrystal:
             Never unpickle data received from an untrusted or unauthenticated source.
 
         """
+        if path.endswith(".hdf5"):
+            return cls._load_hdf5(path)
         if not path.endswith(".pc"):
-            raise ValueError("The loaded polycrystal file must end with .pc")
+            raise ValueError("The loaded polycrystal file must end with .pc or .hdf5")
         with open(path, "rb") as f:
             return dill.load(f)
 
+    def _save_hdf5(self, path, quaternions):
+        """Save the polycrystal to a HDF5 file, see :func:`save`."""
+        with h5py.File(path, "w") as f:
+            f.attrs["format"] = "xrd_simulator.polycrystal.Polycrystal"
+            f.attrs["version"] = 1
+            self.mesh_sample._save_hdf5(f.create_group("mesh_sample"))
+            group = f.create_group("polycrystal")
+            if quaternions:
+                group.create_dataset(
+                    "orientation_quaternions",
+                    data=Rotation.from_matrix(self.orientation_lab).as_quat().astype(self.orientation_lab.dtype),
+                )
+            else:
+                group.create_dataset("orientation_lab", data=self.orientation_lab)
+            group.create_dataset("strain_lab", data=self.strain_lab)
+            group.create_dataset("eB", data=self._eB)
+            group.create_dataset("element_phase_map", data=self.element_phase_map)
+            group.create_dataset("element_grain_map", data=self.element_grain_map)
+            group.create_dataset("sample_to_lab_rotation", data=self.mesh_lab.rotation)
+            group.create_dataset("sample_to_lab_translation", data=self.mesh_lab.translation)
+            group.create_dataset(
+                "phases", data=np.frombuffer(dill.dumps(self.phases, dill.HIGHEST_PROTOCOL), dtype=np.uint8)
+            )
+
+    @classmethod
+    def _load_hdf5(cls, path):
+        """Load a polycrystal from a HDF5 file written by :func:`_save_hdf5`, memory mapping the large arrays."""
+        # The state is restored as saved, rather than recomputed by __init__, such that no array is read in full.
+        polycrystal = cls.__new__(cls)
+        with h5py.File(path, "r") as f:
+            if f.attrs.get("format") != "xrd_simulator.polycrystal.Polycrystal":
+                raise ValueError("The file " + path + " does not hold a polycrystal")
+            polycrystal.mesh_sample = TetraMesh._load_hdf5(path, f["mesh_sample"])
+            group = f["polycrystal"]
+            if "orientation_quaternions" in group:
+                quaternions = group["orientation_quaternions"][()]
+                polycrystal._orientation_lab = Rotation.from_quat(quaternions).as_matrix().astype(quaternions.dtype)
+            else:
+                polycrystal._orientation_lab = utils._load_hdf5_array(path, group["orientation_lab"])
+            polycrystal._strain_lab = utils._load_hdf5_array(path, group["strain_lab"])
+            polycrystal._eB = utils._load_hdf5_array(path, group["eB"])
+            polycrystal.element_phase_map = utils._load_hdf5_array(path, group["element_phase_map"])
+            polycrystal.element_grain_map = utils._load_hdf5_array(path, group["element_grain_map"])
+            polycrystal.phases = dill.loads(group["phases"][()].tobytes())
+            polycrystal.mesh_lab = _MovedTetraMesh(polycrystal.mesh_sample)
+            polycrystal.mesh_lab.rotation = group["sample_to_lab_rotation"][()]
+            polycrystal.mesh_lab.translation = group["sample_to_lab_translation"][()]
+        polycrystal._set_element_arrays_reference()
+        polycrystal._version = 0
+        polycrystal._revision = 0
+        polycrystal._element_updates = []
+        polycrystal._next_grain_index = None
+        polycrystal._max_bragg_angle_cache = None
+        polycrystal._eUB = None
+        number_of_elements = polycrystal.mesh_sample.number_of_elements
+        polycrystal._updated_elements = np.zeros((number_of_elements,), dtype=bool)
+        return polycrystal
+
     def _instantiate_orientation(self, orientation, mesh):
         """Instantiate the orientations using for smart multi shape handling."""
         if orientation.shape == (3, 3):
             orientation_lab = np.repeat(
-                orientation.reshape(1, 3, 3), mesh.number_of_elements, axis=0
+                utils._as_precision(orientation).reshape(1, 3, 3), mesh.number_of_elements, axis=0
             )
         elif orientation.shape == (mesh.number_of_elements, 3, 3):
-            orientation_lab = np.copy(orientation)
+            orientation_lab = np.array(orientation, dtype=utils.get_precision())
         else:
             raise ValueError("orientation input is of incompatible shape")
         return orientation_lab
@@ -525,10 +1269,10 @@ class Polycrystal:
         """Instantiate the strain using for smart multi shape handling."""
         if strain.shape == (3, 3):
             strain_lab = np.repeat(
-                strain.reshape(1, 3, 3), mesh.number_of_elements, axis=0
+                utils._as_precision(strain).reshape(1, 3, 3), mesh.number_of_elements, axis=0
             )
         elif strain.shape == (mesh.number_of_elements, 3, 3):
-            strain_lab = np.copy(strain)
+            strain_lab = np.array(strain, dtype=utils.get_precision())
         else:
             raise ValueError("strain input is of incompatible shape")
         return strain_lab
@@ -543,9 +1287,17 @@ class Polycrystal:
             element_phase_map = np.zeros((mesh.number_of_elements,), dtype=int)
         return element_phase_map, phases
 
-    def _instantiate_eB(
-        self, orientation_lab, strain_lab, phases, element_phase_map, mesh
+    def _instantiate_grain_map(
+        self, element_grain_map, orientation_lab, strain_lab, element_phase_map, mesh
     ):
+        """Instantiate the grain map, grains are detected as groups of identical elements if no map is given."""
+        if element_grain_map is None:
+            element_grain_map = _get_grain_map(element_phase_map, orientation_lab, strain_lab)
+        elif np.shape(element_grain_map) != (mesh.number_of_elements,):
+            raise ValueError("element_grain_map input is of incompatible shape")
+        return np.asarray(element_grain_map, dtype=int).reshape(-1)
+
+    def _instantiate_eB(self, orientation_lab, strain_lab, phases, element_phase_map):
         """Compute per element 3x3 B matrices that map hkl (Miller) values to crystal coordinates.
 
         (These are upper triangular matrices such that
@@ -553,32 +1305,230 @@ class Polycrystal:
         where G_hkl = [h,k,l] lattice plane miller indices and G_s is the sample frame diffraction vectors.
         and U are the crystal element orientation matrices.)
 
+        The B matrices are computed in double precision and stored in the precision of the orientations.
+
         """
-        _eB = np.zeros((mesh.number_of_elements, 3, 3))
+        _eB = np.zeros((len(element_phase_map), 3, 3), dtype=orientation_lab.dtype)
         B0s = np.zeros((len(phases), 3, 3))
         for i, phase in enumerate(phases):
             B0s[i] = tools.form_b_mat(phase.unit_cell)
             grain_indices = np.where(np.array(element_phase_map) == i)[0]
             _eB[grain_indices] = utils.lab_strain_to_B_matrix(
-                strain_lab[grain_indices], orientation_lab[grain_indices], B0s[i]
+                np.asarray(strain_lab[grain_indices], dtype=np.float64),
+                np.asarray(orientation_lab[grain_indices], dtype=np.float64),
+                B0s[i],
             )
 
         return _eB
 
+    def _get_eUB(self):
+        """Per element products of the orientation and B matrices (``shape=(N,3,3)``) such that
+            G_0 = U * B G_hkl
+        are the lab frame diffraction vectors of the Miller indices G_hkl.
+
+        The products are computed on first use. :func:`transform` and :func:`update_elements` update the cached
+        products, from the rotated respectively updated orientations and B matrices, while the orientation_lab and
+        strain_lab setters reset them to be recomputed. All of these increment the version of the lab frame arrays.
+
+        """
+        if self._eUB is None:
+            self._eUB = np.matmul(self.orientation_lab, self._eB)
+        return self._eUB
+
+    def _get_scattering_units(
+        self,
+        beam,
+        detector,
+        rigid_body_motion,
+        min_bragg_angle,
+        max_bragg_angle,
+        verbose,
+        number_of_processes,
+        proximity,
+        BB_intersection,
+        max_memory,
+        worker_pool,
+        omega_range=None,
+        element_indices=None,
+    ):
+        """Set up the diffracting planes and compute all scattering units of a motion, see :func:`diffract`.
+
+        If element_indices is given, only the scattering units of these elements are computed.
+
+        Returns:
+            (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable`) the scattering units ordered by element.
+
+        """
+        if worker_pool is not None:
+            number_of_processes = worker_pool.number_of_processes
+
+        if verbose and number_of_processes != 1:
+            raise NotImplemented(
+                "Verbose mode is not implemented for multiprocesses computations"
+            )
+
+        min_bragg_angle, max_bragg_angle = self._get_bragg_angle_bounds(
+            detector, beam, min_bragg_angle, max_bragg_angle
+        )
+
+        for phase in self.phases:
+            with utils._verbose_manager(verbose):
+                phase.setup_diffracting_planes(
+                    beam.wavelength, min_bragg_angle, max_bragg_angle
+                )
+
+        context = {
+            "beam": beam,
+            "detector": detector,
+            "rigid_body_motion": rigid_body_motion,
+            "phases": self.phases,
+            "verbose": verbose,
+            "proximity": proximity,
+            "BB_intersection": BB_intersection,
+            "max_memory": (
+                None if max_memory is None else max_memory / number_of_processes
+            ),
+            "omega_range": omega_range,
+        }
+
+        if element_indices is None:
+            element_indices = np.arange(self.mesh_lab.number_of_elements)
+        if proximity:
+            # Elements far from the beam are culled through a spatial index over the sample frame bounding spheres
+            # before the finer, per element, proximity check of _diffract.
+            candidates = self._get_beam_candidates(beam, rigid_body_motion, omega_range)
+            element_indices = element_indices[candidates[element_indices]]
+
+        if number_of_processes == 1 or len(element_indices) == 0:
+            all_scattering_units = _diffract(
+                {
+                    "espherecentroids": self.mesh_lab.espherecentroids[element_indices],
+                    "eradius": self.mesh_lab.eradius[element_indices],
+                    "eUB": self._get_eUB()[element_indices],
+                    "element_phase_map": self.element_phase_map[element_indices],
+                    "element_grain_map": self.element_grain_map[element_indices],
+                    "element_index": element_indices,
+                    "ecoord": self.mesh_lab.coord[self.mesh_lab.enod[element_indices]],
+                    "evolumes": np.abs(self.mesh_lab.evolumes[element_indices]),
+                    **context,
+                }
+            )
+
+        else:
+            # Only the detector geometry is needed by the workers, not previously collected frames.
+            context["detector"] = detector._get_geometry()
+            costs = _estimate_element_costs(
+                beam,
+                rigid_body_motion,
+                self.mesh_lab.espherecentroids[element_indices],
+                self.mesh_lab.eradius[element_indices],
+                proximity,
+                BB_intersection,
+                times=(0.0, 0.5, 1.0) if omega_range is None else np.linspace(*omega_range, 9),
+            )
+            tasks = [
+                element_indices[task]
+                for task in _get_balanced_tasks(costs, _TASKS_PER_PROCESS * number_of_processes)
+            ]
+            if worker_pool is None:
+                with parallel.WorkerPool(number_of_processes) as worker_pool:
+                    scattering_units = self._diffract_in_pool(worker_pool, tasks, context)
+            else:
+                scattering_units = self._diffract_in_pool(worker_pool, tasks, context)
+            # Kept with the polycrystal, as a pool started for this call is closed by now.
+            self.busy_times = dict(worker_pool.busy_times)
+            for table in scattering_units:
+                table.phases = self.phases
+            all_scattering_units = ScatteringUnitTable.concatenate(scattering_units)
+            all_scattering_units = all_scattering_units.take(
+                np.argsort(all_scattering_units.element_index, kind="stable")
+            )
+
+        return all_scattering_units
+
+    def _get_beam_candidates(self, beam, rigid_body_motion, omega_range=None):
+        """Mask elements with bounding spheres that come close to the beam during a motion, or a rotation scan.
+
+        The query runs against a spatial index of the sample frame mesh, which is built once and survives
+        transformations of the polycrystal, see :meth:`xrd_simulator.beam.Beam._get_candidate_elements`.
+
+        Returns:
+            (:obj:`numpy array`) boolean mask, True for elements which may intersect the beam, ``shape=(N,)``.
+
+        """
+        if omega_range is None:
+            sample_times = beam._get_proximity_sample_times(self.mesh_sample.eradius, rigid_body_motion)
+        else:
+            number_of_sampling_points = int(np.degrees(omega_range[1] - omega_range[0])) + 2
+            sample_times = np.linspace(omega_range[0], omega_range[1], number_of_sampling_points)
+        return beam._get_candidate_elements(
+            self.mesh_sample._get_sphere_tree(),
+            rigid_body_motion,
+            sample_times,
+            self.mesh_lab.rotation,
+            self.mesh_lab.translation,
+        )
+
+    def _diffract_in_pool(self, worker_pool, tasks, context):
+        """Diffract tasks of elements in a pool of worker processes with the sample arrays resident in shared memory."""
+        worker_pool._set_sample(
+            self, self._version, self._get_element_arrays, self._revision, self._get_element_updates
+        )
+        return worker_pool._map(_diffract_elements, tasks, context)
+
+    def _get_element_arrays(self):
+        """Per element (and mesh node) arrays needed for diffraction computations, keyed by name."""
+        return {
+            "espherecentroids": self.mesh_lab.espherecentroids,
+            "eradius": self.mesh_lab.eradius,
+            "eUB": self._get_eUB(),
+            "element_phase_map": self.element_phase_map,
+            "element_grain_map": self.element_grain_map,
+            "coord": self.mesh_lab.coord,
+            "enod": self.mesh_lab.enod,
+            "evolumes": np.abs(self.mesh_lab.evolumes),
+        }
+
+    def _get_element_updates(self, revision):
+        """Rows of the arrays of :func:`_get_element_arrays` changed by :func:`update_elements` since a revision."""
+        element_indices = np.unique(
+            np.concatenate([indices for updated, indices in self._element_updates if updated > revision])
+        )
+        return element_indices, {
+            "eUB": self._get_eUB()[element_indices],
+            "element_grain_map": self.element_grain_map[element_indices],
+        }
+
     def _get_bragg_angle_bounds(self, detector, beam, min_bragg_angle, max_bragg_angle):
         """Compute a maximum Bragg angle cut of based on the beam sample interection region centroid and detector corners.
 
-        If the beam graces or misses the sample, the sample centroid is used.
+        If the beam graces or misses the sample, the sample centroid is used. The angle is kept until the sample is
+        transformed or another beam or detector geometry is used, such that it is not recomputed from all mesh nodes
+        when only a subset of the elements has been updated.
         """
         if max_bragg_angle is None:
-            mesh_nodes_contained_by_beam = self.mesh_lab.coord[
-                beam.contains(self.mesh_lab.coord.T), :
-            ]
-            if mesh_nodes_contained_by_beam.shape[0] != 0:
-                source_point = np.mean(mesh_nodes_contained_by_beam, axis=0)
+            key = (
+                self._version,
+                np.array(beam.vertices),
+                np.array(beam.wave_vector),
+                np.array(detector.det_corner_0),
+                np.array(detector.det_corner_1),
+                np.array(detector.det_corner_2),
+            )
+            if self._max_bragg_angle_cache is not None and all(
+                np.array_equal(cached, value) for cached, value in zip(self._max_bragg_angle_cache[0], key)
+            ):
+                max_bragg_angle = self._max_bragg_angle_cache[1]
             else:
-                source_point = self.mesh_lab.centroid
-            max_bragg_angle = detector.get_wrapping_cone(beam.wave_vector, source_point)
+                mesh_nodes_contained_by_beam = self.mesh_lab.coord[
+                    beam.contains(self.mesh_lab.coord.T), :
+                ]
+                if mesh_nodes_contained_by_beam.shape[0] != 0:
+                    source_point = np.mean(mesh_nodes_contained_by_beam, axis=0)
+                else:
+                    source_point = self.mesh_lab.centroid
+                max_bragg_angle = detector.get_wrapping_cone(beam.wave_vector, source_point)
+                self._max_bragg_angle_cache = (key, max_bragg_angle)
         assert (
             min_bragg_angle >= 0
         ), "min_bragg_angle must be greater or equal than zero"
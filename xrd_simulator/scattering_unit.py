@@ -3,9 +3,16 @@ For advanced users it can be usefull to interact with the scattering units, this
 :class:`xrd_simulator.detector.Detector` which will hold all the scatterign units created during diffraction
 from the polycrystal.
 
+Diffraction from a :class:`xrd_simulator.polycrystal.Polycrystal` produces a
+:class:`xrd_simulator.scattering_unit.ScatteringUnitTable` per detector frame. The table stores all scattering
+units column wise in flat arrays and hands out :class:`xrd_simulator.scattering_unit.ScatteringUnit` objects as
+lazy per-row views for convenience.
+
 """
 
 import numpy as np
+from scipy.spatial import ConvexHull
+from xrd_simulator import utils
 
 
 class ScatteringUnit(object):
@@ -24,6 +31,13 @@ class ScatteringUnit(object):
             motion the scattering occured.
         phase (:obj:`xrd_simulator.phase.Phase`): The phase of the scattering unit.
         hkl_indx (:obj:`int`): Index of Miller index in the `phase.miller_indices` list.
+        element_index (:obj:`int`): Index of mesh tetrahedral element refering to a `xrd_simulator.polycrystal.Polycrystal`
+            object from which the scattering unit originated.
+        zd, yd (:obj:`float`): Detector intersection coordinates of the scattered ray. Defaults to None.
+        vertices (:obj:`numpy array`): Vertices of the scattering region ``shape=(N,3)``. If ``convex_hull`` is None
+            the convex hull is built lazily from these vertices on first access. Defaults to None.
+        volume (:obj:`float`): Volume of the scattering region. Defaults to None in which case the volume is
+            taken from the convex hull.
 
     Attributes:
         convex_hull (:obj:`scipy.spatial.ConvexHull`): Object describing the convex hull of the scattering unit.
@@ -54,8 +68,12 @@ class ScatteringUnit(object):
         element_index,
         zd=None,
         yd=None,
+        vertices=None,
+        volume=None,
     ):
-        self.convex_hull = convex_hull
+        self._convex_hull = convex_hull
+        self._vertices = vertices
+        self._volume = volume
         self.scattered_wave_vector = scattered_wave_vector
         self.incident_wave_vector = incident_wave_vector
         self.wavelength = wavelength
@@ -68,6 +86,26 @@ class ScatteringUnit(object):
         self.yd = yd
         self.element_index = element_index
 
+    def __setstate__(self, state):
+        # Scattering units pickled before the convex hull was built lazily store it as a plain attribute.
+        if "convex_hull" in state:
+            state["_convex_hull"] = state.pop("convex_hull")
+        state.setdefault("_vertices", None)
+        state.setdefault("_volume", None)
+        self.__dict__.update(state)
+
+    @property
+    def convex_hull(self):
+        """convex_hull (:obj:`scipy.spatial.ConvexHull`): Convex hull of the scattering region, built on first access
+        if the scattering unit was instantiated from vertices only."""
+        if self._convex_hull is None:
+            self._convex_hull = ConvexHull(self._vertices)
+        return self._convex_hull
+
+    @convex_hull.setter
+    def convex_hull(self, convex_hull):
+        self._convex_hull = convex_hull
+
     @property
     def hkl(self):
         """hkl (:obj:`numpy array`): Miller indices [h,k,l] ``shape=(3,)``."""
@@ -92,35 +130,423 @@ class ScatteringUnit(object):
     @property
     def lorentz_factor(self):
         """Compute the Lorentz intensity factor for a scattering_unit."""
-        k = self.incident_wave_vector
-        kp = self.scattered_wave_vector
-        theta = np.arccos(k.dot(kp) / (np.linalg.norm(k) ** 2)) / 2.0
-        korthogonal = kp - (k * kp.dot(k) / (np.linalg.norm(k) ** 2))
-        eta = np.arccos(
-            self.rotation_axis.dot(korthogonal) / np.linalg.norm(korthogonal)
-        )
-        tol = 0.5
-        if (
-            np.abs(np.degrees(eta)) < tol
-            or np.abs(np.degrees(eta)) > 180 - tol
-            or np.degrees(theta) < tol
-        ):
+        lorentz_factor = _get_lorentz_factors(
+            self.incident_wave_vector,
+            np.reshape(self.scattered_wave_vector, (1, 3)),
+            self.rotation_axis,
+        )[0]
+        if np.isinf(lorentz_factor):
             return np.inf
-        else:
-            return 1.0 / (np.sin(2 * theta) * np.abs(np.sin(eta)))
+        return lorentz_factor
 
     @property
     def polarization_factor(self):
         """Compute the Polarization intensity factor for a scattering_unit."""
-        khatp = self.scattered_wave_vector / np.linalg.norm(self.scattered_wave_vector)
-        return 1 - np.dot(self.incident_polarization_vector, khatp) ** 2
+        return _get_polarization_factors(
+            self.incident_polarization_vector, np.reshape(self.scattered_wave_vector, (1, 3))
+        )[0]
 
     @property
     def centroid(self):
         """centroid (:obj:`numpy array`): centroid of the scattering region. ``shape=(3,)``"""
+        if self._convex_hull is None:
+            return np.mean(self._vertices, axis=0)
         return np.mean(self.convex_hull.points[self.convex_hull.vertices], axis=0)
 
     @property
     def volume(self):
         """volume (:obj:`float`): volume of the scattering region volume"""
+        if self._volume is not None:
+            return self._volume
         return self.convex_hull.volume
+
+
+class ScatteringUnitTable(object):
+    """Columnar (struct-of-arrays) collection of scattering units sharing a common beam and rigid body motion.
+
+    The table is what :func:`xrd_simulator.polycrystal.Polycrystal.diffract` stores in each
+    :obj:`xrd_simulator.detector.Detector.frames` entry. Each row describes one scattering unit. The vertices
+    of all scattering regions are stored in a single flat buffer such that the vertices of row ``i`` are
+    ``vertices[vertex_offsets[i]:vertex_offsets[i + 1]]``. Indexing the table with an integer, or iterating
+    over it, gives :class:`xrd_simulator.scattering_unit.ScatteringUnit` views of the rows, the convex hulls
+    of which are only computed if accessed.
+
+    Args:
+        element_index (:obj:`numpy array`): Index of the mesh element each scattering unit originated from ``shape=(n,)``.
+        phase_index (:obj:`numpy array`): Index into ``phases`` of each scattering unit ``shape=(n,)``.
+        hkl_index (:obj:`numpy array`): Index into ``phases[phase_index[i]].miller_indices`` ``shape=(n,)``.
+        time (:obj:`numpy array`): Parametric time in range [0,1] at which each scattering occured ``shape=(n,)``.
+        scattered_wave_vector (:obj:`numpy array`): Scattered wavevectors ``shape=(n,3)``.
+        zd, yd (:obj:`numpy array`): Detector intersection coordinates of the scattered rays ``shape=(n,)``.
+        volume (:obj:`numpy array`): Volume of the scattering regions ``shape=(n,)``.
+        vertices (:obj:`numpy array`): Flat buffer holding the vertices of all scattering regions ``shape=(m,3)``.
+        vertex_offsets (:obj:`numpy array`): Offsets into ``vertices`` of each scattering region ``shape=(n+1,)``.
+        incident_wave_vector (:obj:`numpy array`): Incident wavevector ```shape=(3,)```
+        wavelength (:obj:`float`):  Wavelength of xrays in units of angstrom.
+        incident_polarization_vector (:obj:`numpy array`): Unit vector of linear polarization ```shape=(3,)```
+        rotation_axis (:obj:`numpy array`): Sample motion rotation axis ```shape=(3,)```
+        phases (:obj:`list` of :obj:`xrd_simulator.phase.Phase`): Phases refered to by ``phase_index``.
+
+    Attributes:
+        element_index, phase_index, hkl_index, time, scattered_wave_vector, zd, yd, volume, vertices,
+            vertex_offsets (:obj:`numpy array`): Per scattering unit columns as described above.
+        incident_wave_vector, wavelength, incident_polarization_vector, rotation_axis, phases: Quantities
+            shared by all scattering units of the table as described above.
+        lorentz_factor, polarization_factor, real_structure_factor, imaginary_structure_factor (:obj:`numpy array`):
+            Per scattering unit intensity factors ``shape=(n,)``, computed on first access and then kept with the table.
+            They are recomputed after the quantities they depend on are assigned, or the structure factors of the
+            phases are set up anew, but not after in place modifications of these arrays.
+
+    """
+
+    _columns = (
+        "element_index",
+        "phase_index",
+        "hkl_index",
+        "time",
+        "scattered_wave_vector",
+        "zd",
+        "yd",
+        "volume",
+    )
+
+    # Quantities the intensity factors are computed from, see __setattr__().
+    _intensity_factor_inputs = (
+        "phase_index",
+        "hkl_index",
+        "scattered_wave_vector",
+        "incident_wave_vector",
+        "incident_polarization_vector",
+        "rotation_axis",
+        "phases",
+    )
+
+    def __init__(
+        self,
+        element_index,
+        phase_index,
+        hkl_index,
+        time,
+        scattered_wave_vector,
+        zd,
+        yd,
+        volume,
+        vertices,
+        vertex_offsets,
+        incident_wave_vector,
+        wavelength,
+        incident_polarization_vector,
+        rotation_axis,
+        phases,
+    ):
+        self.element_index = np.asarray(element_index, dtype=np.int64)
+        self.phase_index = np.asarray(phase_index, dtype=np.int64)
+        self.hkl_index = np.asarray(hkl_index, dtype=np.int64)
+        self.time = utils._as_precision(time)
+        self.scattered_wave_vector = utils._as_precision(scattered_wave_vector).reshape(-1, 3)
+        self.zd = utils._as_precision(zd)
+        self.yd = utils._as_precision(yd)
+        self.volume = utils._as_precision(volume)
+        self.vertices = utils._as_precision(vertices).reshape(-1, 3)
+        self.vertex_offsets = np.asarray(vertex_offsets, dtype=np.int64)
+        self.incident_wave_vector = incident_wave_vector
+        self.wavelength = wavelength
+        self.incident_polarization_vector = incident_polarization_vector
+        self.rotation_axis = rotation_axis
+        self.phases = phases
+        self._intensity_factors = {}
+
+    def __setattr__(self, name, value):
+        # Intensity factors computed from the previous value of an assigned quantity are discarded.
+        if name in self._intensity_factor_inputs:
+            self.__dict__["_intensity_factors"] = {}
+        object.__setattr__(self, name, value)
+
+    @property
+    def lorentz_factor(self):
+        """lorentz_factor (:obj:`numpy array`): Lorentz intensity factors ``shape=(n,)``."""
+        return self._get_cached(
+            "lorentz_factor",
+            lambda: _get_lorentz_factors(
+                self.incident_wave_vector, self.scattered_wave_vector, self.rotation_axis
+            ),
+        )
+
+    @property
+    def polarization_factor(self):
+        """polarization_factor (:obj:`numpy array`): Polarization intensity factors ``shape=(n,)``."""
+        return self._get_cached(
+            "polarization_factor",
+            lambda: _get_polarization_factors(
+                self.incident_polarization_vector, self.scattered_wave_vector
+            ),
+        )
+
+    @property
+    def real_structure_factor(self):
+        """real_structure_factor (:obj:`numpy array`): Real part of the unit cell structure factors ``shape=(n,)``,
+        nan for phases without structure factors."""
+        return self._get_structure_factors()[:, 0]
+
+    @property
+    def imaginary_structure_factor(self):
+        """imaginary_structure_factor (:obj:`numpy array`): Imaginary part of the unit cell structure factors
+        ``shape=(n,)``, nan for phases without structure factors."""
+        return self._get_structure_factors()[:, 1]
+
+    def _get_structure_factors(self):
+        """Real and imaginary structure factors of all scattering units ``shape=(n,2)``, gathered phase by phase."""
+
+        def gather():
+            structure_factors = np.full((len(self), 2), np.nan)
+            for i, phase in enumerate(self.phases):
+                if phase.structure_factors is not None:
+                    rows = self.phase_index == i
+                    structure_factors[rows] = phase.structure_factors[self.hkl_index[rows]]
+            return structure_factors
+
+        # The structure factors of a phase are replaced when its diffracting planes are set up anew.
+        return self._get_cached(
+            "structure_factors", gather, tuple(phase.structure_factors for phase in self.phases)
+        )
+
+    def _get_cached(self, name, compute, dependencies=()):
+        """Per scattering unit quantity kept with the table, computed by compute() on first access and recomputed if
+        any of the dependencies is no longer the same object."""
+        if getattr(self, "_intensity_factors", None) is None:
+            self._intensity_factors = {}
+        cached_dependencies, _ = self._intensity_factors.get(name, (None, None))
+        if cached_dependencies is None or len(cached_dependencies) != len(dependencies) or any(
+            cached is not dependency for cached, dependency in zip(cached_dependencies, dependencies)
+        ):
+            self._intensity_factors[name] = (dependencies, compute())
+        return self._intensity_factors[name][1]
+
+    @classmethod
+    def empty(
+        cls,
+        incident_wave_vector,
+        wavelength,
+        incident_polarization_vector,
+        rotation_axis,
+        phases,
+    ):
+        """Create a table holding no scattering units.
+
+        Args:
+            incident_wave_vector, wavelength, incident_polarization_vector, rotation_axis, phases: Quantities
+                shared by all scattering units of the table, see :class:`ScatteringUnitTable`.
+
+        Returns:
+            (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable`) with zero rows.
+
+        """
+        return cls(
+            np.zeros((0,)),
+            np.zeros((0,)),
+            np.zeros((0,)),
+            np.zeros((0,)),
+            np.zeros((0, 3)),
+            np.zeros((0,)),
+            np.zeros((0,)),
+            np.zeros((0,)),
+            np.zeros((0, 3)),
+            np.zeros((1,)),
+            incident_wave_vector,
+            wavelength,
+            incident_polarization_vector,
+            rotation_axis,
+            phases,
+        )
+
+    @classmethod
+    def from_scattering_units(cls, scattering_units):
+        """Collect a list of :class:`xrd_simulator.scattering_unit.ScatteringUnit` into a table.
+
+        All scattering units are assumed to share the same incident wavevector, wavelength, polarization
+        and rotation axis.
+
+        Args:
+            scattering_units (:obj:`list` of :obj:`xrd_simulator.scattering_unit.ScatteringUnit`): Scattering
+                units to collect, must be non-empty.
+
+        Returns:
+            (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable`)
+
+        """
+        first = scattering_units[0]
+        phases, phase_index, vertices = [], [], []
+        for scattering_unit in scattering_units:
+            for i, phase in enumerate(phases):
+                if phase is scattering_unit.phase:
+                    phase_index.append(i)
+                    break
+            else:
+                phase_index.append(len(phases))
+                phases.append(scattering_unit.phase)
+            if scattering_unit._convex_hull is None:
+                vertices.append(scattering_unit._vertices)
+            else:
+                hull = scattering_unit.convex_hull
+                vertices.append(hull.points[hull.vertices])
+        vertex_offsets = np.concatenate(([0], np.cumsum([len(v) for v in vertices])))
+        nan = np.nan
+        return cls(
+            [su.element_index for su in scattering_units],
+            phase_index,
+            [su.hkl_indx for su in scattering_units],
+            [su.time for su in scattering_units],
+            [su.scattered_wave_vector for su in scattering_units],
+            [nan if su.zd is None else su.zd for su in scattering_units],
+            [nan if su.yd is None else su.yd for su in scattering_units],
+            [su.volume for su in scattering_units],
+            np.concatenate(vertices, axis=0),
+            vertex_offsets,
+            first.incident_wave_vector,
+            first.wavelength,
+            first.incident_polarization_vector,
+            first.rotation_axis,
+            phases,
+        )
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Concatenate a sequence of tables row wise.
+
+        The shared quantities (wavevector, polarization, etc.) are taken from the first table.
+
+        Args:
+            tables (:obj:`list` of :obj:`xrd_simulator.scattering_unit.ScatteringUnitTable`): Tables to join,
+                must be non-empty.
+
+        Returns:
+            (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable`)
+
+        """
+        first = tables[0]
+        if len(tables) == 1:
+            return first
+        columns = {
+            name: np.concatenate([getattr(t, name) for t in tables], axis=0)
+            for name in cls._columns
+        }
+        vertex_counts = np.concatenate([np.diff(t.vertex_offsets) for t in tables])
+        return cls(
+            vertices=np.concatenate([t.vertices for t in tables], axis=0),
+            vertex_offsets=np.concatenate(([0], np.cumsum(vertex_counts))),
+            incident_wave_vector=first.incident_wave_vector,
+            wavelength=first.wavelength,
+            incident_polarization_vector=first.incident_polarization_vector,
+            rotation_axis=first.rotation_axis,
+            phases=first.phases,
+            **columns,
+        )
+
+    def take(self, indices):
+        """Select a subset of rows.
+
+        Args:
+            indices (:obj:`numpy array`): Integer row indices or a boolean row mask.
+
+        Returns:
+            (:obj:`xrd_simulator.scattering_unit.ScatteringUnitTable`) holding the selected rows in the given order.
+
+        """
+        indices = np.arange(len(self))[indices]
+        columns = {name: getattr(self, name)[indices] for name in self._columns}
+        vertex_counts = np.diff(self.vertex_offsets)[indices]
+        vertex_offsets = np.concatenate(([0], np.cumsum(vertex_counts)))
+        vertex_index = np.repeat(
+            self.vertex_offsets[indices] - vertex_offsets[:-1], vertex_counts
+        ) + np.arange(vertex_offsets[-1])
+        return ScatteringUnitTable(
+            vertices=self.vertices[vertex_index],
+            vertex_offsets=vertex_offsets,
+            incident_wave_vector=self.incident_wave_vector,
+            wavelength=self.wavelength,
+            incident_polarization_vector=self.incident_polarization_vector,
+            rotation_axis=self.rotation_axis,
+            phases=self.phases,
+            **columns,
+        )
+
+    @property
+    def centroid(self):
+        """centroid (:obj:`numpy array`): Centroids of the scattering regions. ``shape=(n,3)``"""
+        vertex_counts = np.diff(self.vertex_offsets)
+        if len(self) == 0:
+            return np.zeros((0, 3))
+        sums = np.add.reduceat(self.vertices, self.vertex_offsets[:-1], axis=0)
+        return sums / vertex_counts[:, np.newaxis]
+
+    def __len__(self):
+        return self.element_index.shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if not np.isscalar(index):
+            return self.take(index)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("ScatteringUnitTable index out of range")
+        return ScatteringUnit(
+            None,
+            self.scattered_wave_vector[index],
+            self.incident_wave_vector,
+            self.wavelength,
+            self.incident_polarization_vector,
+            self.rotation_axis,
+            self.time[index],
+            self.phases[self.phase_index[index]],
+            self.hkl_index[index],
+            self.element_index[index],
+            zd=self.zd[index],
+            yd=self.yd[index],
+            vertices=self.vertices[
+                self.vertex_offsets[index] : self.vertex_offsets[index + 1]
+            ],
+            volume=self.volume[index],
+        )
+
+
+def _get_lorentz_factors(incident_wave_vector, scattered_wave_vectors, rotation_axis):
+    """Lorentz intensity factors of a set of scattered wavevectors.
+
+    The factors are infinite for scattering close to (within half a degree of) the incident beam or the rotation
+    axis, where the approximate Lorentz factor diverges.
+
+    Args:
+        incident_wave_vector (:obj:`numpy array`): Incident wavevector ``shape=(3,)``.
+        scattered_wave_vectors (:obj:`numpy array`): Scattered wavevectors ``shape=(n,3)``.
+        rotation_axis (:obj:`numpy array`): Sample motion rotation axis ``shape=(3,)``.
+
+    Returns:
+        (:obj:`numpy array`) Lorentz factors ``shape=(n,)``.
+
+    """
+    k = np.asarray(incident_wave_vector, dtype=np.float64)
+    kp = np.asarray(scattered_wave_vectors, dtype=np.float64)
+    k_squared = k.dot(k)
+    kp_dot_k = kp.dot(k)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        theta = np.arccos(kp_dot_k / k_squared) / 2.0
+        korthogonal = kp - np.outer(kp_dot_k / k_squared, k)
+        eta = np.arccos(korthogonal.dot(rotation_axis) / np.linalg.norm(korthogonal, axis=1))
+        tol = 0.5
+        diverges = (
+            (np.abs(np.degrees(eta)) < tol)
+            | (np.abs(np.degrees(eta)) > 180 - tol)
+            | (np.degrees(theta) < tol)
+        )
+        return np.where(diverges, np.inf, 1.0 / (np.sin(2 * theta) * np.abs(np.sin(eta))))
+
+
+def _get_polarization_factors(incident_polarization_vector, scattered_wave_vectors):
+    """Polarization intensity factors of a set of scattered wavevectors ``shape=(n,3)``, returns ``shape=(n,)``."""
+    kp = np.asarray(scattered_wave_vectors, dtype=np.float64)
+    khatp = kp / np.linalg.norm(kp, axis=1, keepdims=True)
+    return 1 - khatp.dot(incident_polarization_vector) ** 2
@@ -11,12 +11,19 @@ Functions:
     _cif_open: Open a CIF file using the ReadCif function from the CifFile module.
     _print_progress: Print a progress bar in the executing shell terminal.
     _clip_line_with_convex_polyhedron: Compute lengths of parallel lines clipped by a convex polyhedron.
+    _clip_tetrahedra: Clip a batch of tetrahedra with a convex polyhedron defined by halfspaces.
+    _project_convex_polyhedra: Project a batch of convex polyhedra onto the pixels of a detector.
+    _get_convex_polyhedra_planes: Compute the face planes of a batch of convex polyhedra given by their vertices.
     alpha_to_quarternion: Generate a unit quaternion from spherical angle coordinates on the S3 ball.
     lab_strain_to_B_matrix: Convert strain tensors in lab coordinates to lattice matrices (B matrices).
     _get_circumscribed_sphere_centroid: Compute the centroid of a circumscribed sphere for a given set of points.
     _get_bounding_ball: Compute a minimal bounding ball for a set of Euclidean points.
     _set_xfab_logging: Enable or disable logging for the xfab module.
     _verbose_manager: Manage global verbose options for logging within with statements.
+    set_precision: Set the floating point precision of the large per element and per reflection arrays.
+    get_precision: Get the floating point precision of the large per element and per reflection arrays.
+    _as_precision: Convert an array to the floating point precision, without copying if already converted.
+    _load_hdf5_array: Memory map a HDF5 dataset such that it is read from disc only as it is accessed.
     _strain_as_tensor: Convert a strain vector to a strain tensor.
     _strain_as_vector: Convert a strain tensor to a strain vector.
     _b_to_epsilon: Compute strain tensor from B matrix for large deformations.
@@ -33,7 +40,10 @@ from itertools import combinations
 from CifFile import ReadCif
 from scipy.spatial.transform import Rotation
 import numpy as np
-from numba import njit
+from numba import njit, prange
+
+# Floating point precision of the large per element and per reflection arrays, see set_precision().
+_PRECISION = np.dtype(np.float64)
 
 
 def _diffractogram(diffraction_pattern, det_centre_z, det_centre_y, binsize=1.0):
@@ -160,6 +170,364 @@ def _clip_line_with_convex_polyhedron(
     return clip_lengths
 
 
+@njit(parallel=True, cache=True)
+def _project_convex_polyhedra(
+    pixel_coordinates, boxes, ray_directions, planes, plane_offsets, weights, number_of_threads, frame
+):
+    """Project a batch of convex polyhedra onto the pixels of a detector.
+
+    Rays are traced from the pixel centroids within the bounding box of each polyhedron and clipped by the polyhedron
+    as in :func:`_clip_line_with_convex_polyhedron`. The face planes of all polyhedra are stored in a single flat
+    buffer such that the planes of polyhedron ``i`` are ``planes[plane_offsets[i]:plane_offsets[i + 1]]``. The
+    polyhedra are traced in parallel, each into a tile the size of its bounding box, and the tiles are then deposited
+    onto the frame in bands of rows such that the threads write to disjoint parts of the frame. The polyhedra are
+    handled in chunks whose tiles hold at most as many pixels as the frame, unless a single tile is larger.
+
+    Args:
+        pixel_coordinates (:obj:`numpy array`): Base points of the rays ``shape=(m,n,3)``.
+        boxes (:obj:`numpy array`): Pixel index bounding boxes of the polyhedra, as (row_min, row_max, col_min, col_max)
+            with exclusive upper bounds ``shape=(N,4)``.
+        ray_directions (:obj:`numpy array`): Normalized ray direction of each polyhedron ``shape=(N,3)``.
+        planes (:obj:`numpy array`): Face plane equation coefficients with unit outwards normals ``shape=(M,4)``.
+            A point x is on the interior of the plane if: planes[i,:-1].dot(x) +  planes[i,-1] <= 0.
+        plane_offsets (:obj:`numpy array`): Offsets into ``planes`` of each polyhedron ``shape=(N+1,)``.
+        weights (:obj:`numpy array`): Factor by which to scale the clip lengths of each polyhedron before they are
+            deposited. Polyhedra with infinite weight are not deposited ``shape=(N,)``.
+        number_of_threads (:obj:`int`): Number of bands of rows, usually numba.get_num_threads().
+        frame (:obj:`numpy array`): Frame onto which the weighted clip lengths are deposited ``shape=(m,n)``.
+
+    Returns:
+        projected_lengths (:obj:`numpy array`) the sum of the clip lengths of each polyhedron ``shape=(N,)``.
+
+    """
+    number_of_polyhedra = boxes.shape[0]
+    rows, cols = frame.shape[0], frame.shape[1]
+    tile_offsets = np.zeros((number_of_polyhedra + 1,), dtype=np.int64)
+    for i in range(number_of_polyhedra):
+        tile_offsets[i + 1] = tile_offsets[i] + (boxes[i, 1] - boxes[i, 0]) * (boxes[i, 3] - boxes[i, 2])
+    chunk_starts = [0]
+    for i in range(1, number_of_polyhedra):
+        if tile_offsets[i + 1] - tile_offsets[chunk_starts[-1]] > rows * cols:
+            chunk_starts.append(i)
+    chunk_starts.append(number_of_polyhedra)
+
+    number_of_bands = max(1, min(number_of_threads, rows))
+    band_size = (rows + number_of_bands - 1) // number_of_bands
+    projected_lengths = np.zeros((number_of_polyhedra,))
+    for chunk in range(len(chunk_starts) - 1):
+        first, last = chunk_starts[chunk], chunk_starts[chunk + 1]
+        tiles = np.zeros((tile_offsets[last] - tile_offsets[first],))
+        for i in prange(first, last):
+            dx, dy, dz = ray_directions[i, 0], ray_directions[i, 1], ray_directions[i, 2]
+            tile_cols = boxes[i, 3] - boxes[i, 2]
+            for row in range(boxes[i, 0], boxes[i, 1]):
+                for col in range(boxes[i, 2], boxes[i, 3]):
+                    x, y, z = pixel_coordinates[row, col, 0], pixel_coordinates[row, col, 1], pixel_coordinates[row, col, 2]
+                    t_e, t_l = -np.inf, np.inf
+                    for k in range(plane_offsets[i], plane_offsets[i + 1]):
+                        # Parametric line-plane intersection, rays parallel to a plane are not clipped by it.
+                        t_2 = planes[k, 0] * dx + planes[k, 1] * dy + planes[k, 2] * dz
+                        t_1 = -planes[k, 3] - (planes[k, 0] * x + planes[k, 1] * y + planes[k, 2] * z)
+                        if t_2 < 0:
+                            t_e = max(t_e, t_1 / t_2)
+                        elif t_2 > 0:
+                            t_l = min(t_l, t_1 / t_2)
+                    if t_l > t_e:
+                        projected_lengths[i] += t_l - t_e
+                        tile_index = tile_offsets[i] - tile_offsets[first]
+                        tiles[tile_index + (row - boxes[i, 0]) * tile_cols + col - boxes[i, 2]] = t_l - t_e
+
+        for band in prange(number_of_bands):
+            band_start, band_end = band * band_size, min((band + 1) * band_size, rows)
+            for i in range(first, last):
+                if not np.isfinite(weights[i]):
+                    continue
+                tile_cols = boxes[i, 3] - boxes[i, 2]
+                tile_index = tile_offsets[i] - tile_offsets[first]
+                for row in range(max(boxes[i, 0], band_start), min(boxes[i, 1], band_end)):
+                    for col in range(boxes[i, 2], boxes[i, 3]):
+                        frame[row, col] += weights[i] * tiles[
+                            tile_index + (row - boxes[i, 0]) * tile_cols + col - boxes[i, 2]
+                        ]
+    return projected_lengths
+
+
+@njit(parallel=True, cache=True)
+def _get_convex_polyhedra_planes(vertices, vertex_offsets, tolerance):
+    """Compute the face planes of a batch of convex polyhedra given by their vertices.
+
+    The plane through each triplet of vertices of a polyhedron is a face plane of its convex hull if all the vertices
+    lie on its interior. Faces with more than three vertices are kept once. The cost grows as the fourth power of the
+    number of vertices, which suits the few vertices of the polyhedra of :func:`_clip_tetrahedra`. The planes of
+    polyhedron ``i`` are stored in ``planes[plane_offsets[i]:plane_offsets[i] + plane_counts[i]]``, where
+    ``plane_offsets`` reserve the at most 2n - 4 faces of a convex polyhedron with n vertices.
+
+    Args:
+        vertices (:obj:`numpy array`): Flat buffer of the vertices of the polyhedra ``shape=(N,3)``.
+        vertex_offsets (:obj:`numpy array`): Offsets into ``vertices`` of each polyhedron ``shape=(n+1,)``.
+        tolerance (:obj:`float`): Distance below which a vertex is considered to lie in a plane.
+
+    Returns:
+        planes (:obj:`numpy array`) face plane equation coefficients with unit outwards normals ``shape=(M,4)``,
+        plane_offsets (:obj:`numpy array`) offsets into ``planes`` of each polyhedron ``shape=(n+1,)`` and
+        plane_counts (:obj:`numpy array`) number of face planes of each polyhedron, -1 if the polyhedron is flat or
+        the computation failed, ``shape=(n,)``.
+
+    """
+    number_of_polyhedra = vertex_offsets.shape[0] - 1
+    plane_offsets = np.zeros((number_of_polyhedra + 1,), dtype=np.int64)
+    for i in range(number_of_polyhedra):
+        number_of_vertices = vertex_offsets[i + 1] - vertex_offsets[i]
+        plane_offsets[i + 1] = plane_offsets[i] + max(2 * number_of_vertices - 4, 0)
+    planes = np.zeros((plane_offsets[-1], 4))
+    plane_counts = np.zeros((number_of_polyhedra,), dtype=np.int64)
+
+    for i in prange(number_of_polyhedra):
+        first, last = vertex_offsets[i], vertex_offsets[i + 1]
+        start, capacity = plane_offsets[i], plane_offsets[i + 1] - plane_offsets[i]
+        count = 0
+        failed = False
+        for p in range(first, last):
+            for q in range(p + 1, last):
+                for r in range(q + 1, last):
+                    if failed:
+                        break
+                    u = vertices[q] - vertices[p]
+                    v = vertices[r] - vertices[p]
+                    normal = np.array(
+                        [u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0]]
+                    )
+                    norm = np.sqrt(np.sum(normal * normal))
+                    if norm == 0:
+                        continue
+                    normal = normal / norm
+                    offset = -np.sum(normal * vertices[p])
+
+                    # Faces already found contain all vertices of the triplet.
+                    duplicate = False
+                    for j in range(start, start + count):
+                        if (
+                            abs(np.sum(planes[j, 0:3] * vertices[p]) + planes[j, 3]) <= tolerance
+                            and abs(np.sum(planes[j, 0:3] * vertices[q]) + planes[j, 3]) <= tolerance
+                            and abs(np.sum(planes[j, 0:3] * vertices[r]) + planes[j, 3]) <= tolerance
+                        ):
+                            duplicate = True
+                            break
+                    if duplicate:
+                        continue
+
+                    above, below = False, False
+                    for k in range(first, last):
+                        distance = np.sum(normal * vertices[k]) + offset
+                        if distance > tolerance:
+                            above = True
+                        elif distance < -tolerance:
+                            below = True
+                    if above and below:
+                        continue
+                    if (not above and not below) or count == capacity:
+                        failed = True
+                        continue
+                    sign = -1.0 if above else 1.0
+                    planes[start + count, 0:3] = sign * normal
+                    planes[start + count, 3] = sign * offset
+                    count += 1
+        plane_counts[i] = -1 if failed or count < 4 else count
+    return planes, plane_offsets, plane_counts
+
+
+@njit(cache=True)
+def _clip_tetrahedra(tetrahedra, halfspaces, tolerance):
+    """Clip a batch of tetrahedra with a convex polyhedron defined by halfspaces.
+
+    Each tetrahedron is represented by its polygonal faces which are clipped plane by plane (Sutherland-Hodgman
+    style), the cut faces are closed by a cap polygon in the clipping plane. The vertices of the clipped polyhedra
+    are returned in a single flat buffer such that the vertices of polyhedron ``i`` are
+    ``vertices[vertex_offsets[i]:vertex_offsets[i + 1]]``.
+
+    Args:
+        tetrahedra (:obj:`numpy array`): Vertices of the tetrahedra ``shape=(n,4,3)``.
+        halfspaces (:obj:`numpy array`): Halfspace equation coefficients with unit normals ``shape=(m,4)``.
+            A point x is on the interior of the halfspace if: halfspaces[i,:-1].dot(x) +  halfspaces[i,-1] <= 0.
+        tolerance (:obj:`float`): Distance below which a vertex is considered to lie in a clipping plane.
+
+    Returns:
+        volumes (:obj:`numpy array`) volumes of the clipped polyhedra, zero if a tetrahedron does not intersect
+        the halfspaces and -1 if the clipping failed, ``shape=(n,)``, centroids (:obj:`numpy array`) the mean of
+        the vertices of the clipped polyhedra ``shape=(n,3)``, vertices (:obj:`numpy array`) flat buffer of the
+        vertices of the clipped polyhedra ``shape=(N,3)`` and vertex_offsets (:obj:`numpy array`) offsets into
+        ``vertices`` of each clipped polyhedron ``shape=(n+1,)``.
+
+    """
+    number_of_planes = halfspaces.shape[0]
+    # Bounds given by the Euler characteristic of a convex polyhedron with at most 4 + m faces.
+    max_faces = 4 + number_of_planes
+    max_output_vertices = 2 * max_faces - 4
+    max_vertices = 2 * max_output_vertices + 3 * max_faces
+    max_face_vertices = max_faces
+
+    volumes = np.zeros((tetrahedra.shape[0],))
+    centroids = np.zeros((tetrahedra.shape[0], 3))
+    vertex_offsets = np.zeros((tetrahedra.shape[0] + 1,), dtype=np.int64)
+    vertices = np.zeros((tetrahedra.shape[0] * max_output_vertices, 3))
+
+    points = np.zeros((max_vertices, 3))
+    kept_points = np.zeros((max_vertices, 3))
+    distances = np.zeros((max_vertices,))
+    sides = np.zeros((max_vertices,), dtype=np.int64)
+    vertex_map = np.zeros((max_vertices,), dtype=np.int64)
+    faces = np.zeros((max_faces, max_face_vertices), dtype=np.int64)
+    face_sizes = np.zeros((max_faces,), dtype=np.int64)
+    clipped_faces = np.zeros((max_faces, max_face_vertices), dtype=np.int64)
+    clipped_face_sizes = np.zeros((max_faces,), dtype=np.int64)
+    edges = np.zeros((max_vertices, 3), dtype=np.int64)
+    cap = np.zeros((max_vertices,), dtype=np.int64)
+    angles = np.zeros((max_vertices,))
+    tetrahedron_faces = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
+
+    for i in range(tetrahedra.shape[0]):
+        points[0:4] = tetrahedra[i]
+        number_of_points = 4
+        number_of_faces = 4
+        faces[0:4, 0:3] = tetrahedron_faces
+        face_sizes[0:4] = 3
+        failed = False
+
+        for j in range(number_of_planes):
+            normal = halfspaces[j, 0:3]
+            number_inside, number_outside = 0, 0
+            for k in range(number_of_points):
+                distances[k] = np.dot(normal, points[k]) + halfspaces[j, 3]
+                if distances[k] > tolerance:
+                    sides[k] = 1
+                    number_outside += 1
+                elif distances[k] < -tolerance:
+                    sides[k] = -1
+                    number_inside += 1
+                else:
+                    sides[k] = 0
+            if number_outside == 0:
+                continue
+            if number_inside == 0:
+                number_of_points = 0
+                break
+
+            # Vertices in the clipping plane belong to the cap, as do all new vertices on cut edges.
+            cap_size = 0
+            for k in range(number_of_points):
+                if sides[k] == 0:
+                    cap[cap_size] = k
+                    cap_size += 1
+            number_of_edges = 0
+            number_of_clipped_faces = 0
+            for f in range(number_of_faces):
+                size = 0
+                for k in range(face_sizes[f]):
+                    a = faces[f, k]
+                    b = faces[f, (k + 1) % face_sizes[f]]
+                    if sides[a] <= 0:
+                        clipped_faces[number_of_clipped_faces, size] = a
+                        size += 1
+                    if sides[a] * sides[b] == -1:
+                        # The edge is cut, the new vertex is shared by the two faces of the edge.
+                        for e in range(number_of_edges):
+                            if edges[e, 0] == min(a, b) and edges[e, 1] == max(a, b):
+                                c = edges[e, 2]
+                                break
+                        else:
+                            if number_of_points >= max_vertices:
+                                failed = True
+                                break
+                            c = number_of_points
+                            t = distances[a] / (distances[a] - distances[b])
+                            points[c] = points[a] + t * (points[b] - points[a])
+                            number_of_points += 1
+                            edges[number_of_edges, 0] = min(a, b)
+                            edges[number_of_edges, 1] = max(a, b)
+                            edges[number_of_edges, 2] = c
+                            number_of_edges += 1
+                            cap[cap_size] = c
+                            cap_size += 1
+                        clipped_faces[number_of_clipped_faces, size] = c
+                        size += 1
+                    if size >= max_face_vertices:
+                        failed = True
+                        break
+                if failed:
+                    break
+                if size >= 3:
+                    clipped_face_sizes[number_of_clipped_faces] = size
+                    number_of_clipped_faces += 1
+            if failed:
+                break
+
+            if cap_size >= 3:
+                if number_of_clipped_faces >= max_faces or cap_size > max_face_vertices:
+                    failed = True
+                    break
+                # The cap is a convex polygon, its vertices are ordered by angle around their mean.
+                centre = np.zeros((3,))
+                for k in range(cap_size):
+                    centre += points[cap[k]]
+                centre /= cap_size
+                axis = np.zeros((3,))
+                axis[np.argmin(np.abs(normal))] = 1.0
+                u = np.cross(normal, axis)
+                u /= np.linalg.norm(u)
+                v = np.cross(normal, u)
+                for k in range(cap_size):
+                    angles[k] = np.arctan2(
+                        np.dot(points[cap[k]] - centre, v),
+                        np.dot(points[cap[k]] - centre, u),
+                    )
+                order = np.argsort(angles[0:cap_size])
+                for k in range(cap_size):
+                    clipped_faces[number_of_clipped_faces, k] = cap[order[k]]
+                clipped_face_sizes[number_of_clipped_faces] = cap_size
+                number_of_clipped_faces += 1
+
+            # Drop the vertices that are no longer referenced by any face.
+            vertex_map[0:number_of_points] = -1
+            number_of_kept_points = 0
+            for f in range(number_of_clipped_faces):
+                for k in range(clipped_face_sizes[f]):
+                    a = clipped_faces[f, k]
+                    if vertex_map[a] == -1:
+                        vertex_map[a] = number_of_kept_points
+                        kept_points[number_of_kept_points] = points[a]
+                        number_of_kept_points += 1
+                    faces[f, k] = vertex_map[a]
+                face_sizes[f] = clipped_face_sizes[f]
+            points[0:number_of_kept_points] = kept_points[0:number_of_kept_points]
+            number_of_points = number_of_kept_points
+            number_of_faces = number_of_clipped_faces
+
+        offset = vertex_offsets[i]
+        if failed or number_of_points > max_output_vertices:
+            volumes[i] = -1
+        elif number_of_points >= 4:
+            centroid = np.zeros((3,))
+            for k in range(number_of_points):
+                centroid += points[k]
+            centroid /= number_of_points
+            # The centroid is interior to the convex polyhedron, which is decomposed into tetrahedra from it.
+            volume = 0.0
+            for f in range(number_of_faces):
+                p0 = points[faces[f, 0]] - centroid
+                for k in range(1, face_sizes[f] - 1):
+                    p1 = points[faces[f, k]] - centroid
+                    p2 = points[faces[f, k + 1]] - centroid
+                    volume += np.abs(np.dot(p0, np.cross(p1, p2))) / 6.0
+            if volume > 0:
+                volumes[i] = volume
+                centroids[i] = centroid
+                vertices[offset : offset + number_of_points] = points[0:number_of_points]
+                offset += number_of_points
+        vertex_offsets[i + 1] = offset
+
+    return volumes, centroids, vertices[0 : vertex_offsets[-1]].copy(), vertex_offsets
+
+
 def alpha_to_quarternion(alpha_1, alpha_2, alpha_3):
     """Generate a unit quarternion by providing spherical angle coordinates on the S3 ball.
 
@@ -293,6 +661,60 @@ class _verbose_manager(object):
             _set_xfab_logging(disabled=True)
 
 
+def set_precision(precision):
+    """Set the floating point precision of the large per element and per reflection arrays.
+
+    The precision applies to meshes, polycrystals and scattering units created after the call as well as to the
+    rendered detector frames. Single precision halves the memory and bandwidth of large samples, while quantities
+    that are small or sensitive to round off, such as rigid body motions, the per grain Laue equations and the
+    tetrahedron clipping, are still computed in double precision.
+
+    Args:
+        precision (:obj:`str` or :obj:`numpy.dtype`): One of ``float32`` or ``float64`` (the default).
+
+    """
+    global _PRECISION
+    precision = np.dtype(precision)
+    if precision not in (np.float32, np.float64):
+        raise ValueError("precision must be one of float32 or float64, got " + str(precision))
+    _PRECISION = precision
+
+
+def get_precision():
+    """Get the floating point precision of the large per element and per reflection arrays.
+
+    Returns:
+        (:obj:`numpy.dtype`) float32 or float64, see :func:`set_precision`.
+
+    """
+    return _PRECISION
+
+
+def _as_precision(array):
+    """Convert an array to the current floating point precision, the array is returned as is if already converted."""
+    return np.asarray(array, dtype=_PRECISION)
+
+
+def _load_hdf5_array(path, dataset):
+    """Memory map a HDF5 dataset such that it is read from disc only as it is accessed.
+
+    The map is copy on write, modifications of the array are kept in memory and never written to the file. Datasets
+    that cannot be mapped, i.e chunked (compressed) or empty datasets, are read into memory.
+
+    Args:
+        path (:obj:`str`): Path to the HDF5 file holding the dataset.
+        dataset (:obj:`h5py.Dataset`): The dataset, of the open file at path.
+
+    Returns:
+        (:obj:`numpy array`) the dataset as a :obj:`numpy.memmap` if possible.
+
+    """
+    offset = dataset.id.get_offset()
+    if dataset.chunks is not None or offset is None:
+        return dataset[()]
+    return np.memmap(path, mode="c", dtype=dataset.dtype, shape=dataset.shape, offset=offset)
+
+
 def _strain_as_tensor(strain_vector):
     e11, e12, e13, e22, e23, e33 = strain_vector
     return np.asarray([[e11, e12, e13], [e12, e22, e23], [e13, e23, e33]], np.float64)
@@ -314,7 +736,7 @@ def _b_to_epsilon(B_matrix, B0):
 
 def _epsilon_to_b(crystal_strain, B0):
     """Handle large deformations as opposed to current xfab.tools.epsilon_to_b"""
-    C = 2 * crystal_strain + np.eye(3, dtype=np.float32)
+    C = 2 * crystal_strain + np.eye(3)
     eigen_vals = np.linalg.eigvalsh(C)
     if np.any(np.array(eigen_vals) < 0):
         raise ValueError(